@@ -0,0 +1,287 @@
+"""
+Approximate nearest neighbour search (IVF) for the NumpyVectorStore, in pure NumPy.
+
+The inverted file index clusters the normalized vectors with spherical k-means into nlist lists. A query
+only scores the vectors of the nprobe lists whose centroids are closest to it, instead of the whole
+matrix. nprobe is the recall/latency knob: more lists means better recall and slower queries.
+
+Run this module to get a recall@k and latency report of the IVF index against exact search:
+
+    python ann_index.py --vectors 200000 --dim 256 --nprobe 8
+    python ann_index.py --store .rag_cache/vectorstore
+"""
+
+import argparse
+import json
+import math
+import os
+import time
+
+from pathlib import Path
+
+import numpy as np
+
+from numpy_vectorstore import top_k_indices
+
+INDEX_FILE = "ivf_index.npz"
+
+
+class IVFIndex:
+    """
+    Inverted file index over the rows of a normalized float32 matrix.
+
+    The index doesn't own the vectors, it only stores the centroids and the list assignment of every row.
+    The owning store reports changed rows with update() and the new row count with resize(). Below
+    min_train_size rows the index is not trained and search() returns None, so the caller uses exact search.
+    """
+
+    def __init__(self, nlist: int | None = None, nprobe: int = 8, iterations: int = 10,
+                 max_train_size: int = 100_000, min_train_size: int = 1_000, retrain_factor: float = 4.0,
+                 seed: int = 0):
+        """
+        Args:
+            nlist: Number of lists (clusters), defaults to 4 * sqrt(rows) at training time.
+            nprobe: Number of lists scanned per query, higher means better recall and slower queries.
+            iterations: k-means iterations during training.
+            max_train_size: Max number of (sampled) rows used for training.
+            min_train_size: The index is only trained once the store has at least this many rows.
+            retrain_factor: Retrain automatically when the store grew by this factor since the last training.
+            seed: Seed for sampling and the initial centroids.
+        """
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.max_train_size = max_train_size
+        self.min_train_size = min_train_size
+        self.retrain_factor = retrain_factor
+        self.seed = seed
+
+        self.centroids: np.ndarray | None = None
+        self.trained_size = 0
+        # List of every row, the array grows in steps so only the first _size entries are valid
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._size = 0
+        # CSR layout of the lists, rebuilt lazily after changes
+        self._list_rows: np.ndarray | None = None
+        self._list_offsets: np.ndarray | None = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def _assign(self, vectors: np.ndarray, batch_size: int = 65536) -> np.ndarray:
+        assignments = np.empty(vectors.shape[0], dtype=np.int32)
+        for start in range(0, vectors.shape[0], batch_size):
+            batch = np.asarray(vectors[start:start + batch_size], dtype=np.float32)
+            assignments[start:start + batch_size] = np.argmax(batch @ self.centroids.T, axis=1)
+        return assignments
+
+    def train(self, vectors: np.ndarray) -> None:
+        """Cluster (a sample of) the vectors with spherical k-means and assign all rows to their lists."""
+        rows = vectors.shape[0]
+        if rows == 0:
+            raise ValueError("Can't train an index without vectors")
+        rng = np.random.default_rng(self.seed)
+        nlist = min(self.nlist or max(1, int(4 * math.sqrt(rows))), rows)
+
+        sample_rows = rng.choice(rows, size=min(rows, self.max_train_size), replace=False)
+        sample = np.asarray(vectors[np.sort(sample_rows)], dtype=np.float32)
+        centroids = sample[rng.choice(sample.shape[0], size=nlist, replace=False)].copy()
+
+        for _ in range(self.iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=nlist)
+            # Empty clusters keep their old centroid
+            filled = counts > 0
+            norms = np.linalg.norm(sums[filled], axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids[filled] = sums[filled] / norms
+
+        self.centroids = centroids
+        self.trained_size = rows
+        self._assignments = self._assign(vectors)
+        self._size = rows
+        self._list_rows = None
+
+    def update(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        """Assign the given (new or changed) rows to their lists."""
+        if not self.is_trained or len(rows) == 0:
+            return
+        rows = np.asarray(rows, dtype=np.int64)
+        needed = int(rows.max()) + 1
+        if needed > self._assignments.size:
+            grown = np.empty(max(needed, self._assignments.size * 2), dtype=np.int32)
+            grown[:self._assignments.size] = self._assignments
+            self._assignments = grown
+        self._assignments[rows] = self._assign(vectors)
+        self._size = max(self._size, needed)
+        self._list_rows = None
+
+    def resize(self, size: int) -> None:
+        """Forget all rows >= size (after the store deleted entries)."""
+        if self.is_trained and size != self._size:
+            self._size = min(size, self._size)
+            self._list_rows = None
+
+    def sync(self, vectors: np.ndarray) -> bool:
+        """Train once there are enough rows, and retrain when the store grew by retrain_factor.
+
+        Returns True if the index was (re)trained, it should be saved then.
+        """
+        rows = vectors.shape[0]
+        if rows < self.min_train_size:
+            return False
+        if not self.is_trained or rows > self.trained_size * self.retrain_factor:
+            self.train(vectors)
+            return True
+        self.resize(rows)
+        return False
+
+    def _build_lists(self) -> None:
+        assignments = self._assignments[:self._size]
+        self._list_rows = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=self.centroids.shape[0])
+        self._list_offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def search(self, vectors: np.ndarray, query: np.ndarray, k: int,
+               nprobe: int | None = None) -> tuple[np.ndarray, np.ndarray] | None:
+        """
+        Return (rows, scores) of the approximately k best rows for a normalized query, best first.
+
+        Args:
+            vectors: The normalized matrix the index was built for.
+            query: Normalized query vector.
+            k: Number of results.
+            nprobe: Overrides the nprobe of the index for this query.
+        Returns:
+            The rows and scores, or None if the index is not trained (use exact search then).
+        """
+        if not self.is_trained:
+            return None
+        if vectors.shape[0] != self._size:
+            raise ValueError(f"The index knows {self._size} rows, but got {vectors.shape[0]} vectors")
+        if self._list_rows is None:
+            self._build_lists()
+
+        nprobe = min(nprobe or self.nprobe, self.centroids.shape[0])
+        probes = top_k_indices(self.centroids @ query, nprobe)
+        candidates = np.concatenate([self._list_rows[self._list_offsets[p]:self._list_offsets[p + 1]]
+                                     for p in probes])
+        if candidates.size == 0:
+            return candidates, np.empty(0, dtype=np.float32)
+        scores = vectors[candidates] @ query
+        best = top_k_indices(scores, k)
+        return candidates[best], scores[best]
+
+    def save(self, directory: str | Path) -> None:
+        """Save centroids and assignments as ivf_index.npz into directory."""
+        if not self.is_trained:
+            return
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = directory / f"{INDEX_FILE}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, centroids=self.centroids, assignments=self._assignments[:self._size],
+                     trained_size=np.int64(self.trained_size))
+        os.replace(tmp_path, directory / INDEX_FILE)
+
+    def load(self, directory: str | Path, size: int) -> bool:
+        """
+        Load a saved index for a store with size rows.
+
+        Returns:
+            False if there is no saved index or it doesn't fit the store (it will be retrained then).
+        """
+        path = Path(directory) / INDEX_FILE
+        if not path.is_file():
+            return False
+        with np.load(path) as data:
+            if data["assignments"].size != size:
+                return False
+            self.centroids = data["centroids"]
+            self._assignments = data["assignments"][:size].copy()
+            self.trained_size = int(data["trained_size"])
+        self._size = size
+        self._list_rows = None
+        return True
+
+
+def recall_at_k(vectors: np.ndarray, index: IVFIndex, queries: np.ndarray, k: int = 10,
+                nprobe: int | None = None) -> dict:
+    """
+    Compare the IVF index against exact search.
+
+    Args:
+        vectors: Normalized matrix the index was built for.
+        index: A trained IVFIndex.
+        queries: Normalized query vectors, one per row.
+        k: Number of results per query.
+        nprobe: Lists to scan, defaults to the nprobe of the index.
+    Returns:
+        A dict with recall@k and the mean latency in milliseconds of both searches.
+    """
+    if not index.is_trained:
+        raise ValueError("The index must be trained")
+    hits, exact_seconds, ann_seconds = 0, 0.0, 0.0
+    for query in queries:
+        start = time.perf_counter()
+        exact = set(top_k_indices(vectors @ query, k).tolist())
+        exact_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        rows, _ = index.search(vectors, query, k, nprobe=nprobe)
+        ann_seconds += time.perf_counter() - start
+        hits += len(exact.intersection(rows.tolist()))
+
+    return {
+        "k": k,
+        "nlist": int(index.centroids.shape[0]),
+        "nprobe": min(nprobe or index.nprobe, index.centroids.shape[0]),
+        "rows": int(vectors.shape[0]),
+        "queries": int(queries.shape[0]),
+        f"recall@{k}": hits / (k * queries.shape[0]),
+        "exact_ms": 1000 * exact_seconds / queries.shape[0],
+        "ann_ms": 1000 * ann_seconds / queries.shape[0],
+    }
+
+
+def _synthetic_vectors(rows: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(clusters, size=rows)] + 0.5 * rng.standard_normal((rows, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="recall@k and latency of the IVF index against exact search")
+    parser.add_argument("--store", help="directory of a saved NumpyVectorStore, else synthetic vectors are used")
+    parser.add_argument("--vectors", type=int, default=100_000, help="number of synthetic vectors")
+    parser.add_argument("--dim", type=int, default=256, help="dimension of the synthetic vectors")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.store:
+        vectors = np.load(Path(args.store) / "vectors.npy", mmap_mode="r")
+    else:
+        vectors = _synthetic_vectors(args.vectors, args.dim, clusters=max(1, args.vectors // 500), rng=rng)
+
+    # Queries are perturbed copies of stored vectors
+    queries = np.asarray(vectors[rng.choice(vectors.shape[0], size=args.queries)], dtype=np.float32)
+    queries += 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    index = IVFIndex(nlist=args.nlist, min_train_size=0)
+    start = time.perf_counter()
+    index.train(vectors)
+    print(json.dumps({"build_seconds": time.perf_counter() - start}))
+    for nprobe in args.nprobe:
+        print(json.dumps(recall_at_k(vectors, index, queries, k=args.k, nprobe=nprobe)))
+
+
+if __name__ == "__main__":
+    main()
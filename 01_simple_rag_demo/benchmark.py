@@ -0,0 +1,252 @@
+"""
+Retrieval quality and latency benchmark for get_rag.
+
+    python benchmark.py                                          # stub embeddings, no LLM, JSON to stdout
+    python benchmark.py --embeddings ollama --llm ollama --output results/$(git rev-parse --short HEAD).json
+    python benchmark.py --k 6 --retrieval-mode dense --reranker none --mmr-lambda none
+
+The labelled questions (benchmark_questions.json: question, expected filenames, optional chat history)
+are run against a fresh index of the documents/ corpus with the settings of rag.py, any of them can be
+overridden on the command line. Reported are recall@k and MRR of the expected filenames and the
+p50/p95/p99 latency of the stages enrich, embed, search, select (fusion, rerank, MMR, packing), render and
+llm (the answer, only with --llm). The JSON contains the git commit, so results of different commits can
+be compared.
+
+The stub embeddings hash the words of a text into a vector, no server is needed and the results are
+deterministic, but only relative changes are meaningful, real embeddings find far more than shared words.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+from pathlib import Path
+
+import numpy as np
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+
+from bm25 import BM25Index, tokenize
+from chunker import MarkdownChunker
+from document_index import DocumentIndexer
+from enrichment import EmbeddingQueryExpander
+from numpy_vectorstore import NumpyVectorStore
+from reranker import CrossEncoderReranker, LexicalReranker, RerankStage
+from rag import (DOCUMENTS_DIR, RAG_CHUNK_MAX_TOKENS, RAG_CHUNK_OVERLAP_TOKENS, RAG_TOP_K, RAG_RETRIEVAL_MODE,
+                 RAG_HYBRID_FETCH_K, RAG_RERANKER, RAG_RERANK_FETCH_K, RAG_RERANK_BUDGET_MS, RAG_MMR_LAMBDA,
+                 RAG_DUPLICATE_THRESHOLD, SYSTEM_PROMPT, TOKEN_COUNTER,
+                 create_embeddings, create_llm, create_context_packer, get_rag)
+
+QUESTIONS_FILE = Path(__file__).parent / "benchmark_questions.json"
+
+STAGES = ["enrich", "embed", "search", "select", "render", "llm"]
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic stub embeddings, the words of a text are hashed into a normalized vector."""
+
+    def __init__(self, size: int = 512):
+        self.size = size
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for term in tokenize(text):
+            digest = zlib.crc32(term.encode("utf-8"))
+            vector[digest % self.size] += 1.0 if digest & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+def load_questions(path: str | Path) -> list[dict]:
+    """Load the labelled questions, every entry needs "question" and "expected" (filenames)."""
+    questions = json.loads(Path(path).read_text(encoding="utf-8"))
+    for entry in questions:
+        if not entry.get("question") or not entry.get("expected"):
+            raise ValueError(f"question and expected are required: {entry}")
+    return questions
+
+
+def recall_at_k(retrieved: list[str], expected: list[str], k: int) -> float:
+    """Share of the expected filenames found in the first k retrieved filenames."""
+    return len(set(retrieved[:k]) & set(expected)) / len(expected)
+
+
+def reciprocal_rank(retrieved: list[str], expected: list[str]) -> float:
+    """1 / rank of the first expected filename, 0 if none was retrieved."""
+    for rank, filename in enumerate(retrieved, start=1):
+        if filename in expected:
+            return 1.0 / rank
+    return 0.0
+
+
+def latency_summary(seconds: list[float]) -> dict:
+    """p50/p95/p99/mean in milliseconds."""
+    values = np.array(seconds) * 1000
+    return {"p50": float(np.percentile(values, 50)), "p95": float(np.percentile(values, 95)),
+            "p99": float(np.percentile(values, 99)), "mean": float(values.mean()), "count": len(values)}
+
+
+def build_index(embeddings: Embeddings, documents_dir: str | Path = DOCUMENTS_DIR,
+                chunk_max_tokens: int = RAG_CHUNK_MAX_TOKENS,
+                chunk_overlap_tokens: int = RAG_CHUNK_OVERLAP_TOKENS) -> tuple[NumpyVectorStore, BM25Index]:
+    """Index documents_dir into a new in-memory vector store and BM25 index."""
+    vectorstore = NumpyVectorStore(embedding=embeddings)
+    lexical_index = BM25Index()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        indexer = DocumentIndexer(vectorstore, manifest_path=Path(tmp_dir) / "manifest.json",
+                                  chunker=MarkdownChunker(max_tokens=chunk_max_tokens, token_counter=TOKEN_COUNTER,
+                                                          overlap_tokens=chunk_overlap_tokens),
+                                  lexical_index=lexical_index)
+        indexer.sync(documents_dir)
+    return vectorstore, lexical_index
+
+
+def _unique_filenames(results: list[dict]) -> list[str]:
+    return list(dict.fromkeys(result["metadata"]["filename"] for result in results))
+
+
+def run_benchmark(questions: list[dict], vectorstore: NumpyVectorStore, lexical_index: BM25Index | None = None,
+                  llm: BaseChatModel | None = None, enrich_mode: str | None = None, repeat: int = 1,
+                  k: int = RAG_TOP_K, **rag_kwargs) -> dict:
+    """
+    Run every question repeat times through get_rag and collect quality metrics and stage latencies.
+
+    Args:
+        questions: Labelled questions, see load_questions.
+        vectorstore: Index of the corpus.
+        lexical_index: BM25 index for the hybrid retrieval.
+        llm: If given, the answer is generated and timed as stage "llm" (also needed by enrich_mode "summary").
+        enrich_mode: None, "summary" or "embedding", the history of a question is used for the enrichment.
+        repeat: Runs per question, the quality is measured on the first run.
+        k: Number of chunks get_rag selects.
+        rag_kwargs: Further get_rag arguments, e.g. threshold, retrieval_mode, reranker or mmr_lambda.
+    Returns:
+        The report with "metrics", "latency_ms" per stage and "questions" (per question details).
+    """
+    packer = create_context_packer()
+    timings: dict[str, list[float]] = {stage: [] for stage in STAGES}
+    totals = []
+    details = []
+    for entry in questions:
+        history = [tuple(message) for message in entry.get("history", [])]
+        for run in range(repeat):
+            query_expander = None
+            if enrich_mode == "embedding":
+                query_expander = EmbeddingQueryExpander()
+                for role, content in history:
+                    if role == "human":
+                        query_expander.remember(vectorstore.embeddings.embed_query(content))
+
+            trace = {}
+            context_budget = packer.split(SYSTEM_PROMPT, entry["question"])
+            ragdata = get_rag(entry["question"], vectorstore=vectorstore, llm=llm, chat_history=history,
+                              enrich_with_context=enrich_mode is not None, enrich_mode=enrich_mode,
+                              query_expander=query_expander, print_question=False, k=k,
+                              lexical_index=lexical_index, packer=packer, context_budget=context_budget.chunks,
+                              trace=trace, **rag_kwargs)
+            if llm is not None:
+                start = time.perf_counter()
+                llm.invoke([("system", SYSTEM_PROMPT)] + history + [("assistant", ragdata),
+                                                                     ("human", entry["question"])])
+                trace["timings"]["llm"] = time.perf_counter() - start
+            for stage, seconds in trace["timings"].items():
+                timings[stage].append(seconds)
+            totals.append(sum(trace["timings"].values()))
+
+            if run == 0:
+                retrieved = _unique_filenames(trace["results"])
+                details.append({"question": entry["question"], "expected": entry["expected"],
+                                "retrieved": retrieved, "recall": recall_at_k(retrieved, entry["expected"], k),
+                                "reciprocal_rank": reciprocal_rank(retrieved, entry["expected"]),
+                                "timings_ms": {stage: 1000 * seconds for stage, seconds in trace["timings"].items()}})
+
+    latency = {stage: latency_summary(values) for stage, values in timings.items() if values}
+    latency["total"] = latency_summary(totals)
+    return {"metrics": {f"recall@{k}": float(np.mean([detail["recall"] for detail in details])),
+                        "mrr": float(np.mean([detail["reciprocal_rank"] for detail in details])),
+                        "questions": len(details)},
+            "latency_ms": latency,
+            "questions": details}
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _optional_float(value: str) -> float | None:
+    return None if value.lower() == "none" else float(value)
+
+
+def main(argv: list[str] | None = None) -> dict:
+    parser = argparse.ArgumentParser(description="Retrieval quality and latency benchmark for get_rag")
+    parser.add_argument("--questions", default=QUESTIONS_FILE, help="labelled questions (JSON)")
+    parser.add_argument("--documents", default=DOCUMENTS_DIR, help="corpus directory")
+    parser.add_argument("--embeddings", choices=["stub", "ollama"], default="stub")
+    parser.add_argument("--llm", choices=["none", "ollama"], default="none", help="time the answer generation")
+    parser.add_argument("--enrich-mode", choices=["none", "summary", "embedding"], default="none")
+    parser.add_argument("--k", type=int, default=RAG_TOP_K)
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--retrieval-mode", choices=["dense", "hybrid"], default=RAG_RETRIEVAL_MODE)
+    parser.add_argument("--fetch-k", type=int, default=RAG_HYBRID_FETCH_K)
+    parser.add_argument("--reranker", choices=["none", "lexical", "cross-encoder"], default=str(RAG_RERANKER).lower())
+    parser.add_argument("--mmr-lambda", type=_optional_float, default=RAG_MMR_LAMBDA, help="a float or none")
+    parser.add_argument("--chunk-max-tokens", type=int, default=RAG_CHUNK_MAX_TOKENS)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per question for the latencies")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    enrich_mode = None if args.enrich_mode == "none" else args.enrich_mode
+    llm = create_llm() if args.llm == "ollama" else None
+    if enrich_mode == "summary" and llm is None:
+        parser.error("--enrich-mode summary needs --llm ollama")
+
+    embeddings = create_embeddings() if args.embeddings == "ollama" else HashingEmbeddings()
+    start = time.perf_counter()
+    vectorstore, lexical_index = build_index(embeddings, args.documents, chunk_max_tokens=args.chunk_max_tokens)
+    index_seconds = time.perf_counter() - start
+
+    reranker = None
+    if args.reranker != "none":
+        reranker = RerankStage(CrossEncoderReranker() if args.reranker == "cross-encoder" else LexicalReranker(),
+                               fetch_k=RAG_RERANK_FETCH_K, budget_seconds=RAG_RERANK_BUDGET_MS / 1000)
+    try:
+        report = run_benchmark(load_questions(args.questions), vectorstore, lexical_index, llm=llm,
+                               enrich_mode=enrich_mode, repeat=args.repeat, k=args.k, threshold=args.threshold,
+                               retrieval_mode=args.retrieval_mode, fetch_k=args.fetch_k, reranker=reranker,
+                               mmr_lambda=args.mmr_lambda, duplicate_threshold=RAG_DUPLICATE_THRESHOLD)
+    finally:
+        if reranker is not None:
+            reranker.close()
+
+    config = {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()
+              if key != "output"}
+    report = {"commit": _git_commit(), "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "config": config,
+              "index": {"chunks": len(vectorstore), "seconds": index_seconds}, **report}
+    text = json.dumps(report, indent=2, default=str)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+        print(f"recall@{args.k} {report['metrics'][f'recall@{args.k}']:.3f}, mrr {report['metrics']['mrr']:.3f}, "
+              f"total p50 {report['latency_ms']['total']['p50']:.1f} ms -> {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Throughput of single query embeddings vs. the EmbeddingDispatcher under concurrent load.
+
+    pip install pytest-benchmark
+    python -m pytest benchmarks/test_embedding_batching.py -m benchmark --benchmark-only
+
+The fake model costs a fixed latency per request plus a little per text, like a small embedding model on
+a GPU, and serves max_in_flight requests at a time. Set OLLAMA_SERVER_URL to run against a real server
+instead (bge-m3 must be pulled).
+"""
+
+import asyncio
+import os
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+# Not part of the default test run (see pytest.ini), select them with -m benchmark
+pytestmark = pytest.mark.benchmark
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from embedding_dispatcher import EmbeddingDispatcher
+
+CONCURRENT_QUERIES = 64
+MAX_IN_FLIGHT = 4
+
+
+class LatencyEmbedding(DeterministicFakeEmbedding):
+    request_seconds: float = 0.01
+    text_seconds: float = 0.0005
+
+    async def aembed_query(self, text):
+        await asyncio.sleep(self.request_seconds + self.text_seconds)
+        return self.embed_query(text)
+
+    async def aembed_documents(self, texts):
+        await asyncio.sleep(self.request_seconds + self.text_seconds * len(texts))
+        return self.embed_documents(texts)
+
+
+def _model():
+    if os.getenv("OLLAMA_SERVER_URL"):
+        from langchain_ollama import OllamaEmbeddings
+        return OllamaEmbeddings(model="bge-m3", base_url=os.environ["OLLAMA_SERVER_URL"])
+    return LatencyEmbedding(size=1024)
+
+
+def _questions(run: int) -> list[str]:
+    return [f"Question {run}-{i} about the history of Ambria?" for i in range(CONCURRENT_QUERIES)]
+
+
+@pytest.mark.parametrize("batched", [False, True], ids=["single", "batched"])
+def test_concurrent_query_throughput(benchmark, batched):
+    model = _model()
+    runs = iter(range(1_000_000))
+
+    async def embed_all():
+        questions = _questions(next(runs))
+        if batched:
+            dispatcher = EmbeddingDispatcher(model, max_batch_size=32, max_wait_ms=5, max_in_flight=MAX_IN_FLIGHT)
+            return await asyncio.gather(*[dispatcher.aembed_query(question) for question in questions])
+        limit = asyncio.Semaphore(MAX_IN_FLIGHT)
+
+        async def embed(question):
+            async with limit:
+                return await model.aembed_query(question)
+        return await asyncio.gather(*[embed(question) for question in questions])
+
+    vectors = benchmark.pedantic(lambda: asyncio.run(embed_all()), rounds=5, iterations=1)
+    assert len(vectors) == CONCURRENT_QUERIES
+    benchmark.extra_info["queries_per_second"] = CONCURRENT_QUERIES / benchmark.stats.stats.mean
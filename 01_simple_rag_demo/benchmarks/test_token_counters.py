@@ -0,0 +1,67 @@
+"""
+Accuracy and throughput of the token counters on the documents/ corpus.
+
+    pip install pytest-benchmark tokenizers
+    TOKENIZER_FILE=path/to/tokenizer.json python -m pytest benchmarks -m benchmark --benchmark-only
+
+Accuracy is the relative error of the total count against the BPE tokenizer of TOKENIZER_FILE (the
+reference), it is reported in the extra info of each benchmark together with the tokens per second.
+"""
+
+import os
+
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+# Not part of the default test run (see pytest.ini), select them with -m benchmark
+pytestmark = pytest.mark.benchmark
+
+from token_counter import BPETokenCounter, CachedTokenCounter, RegexTokenCounter, load_token_counter
+
+DOCUMENTS_DIR = Path(__file__).parent.parent / "documents"
+TOKENIZER_FILE = os.getenv("TOKENIZER_FILE")
+
+
+@pytest.fixture(scope="module")
+def corpus() -> list[str]:
+    return [path.read_text(encoding="utf-8") for path in sorted(DOCUMENTS_DIR.glob("*.md"))]
+
+
+@pytest.fixture(scope="module")
+def reference_tokens(corpus) -> int | None:
+    """Total BPE token count of the corpus, None if there is no tokenizer to compare with."""
+    reference = load_token_counter(TOKENIZER_FILE)
+    if reference.name == "regex":
+        return None
+    return sum(reference(text) for text in corpus)
+
+
+def _counters():
+    yield "regex", RegexTokenCounter
+    yield "regex-cached", lambda: CachedTokenCounter(RegexTokenCounter())
+    if TOKENIZER_FILE:
+        yield "bpe", lambda: BPETokenCounter(TOKENIZER_FILE)
+        yield "bpe-cached", lambda: CachedTokenCounter(BPETokenCounter(TOKENIZER_FILE))
+
+
+@pytest.mark.parametrize("name,factory", list(_counters()), ids=[name for name, _ in _counters()])
+def test_token_counter(benchmark, corpus, reference_tokens, name, factory):
+    try:
+        counter = factory()
+    except ImportError as e:
+        pytest.skip(str(e))
+
+    def count_corpus():
+        return sum(counter(text) for text in corpus)
+
+    tokens = benchmark(count_corpus)
+    assert tokens > 0
+
+    benchmark.extra_info["tokens"] = tokens
+    benchmark.extra_info["tokens_per_second"] = tokens / benchmark.stats.stats.mean
+    if reference_tokens is not None:
+        benchmark.extra_info["reference_tokens"] = reference_tokens
+        benchmark.extra_info["relative_error"] = (tokens - reference_tokens) / reference_tokens
@@ -0,0 +1,195 @@
+"""
+Lexical BM25 retrieval and reciprocal rank fusion with the dense vector search.
+
+Dense embeddings are good at meaning but often rank exact names ("Brakka", "Ordo Magica") low. The BM25
+inverted index finds them by their terms. It is built by the DocumentIndexer next to the vector store,
+with the same chunk ids, and saved into the same directory. Both rankings are merged with reciprocal
+rank fusion, which only uses the ranks, so the different score scales don't matter.
+"""
+
+import heapq
+import json
+import math
+import os
+import re
+
+from collections import Counter
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+INDEX_FILE = "bm25.json"
+
+_TERM_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> list[str]:
+    """Split a text into case-folded word terms."""
+    return _TERM_PATTERN.findall(text.casefold())
+
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over chunks, keyed by the chunk ids of the vector store.
+
+    Adding an existing id replaces its text, so the index can be updated like the vector store.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            k1: Term frequency saturation, higher values reward repeated terms longer.
+            b: Document length normalization, 0 disables it, 1 normalizes fully.
+        """
+        self.k1 = k1
+        self.b = b
+        self._term_counts: dict[str, dict[str, int]] = {}   # id -> term -> frequency
+        self._lengths: dict[str, int] = {}
+        self._postings: dict[str, dict[str, int]] = {}      # term -> id -> frequency
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._term_counts)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._term_counts
+
+    def _add_counts(self, doc_id: str, counts: dict[str, int]) -> None:
+        self._term_counts[doc_id] = counts
+        length = sum(counts.values())
+        self._lengths[doc_id] = length
+        self._total_length += length
+        for term, frequency in counts.items():
+            self._postings.setdefault(term, {})[doc_id] = frequency
+
+    def add(self, ids: Iterable[str], texts: Iterable[str]) -> None:
+        """Add (or replace) the texts with the given ids."""
+        for doc_id, text in zip(ids, texts):
+            self.delete([doc_id])
+            self._add_counts(doc_id, dict(Counter(tokenize(text))))
+
+    def delete(self, ids: Iterable[str]) -> None:
+        """Remove the given ids, unknown ids are ignored."""
+        for doc_id in ids:
+            counts = self._term_counts.pop(doc_id, None)
+            if counts is None:
+                continue
+            self._total_length -= self._lengths.pop(doc_id)
+            for term in counts:
+                postings = self._postings[term]
+                del postings[doc_id]
+                if not postings:
+                    del self._postings[term]
+
+    def search(self, query: str, k: int = 4) -> list[tuple[str, float]]:
+        """Return the ids and BM25 scores of the k best matching chunks, best first (only chunks sharing a term)."""
+        if not self._term_counts:
+            return []
+        count = len(self._term_counts)
+        average_length = self._total_length / count
+        scores: dict[str, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def save(self, directory: str | Path) -> None:
+        """Save the index as bm25.json into directory."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = directory / f"{INDEX_FILE}.tmp"
+        tmp_path.write_text(json.dumps({"k1": self.k1, "b": self.b, "docs": self._term_counts}), encoding="utf-8")
+        os.replace(tmp_path, directory / INDEX_FILE)
+
+    @classmethod
+    def exists(cls, directory: str | Path) -> bool:
+        """True if directory contains a saved index."""
+        return (Path(directory) / INDEX_FILE).is_file()
+
+    @classmethod
+    def load(cls, directory: str | Path) -> "BM25Index":
+        """Load an index saved with save()."""
+        data = json.loads((Path(directory) / INDEX_FILE).read_text(encoding="utf-8"))
+        index = cls(k1=data["k1"], b=data["b"])
+        for doc_id, counts in data["docs"].items():
+            index._add_counts(doc_id, counts)
+        return index
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[tuple[str, float]]:
+    """
+    Merge several rankings of ids with reciprocal rank fusion.
+
+    Every ranking adds 1 / (k + rank) to the score of its ids (rank starting at 1), ids ranked well by
+    several retrievers end up first.
+
+    Args:
+        rankings: Lists of ids, best first.
+        k: Damping constant, larger values flatten the influence of the top ranks.
+    Returns:
+        (id, fused score) pairs, best first.
+    """
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def hybrid_fusion(vectorstore: VectorStore, dense_results: list[tuple[Document, float]],
+                  lexical_results: list[tuple[str, float]], k: int = 4,
+                  rrf_k: int = 60) -> list[tuple[Document, float]]:
+    """
+    Fuse dense and lexical results and return the k best documents with their fused score.
+
+    Args:
+        vectorstore: Store to fetch the documents that were only found by the lexical search.
+        dense_results: (document, similarity) pairs of the vector search, best first.
+        lexical_results: (id, BM25 score) pairs of BM25Index.search, best first.
+        k: Number of results.
+        rrf_k: Damping constant of the reciprocal rank fusion.
+    """
+    fused = reciprocal_rank_fusion([[doc.id for doc, _ in dense_results],
+                                    [doc_id for doc_id, _ in lexical_results]], k=rrf_k)[:k]
+    documents = {doc.id: doc for doc, _ in dense_results}
+    missing = [doc_id for doc_id, _ in fused if doc_id not in documents]
+    if missing:
+        documents.update((doc.id, doc) for doc in vectorstore.get_by_ids(missing))
+    return [(documents[doc_id], score) for doc_id, score in fused if doc_id in documents]
+
+
+def similarity_floor(vectorstore: VectorStore, lexical_results: list[tuple[str, float]], query_vector: list[float],
+                     threshold: float, known_scores: dict[str, float] | None = None) -> list[tuple[str, float]]:
+    """
+    Drop the lexical results whose embedding similarity to the query is below threshold.
+
+    Use a threshold well below the one of the dense search: exact names are the keyword matches the embedding
+    ranks low, they should still reach the fusion, only matches in unrelated chunks are dropped.
+
+    Args:
+        vectorstore: Store with the vectors of the lexical results (see NumpyVectorStore.get_vectors), with
+            other stores only the ids in known_scores are filtered.
+        lexical_results: (id, BM25 score) pairs of BM25Index.search, best first.
+        query_vector: The embedded question.
+        threshold: Minimum cosine similarity (inclusive).
+        known_scores: Similarities that are known already, e.g. of the dense results.
+    """
+    scores = dict(known_scores or {})
+    missing = [doc_id for doc_id, _ in lexical_results if doc_id not in scores]
+    if missing and hasattr(vectorstore, "get_vectors"):
+        # get_vectors skips unknown ids, get_by_ids returns the known ones in the same order
+        ids = [doc.id for doc in vectorstore.get_by_ids(missing)]
+        if ids:
+            query = np.asarray(query_vector, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1.0)
+            scores.update(zip(ids, (vectorstore.get_vectors(ids) @ query).tolist()))
+    return [(doc_id, score) for doc_id, score in lexical_results if scores.get(doc_id, threshold) >= threshold]
@@ -0,0 +1,163 @@
+"""
+Chunking of documents for the vector store.
+
+A Chunker turns one document into a list of Chunks, every chunk becomes its own vector. Each chunk
+carries its filename, chunk number, character offset in the source and the markdown heading path as
+metadata, so the RAG prompt only needs the matching pieces instead of whole files.
+"""
+
+import re
+
+from dataclasses import dataclass
+from typing import Callable, Protocol
+
+from tokenhelper import _estimate_text_tokens
+
+HEADING_PATH_SEPARATOR = " > "
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+_WORD_RE = re.compile(r"\S+\s*")
+
+
+@dataclass
+class Chunk:
+    """A piece of a document: the text to embed and the metadata stored with its vector."""
+    text: str
+    metadata: dict
+
+
+class Chunker(Protocol):
+    """Interface of all chunkers, `signature` changes whenever the chunker would produce other chunks."""
+
+    signature: str
+    token_counter: Callable[[str], int]  # also used to report the token throughput of the ingestion
+
+    def split(self, text: str, filename: str) -> list[Chunk]:
+        ...
+
+
+class WholeDocumentChunker:
+    """Keeps every document as a single chunk (the behaviour before chunking was introduced)."""
+
+    signature = "whole"
+    token_counter = staticmethod(_estimate_text_tokens)
+
+    def split(self, text: str, filename: str) -> list[Chunk]:
+        if not text.strip():
+            return []
+        return [Chunk(text=text, metadata={"filename": filename, "chunk": 0, "offset": 0, "heading_path": ""})]
+
+
+class MarkdownChunker:
+    """
+    Token budgeted, markdown heading aware chunker with overlap.
+
+    The document is cut into sections at every heading, a chunk never spans two sections. Inside a section
+    lines are packed into chunks of at most max_tokens tokens, lines longer than the budget are split at
+    word boundaries. Consecutive chunks of a section share up to overlap_tokens tokens of trailing lines.
+
+    The heading path (e.g. "Brakka — Troll Smith > Core Skills") is put in front of every chunk text, so
+    a chunk like "- Heavy armor craft" still knows whom it belongs to, and it is stored as metadata.
+    """
+
+    def __init__(self, max_tokens: int = 200, overlap_tokens: int = 30,
+                 token_counter: Callable[[str], int] = _estimate_text_tokens):
+        """
+        Args:
+            max_tokens: Token budget of a chunk including its heading path line.
+            overlap_tokens: Max tokens repeated from the end of the previous chunk of the same section.
+            token_counter: Function returning the token count of a text.
+        """
+        if max_tokens <= 0:
+            raise ValueError("max_tokens must be positive")
+        if not 0 <= overlap_tokens < max_tokens:
+            raise ValueError("overlap_tokens must be >= 0 and smaller than max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.token_counter = token_counter
+        self.signature = f"markdown:{max_tokens}:{overlap_tokens}"
+        # Another tokenizer produces other chunks, so it is part of the signature (the regex default isn't)
+        counter_name = getattr(token_counter, "name", "regex")
+        if counter_name != "regex":
+            self.signature += f":{counter_name}"
+
+    def _sections(self, text: str) -> list[tuple[list[str], list[tuple[int, int]]]]:
+        """Return (heading path, line spans) per section, heading lines themselves are not part of any span."""
+        sections = []
+        headings: list[tuple[int, str]] = []
+        spans: list[tuple[int, int]] = []
+        in_fence = False
+
+        offset = 0
+        for line in text.splitlines(keepends=True):
+            start, offset = offset, offset + len(line)
+            if _FENCE_RE.match(line):
+                in_fence = not in_fence
+            match = None if in_fence else _HEADING_RE.match(line)
+            if match:
+                sections.append(([title for _, title in headings], spans))
+                level = len(match.group(1))
+                headings = [(lvl, title) for lvl, title in headings if lvl < level] + [(level, match.group(2))]
+                spans = []
+            elif line.strip():
+                spans.append((start, offset))
+        sections.append(([title for _, title in headings], spans))
+        return [(path, spans) for path, spans in sections if spans]
+
+    def _units(self, text: str, spans: list[tuple[int, int]], budget: int) -> list[tuple[int, int, int]]:
+        """Split line spans into (start, end, tokens) units that fit into the budget."""
+        units = []
+        for start, end in spans:
+            tokens = self.token_counter(text[start:end])
+            if tokens <= budget:
+                units.append((start, end, tokens))
+                continue
+            # A single line is too long, cut it at word boundaries
+            piece_start, piece_tokens = start, 0
+            for word in _WORD_RE.finditer(text, start, end):
+                word_tokens = self.token_counter(word.group())
+                if piece_tokens and piece_tokens + word_tokens > budget:
+                    units.append((piece_start, word.start(), piece_tokens))
+                    piece_start, piece_tokens = word.start(), 0
+                piece_tokens += word_tokens
+            if piece_tokens:
+                units.append((piece_start, end, piece_tokens))
+        return units
+
+    def split(self, text: str, filename: str) -> list[Chunk]:
+        """Split a markdown text into chunks with filename, chunk number, offset and heading path metadata."""
+        chunks: list[Chunk] = []
+        for path, spans in self._sections(text):
+            heading_path = HEADING_PATH_SEPARATOR.join(path)
+            prefix = f"{heading_path}\n" if heading_path else ""
+            budget = max(1, self.max_tokens - self.token_counter(prefix))
+            units = self._units(text, spans, budget)
+
+            first = 0
+            while first < len(units):
+                last, total = first, 0
+                while last < len(units) and (last == first or total + units[last][2] <= budget):
+                    total += units[last][2]
+                    last += 1
+
+                body_start, body_end = units[first][0], units[last - 1][1]
+                chunks.append(Chunk(
+                    text=prefix + text[body_start:body_end].strip(),
+                    metadata={
+                        "filename": filename,
+                        "chunk": len(chunks),
+                        "offset": body_start,
+                        "heading_path": heading_path,
+                    },
+                ))
+                if last == len(units):
+                    break
+
+                # Step back over trailing units that fit into the overlap, but always make progress
+                next_first, overlap = last, 0
+                while next_first - 1 > first and overlap + units[next_first - 1][2] <= self.overlap_tokens:
+                    next_first -= 1
+                    overlap += units[next_first][2]
+                first = next_first
+        return chunks
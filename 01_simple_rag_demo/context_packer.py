@@ -0,0 +1,152 @@
+"""
+Token budgeted packing of the RAG prompt.
+
+The context window of the model is split between the answer, the system prompt, the question, the
+retrieved chunks and the chat history. Chunks are packed greedily by score per token, so a short relevant
+chunk wins over a long one that is only slightly better, and the budget the chunks don't use goes to the
+history. The newest history messages are kept. Everything that didn't fit is reported instead of being
+cut off silently by the model server, and a smaller prompt also means a shorter prefill.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, List, Tuple
+
+from tokenhelper import _estimate_message_tokens, _estimate_text_tokens
+
+
+@dataclass
+class ContextBudget:
+    """Token budget of one prompt."""
+    total: int
+    output: int
+    system: int
+    question: int
+    chunks: int
+    history: int
+
+
+@dataclass
+class PackingReport:
+    """Token usage of a packed prompt and the number of dropped history messages."""
+    budget: ContextBudget
+    chunk_tokens: int = 0
+    history_tokens: int = 0
+    dropped_messages: int = 0
+
+    @property
+    def prompt_tokens(self) -> int:
+        return self.budget.system + self.budget.question + self.chunk_tokens + self.history_tokens
+
+    def __str__(self) -> str:
+        text = (f"{self.prompt_tokens}/{self.budget.total - self.budget.output} prompt tokens "
+                f"(system {self.budget.system}, question {self.budget.question}, "
+                f"chunks {self.chunk_tokens}/{self.budget.chunks}, history {self.history_tokens})")
+        if self.dropped_messages:
+            text += f", dropped {self.dropped_messages} history messages"
+        return text
+
+
+def pack_by_score(scores: list[float], costs: list[int], budget: int) -> list[int]:
+    """
+    Greedily pick items by score per token until the budget is used up.
+
+    Args:
+        scores: Value of every item, any scale (negative scores are shifted to be positive).
+        costs: Token count of every item.
+        budget: Max total tokens.
+    Returns:
+        Indices of the picked items in their original order.
+    """
+    if not scores:
+        return []
+    lowest = min(scores)
+    shift = -lowest + 1e-6 if lowest <= 0 else 0.0
+    order = sorted(range(len(scores)), key=lambda i: (scores[i] + shift) / max(costs[i], 1), reverse=True)
+
+    picked, used = [], 0
+    for i in order:
+        if used + costs[i] <= budget:
+            picked.append(i)
+            used += costs[i]
+    return sorted(picked)
+
+
+class ContextPacker:
+    """Splits the context window of the model and packs chunks and history into it."""
+
+    def __init__(self, max_context_tokens: int, output_tokens: int = 1024, chunk_share: float = 0.5,
+                 token_counter: Callable[[str], int] = _estimate_text_tokens):
+        """
+        Args:
+            max_context_tokens: Context window of the model (num_ctx).
+            output_tokens: Tokens kept free for the answer.
+            chunk_share: Share of the remaining budget reserved for the retrieved chunks, the rest (and
+                whatever the chunks don't use) goes to the history.
+            token_counter: Function returning the token count of a text.
+        """
+        if not 0 <= chunk_share <= 1:
+            raise ValueError("chunk_share must be between 0 and 1")
+        self.max_context_tokens = max_context_tokens
+        self.output_tokens = output_tokens
+        self.chunk_share = chunk_share
+        self.token_counter = token_counter
+
+    def message_tokens(self, role: str, content: str) -> int:
+        """Token count of a message including the per message overhead."""
+        return _estimate_message_tokens(role, content, self.token_counter)
+
+    def split(self, system_prompt: str, question: str) -> ContextBudget:
+        """Return the budget of a prompt with the given system prompt and question."""
+        system = self.message_tokens("system", system_prompt)
+        question_tokens = self.message_tokens("human", question)
+        remaining = max(0, self.max_context_tokens - self.output_tokens - system - question_tokens)
+        chunks = int(remaining * self.chunk_share)
+        return ContextBudget(total=self.max_context_tokens, output=self.output_tokens, system=system,
+                             question=question_tokens, chunks=chunks, history=remaining - chunks)
+
+    def pack_chunks(self, texts: list[str], scores: list[float], budget: int) -> tuple[list[int], int]:
+        """
+        Pick the chunks that fit into budget by score per token.
+
+        Args:
+            texts: The chunks as they appear in the prompt.
+            scores: Score of every chunk.
+            budget: Max tokens of all chunks.
+        Returns:
+            The indices of the kept chunks in their original order and their token count.
+        """
+        costs = [self.token_counter(text) for text in texts]
+        kept = pack_by_score(scores, costs, budget)
+        return kept, sum(costs[i] for i in kept)
+
+    def pack_history(self, history: List[Tuple[str, str]], budget: ContextBudget, chunk_tokens: int,
+                     trimmer: Callable[..., List[Tuple[str, str]]] | None = None
+                     ) -> tuple[List[Tuple[str, str]], PackingReport]:
+        """
+        Keep the newest history messages that fit into the history budget plus the unused chunk budget.
+
+        Args:
+            history: (role, content) tuples in chronological order.
+            budget: The budget from split().
+            chunk_tokens: Tokens used by the chunks (the RAG message).
+            trimmer: Optional trimmer called as trimmer(history, max_tokens=available), e.g. a
+                HysteresisTrimmer that keeps the prompt prefix stable, instead of keeping as much as fits.
+        Returns:
+            The kept messages in chronological order and the report of the whole prompt.
+        """
+        available = budget.history + max(0, budget.chunks - chunk_tokens)
+        if trimmer is not None:
+            kept = trimmer(history, max_tokens=available)
+            used = sum(self.message_tokens(role, content) for role, content in kept)
+        else:
+            kept_reversed, used = [], 0
+            for role, content in reversed(history):
+                tokens = self.message_tokens(role, content)
+                if used + tokens > available:
+                    break
+                kept_reversed.append((role, content))
+                used += tokens
+            kept = list(reversed(kept_reversed))
+        report = PackingReport(budget=budget, chunk_tokens=chunk_tokens, history_tokens=used,
+                               dropped_messages=len(history) - len(kept))
+        return kept, report
@@ -0,0 +1,253 @@
+"""
+Persistent embedding cache and incremental indexing for the RAG document store.
+
+- CachedEmbeddings wraps any LangChain Embeddings and keeps every document vector on disk, keyed by the
+  sha256 of the text, so content that was embedded once is never sent to Ollama again.
+- DocumentIndexer keeps a manifest (filename -> content hash + vector ids) next to the persisted vector
+  store and only (re-)embeds added or changed files, deleted files are dropped from the store. Files are
+  split into chunks by a Chunker, every chunk gets its own vector, all chunks are embedded in concurrent
+  batches (see ingestion.py). An optional BM25Index is kept in sync with the same chunk ids (see bm25.py).
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from bm25 import BM25Index
+from chunker import Chunk, Chunker, MarkdownChunker
+from ingestion import IngestionProgress, ingest_texts
+
+
+def content_hash(text: str) -> str:
+    """Return the sha256 hex digest of a text, used as cache key and change marker."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _write_json_atomic(path: Path, data) -> None:
+    """Write JSON to a temporary file first and move it in place, so readers never see half a file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_text(json.dumps(data), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-hash keyed on-disk cache in front of an Embeddings model.
+
+    Every vector is stored as a small JSON file below cache_dir/<namespace>/, the namespace defaults to the
+    model name, so switching the embedding model never returns stale vectors. Only document embeddings are
+    cached, queries are passed through to the wrapped model.
+
+    The counters `hits`, `misses` and `embedding_calls` make it easy to check that a warm restart over an
+    unchanged corpus doesn't call the embedding model at all.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache_dir: str | Path, namespace: str | None = None):
+        """
+        Args:
+            embeddings: The wrapped embedding model (e.g. OllamaEmbeddings).
+            cache_dir: Root directory of the cache.
+            namespace: Sub directory for this model, defaults to the model name of the embeddings.
+        """
+        self.embeddings = embeddings
+        namespace = namespace or getattr(embeddings, "model", None) or type(embeddings).__name__
+        self._cache_dir = Path(cache_dir) / namespace.replace("/", "_").replace(":", "_")
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.embedding_calls = 0
+
+    def _path(self, key: str) -> Path:
+        # Two character fan-out keeps the directories small for big corpora
+        return self._cache_dir / key[:2] / f"{key}.json"
+
+    def _read(self, key: str) -> list[float] | None:
+        path = self._path(key)
+        if not path.is_file():
+            return None
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            # A broken cache entry is just a miss, it gets overwritten with the fresh vector
+            return None
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Return the vectors for texts, only texts not found in the cache are sent to the model (in one call)."""
+        keys = [content_hash(text) for text in texts]
+        vectors: dict[str, list[float]] = {}
+        missing: dict[str, str] = {}  # key -> text, deduplicates identical texts
+
+        for key, text in zip(keys, texts):
+            if key in vectors or key in missing:
+                continue
+            vector = self._read(key)
+            if vector is None:
+                missing[key] = text
+            else:
+                vectors[key] = vector
+
+        if missing:
+            new_vectors = self.embeddings.embed_documents(list(missing.values()))
+            for key, vector in zip(missing.keys(), new_vectors):
+                _write_json_atomic(self._path(key), vector)
+                vectors[key] = vector
+
+        with self._lock:
+            self.hits += len(vectors) - len(missing)
+            self.misses += len(missing)
+            if missing:
+                self.embedding_calls += 1
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a query with the wrapped model, queries are not cached on disk."""
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        """Async version of embed_query, uses the async client of the wrapped model."""
+        return await self.embeddings.aembed_query(text)
+
+
+@dataclass
+class IndexStats:
+    """Result of a DocumentIndexer.sync run, each list contains filenames."""
+    added: list[str] = field(default_factory=list)
+    updated: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    unchanged: list[str] = field(default_factory=list)
+
+    @property
+    def changed(self) -> bool:
+        """True if the vector store was modified and should be persisted again."""
+        return bool(self.added or self.updated or self.removed)
+
+
+class DocumentIndexer:
+    """
+    Incrementally synchronizes a directory of text files into a vector store.
+
+    The manifest file maps every indexed filename to the hash of its content and the ids of its vectors.
+    On sync only new or modified files are embedded, vectors of modified or deleted files are removed.
+    A file is also re-added if the vector store lost its vectors (e.g. the persisted store was deleted)
+    or if the chunker configuration changed since the last sync.
+    """
+
+    def __init__(self, vectorstore: VectorStore, manifest_path: str | Path, chunker: Chunker | None = None,
+                 batch_size: int = 32, max_in_flight: int = 4,
+                 on_progress: Callable[[IngestionProgress], None] | None = None,
+                 lexical_index: BM25Index | None = None):
+        """
+        Args:
+            vectorstore: The vector store to keep in sync, it must support get_by_ids and delete.
+            manifest_path: JSON file used to remember what is already indexed.
+            chunker: Splits the files into chunks, defaults to a MarkdownChunker.
+            batch_size: Number of chunks per embedding request.
+            max_in_flight: Max number of concurrent embedding requests.
+            on_progress: Called with the ingestion progress after every embedded batch.
+            lexical_index: Optional BM25 index that gets the same chunks as the vector store.
+        """
+        self.vectorstore = vectorstore
+        self.lexical_index = lexical_index
+        self.chunker = chunker or MarkdownChunker()
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.on_progress = on_progress
+        self._manifest_path = Path(manifest_path)
+        self._manifest: dict[str, dict] = {}
+        self._stale = False
+        self._load_manifest()
+
+    def _load_manifest(self) -> None:
+        if not self._manifest_path.is_file():
+            return
+        try:
+            data = json.loads(self._manifest_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        self._manifest = data.get("files", {})
+        # Chunks made with another configuration must be replaced, their ids are still needed for that
+        self._stale = data.get("chunker") != self.chunker.signature
+
+    def _save_manifest(self) -> None:
+        _write_json_atomic(self._manifest_path, {"chunker": self.chunker.signature, "files": self._manifest})
+
+    def _is_indexed(self, entry: dict) -> bool:
+        ids = entry.get("ids", [])
+        if self.lexical_index is not None and not all(chunk_id in self.lexical_index for chunk_id in ids):
+            return False
+        return len(self.vectorstore.get_by_ids(ids)) == len(ids)
+
+    @staticmethod
+    def _chunk_id(chunk: Chunk) -> str:
+        return f"{chunk.metadata['filename']}#{chunk.metadata['chunk']}"
+
+    def _delete(self, ids: list[str]) -> None:
+        self.vectorstore.delete(ids)
+        if self.lexical_index is not None:
+            self.lexical_index.delete(ids)
+
+    def sync(self, documents_dir: str | Path) -> IndexStats:
+        """
+        Bring the vector store in line with the files in documents_dir.
+
+        Args:
+            documents_dir: Directory with the documents, every regular file is indexed.
+        Returns:
+            IndexStats with the added, updated, removed and unchanged filenames.
+        """
+        stats = IndexStats()
+        seen: set[str] = set()
+        pending: list[Chunk] = []
+
+        for file_path in sorted(Path(documents_dir).iterdir()):
+            if not file_path.is_file():
+                continue
+            filename = file_path.name
+            seen.add(filename)
+            text = file_path.read_text(encoding="utf-8")
+            digest = content_hash(text)
+
+            entry = self._manifest.get(filename)
+            if entry is not None and not self._stale and entry["hash"] == digest and self._is_indexed(entry):
+                stats.unchanged.append(filename)
+                continue
+
+            if entry is not None:
+                self._delete(entry["ids"])
+                stats.updated.append(filename)
+            else:
+                stats.added.append(filename)
+
+            chunks = self.chunker.split(text, filename)
+            pending.extend(chunks)
+            self._manifest[filename] = {"hash": digest, "ids": [self._chunk_id(chunk) for chunk in chunks]}
+
+        for filename in sorted(set(self._manifest) - seen):
+            self._delete(self._manifest.pop(filename)["ids"])
+            stats.removed.append(filename)
+
+        # The chunks of all added or changed files are embedded together in large concurrent batches
+        if pending:
+            ingest_texts(self.vectorstore, [chunk.text for chunk in pending],
+                         metadatas=[chunk.metadata for chunk in pending],
+                         ids=[self._chunk_id(chunk) for chunk in pending],
+                         batch_size=self.batch_size, max_in_flight=self.max_in_flight,
+                         on_progress=self.on_progress, token_counter=self.chunker.token_counter)
+            if self.lexical_index is not None:
+                self.lexical_index.add([self._chunk_id(chunk) for chunk in pending], [chunk.text for chunk in pending])
+
+        if stats.changed or self._stale or not self._manifest_path.is_file():
+            self._save_manifest()
+            self._stale = False
+        return stats
@@ -0,0 +1,104 @@
+"""
+Coalescing of concurrent query embeddings into batched requests.
+
+When many sessions ask at the same time every question is embedded with its own request, Ollama then
+spends most of the time on per request overhead. The dispatcher collects the aembed_query calls of a short
+window (max_wait_ms, or until max_batch_size texts are waiting) and sends them as one aembed_documents
+batch, identical texts in the window are embedded once. Every caller waits at most max_wait_ms longer
+than without batching, plus the (slightly longer) batch request itself.
+
+Only use it for models that embed queries and documents the same way (true for bge-m3 via Ollama),
+models with a query instruction would get document vectors for the questions.
+"""
+
+import asyncio
+import time
+
+from langchain_core.embeddings import Embeddings
+
+
+class EmbeddingDispatcher:
+    """
+    Batches concurrent aembed_query calls into aembed_documents requests.
+
+    Create and use it on one event loop.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0,
+                 max_in_flight: int = 4):
+        """
+        Args:
+            embeddings: Model the batches are sent to, its aembed_documents should not cache on disk
+                (e.g. the model wrapped by CachedEmbeddings).
+            max_batch_size: Max texts per request, a full batch is sent right away.
+            max_wait_ms: Max time the first text of a batch waits for more texts.
+            max_in_flight: Max concurrent batch requests.
+        """
+        if max_batch_size <= 0:
+            raise ValueError("max_batch_size must be positive")
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._limit = asyncio.Semaphore(max_in_flight)
+        self._pending: dict[str, asyncio.Future] = {}  # text -> future of its vector, deduplicates the window
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self.requests = 0
+        self.deduplicated = 0
+        self.batches = 0
+        self.texts_sent = 0
+        self.seconds = 0.0
+
+    async def aembed_query(self, text: str) -> list[float]:
+        """Embed a query as part of the next batch."""
+        self.requests += 1
+        future = self._pending.get(text)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[text] = future
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        else:
+            self.deduplicated += 1
+        # A cancelled caller must not cancel the vector the other callers of the same text wait for
+        return list(await asyncio.shield(future))
+
+    def embed_query(self, text: str) -> list[float]:
+        """Blocking fallback for callers without an event loop, not batched."""
+        return self.embeddings.embed_query(text)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        task = asyncio.get_running_loop().create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: dict[str, asyncio.Future]) -> None:
+        texts = list(batch)
+        try:
+            async with self._limit:
+                start = time.perf_counter()
+                vectors = await self.embeddings.aembed_documents(texts)
+                self.seconds += time.perf_counter() - start
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.texts_sent += len(texts)
+        for future, vector in zip(batch.values(), vectors):
+            if not future.done():
+                future.set_result(vector)
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "deduplicated": self.deduplicated, "batches": self.batches,
+                "mean_batch_size": self.texts_sent / self.batches if self.batches else 0.0,
+                "mean_batch_ms": 1000 * self.seconds / self.batches if self.batches else 0.0}
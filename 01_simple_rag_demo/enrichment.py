@@ -0,0 +1,116 @@
+"""
+Query enrichment without a blocking LLM call before retrieval.
+
+- RollingSummary keeps a summary of the conversation that is updated in the background after every
+  answer, retrieval just takes the latest finished summary and never waits for the LLM.
+- EmbeddingQueryExpander is the cheap, LLM-free alternative: the query vector is blended with the
+  vectors of the last N questions, so follow-up questions ("and his goals?") keep their context.
+"""
+
+import threading
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+from langchain_core.language_models import BaseChatModel
+
+
+class RollingSummary:
+    """
+    Incrementally updated conversation summary, maintained on a background thread.
+
+    Updates run one after the other on a single worker, each one extends the previous summary by the
+    latest exchange. current() returns immediately with the newest finished summary.
+    """
+
+    def __init__(self, llm: BaseChatModel, system_prompt: str):
+        """
+        Args:
+            llm: Chat model used to write the summaries.
+            system_prompt: Instructions for the summary writer.
+        """
+        self._llm = llm
+        self._system_prompt = system_prompt
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rolling-summary")
+        self._lock = threading.Lock()
+        self._summary = ""
+        self._pending: Future | None = None
+        self.last_error: Exception | None = None
+
+    def current(self) -> str:
+        """Return the latest finished summary ("" before the first update finished)."""
+        with self._lock:
+            return self._summary
+
+    def _update(self, question: str, answer: str) -> None:
+        previous = self.current()
+        chat = [
+            ("system", self._system_prompt),
+            ("human", f"Current summary:\n{previous or '(none yet)'}\n\n"
+                      f"Latest exchange:\nHuman: {question}\nAssistant: {answer}\n\n"
+                      f"Create the updated summary of the whole conversation."),
+        ]
+        try:
+            result = self._llm.invoke(chat)
+        except Exception as e:
+            # Keep the old summary, retrieval works without the newest exchange as well
+            self.last_error = e
+            return
+        with self._lock:
+            self._summary = result.content
+
+    def update(self, question: str, answer: str) -> Future:
+        """Schedule an update with the latest exchange and return right away."""
+        self._pending = self._executor.submit(self._update, question, answer)
+        return self._pending
+
+    def wait(self, timeout: float | None = None) -> None:
+        """Block until the last scheduled update finished (mainly for tests and shutdown)."""
+        if self._pending is not None:
+            self._pending.result(timeout=timeout)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class EmbeddingQueryExpander:
+    """
+    Blends the query embedding with the mean embedding of the last N questions.
+
+    expanded = normalize((1 - history_weight) * query + history_weight * mean(last N questions))
+    """
+
+    def __init__(self, last_n: int = 3, history_weight: float = 0.3):
+        """
+        Args:
+            last_n: Number of previous question embeddings taken into account.
+            history_weight: Share of the history in the expanded query (0 = query only).
+        """
+        if not 0 <= history_weight < 1:
+            raise ValueError("history_weight must be >= 0 and < 1")
+        self.history_weight = history_weight
+        self._history: deque[np.ndarray] = deque(maxlen=last_n)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def expand(self, query_vector: list[float]) -> list[float]:
+        """Return the expanded query vector (the query itself if there is no history yet)."""
+        query = self._normalize(query_vector)
+        with self._lock:
+            history = list(self._history)
+        if not history or self.history_weight == 0:
+            return query.tolist()
+        context = self._normalize(np.mean(history, axis=0))
+        return self._normalize((1 - self.history_weight) * query + self.history_weight * context).tolist()
+
+    def remember(self, query_vector: list[float]) -> None:
+        """Add the embedding of an asked question to the history."""
+        with self._lock:
+            self._history.append(self._normalize(query_vector))
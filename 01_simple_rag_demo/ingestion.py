@@ -0,0 +1,111 @@
+"""
+Batched, concurrent bulk ingestion of texts into a vector store.
+
+Texts are grouped into batches, every batch is embedded with one embed_documents call on a thread pool.
+At most max_in_flight batches are embedded at the same time (backpressure), finished batches are added to
+the vector store on the calling thread, so the vector store itself doesn't need to be thread-safe.
+"""
+
+import time
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable
+
+from langchain_core.vectorstores import InMemoryVectorStore, VectorStore
+
+from tokenhelper import _estimate_text_tokens
+
+
+@dataclass
+class IngestionProgress:
+    """Progress and throughput of a running ingestion, passed to the on_progress callback."""
+    done: int
+    total: int
+    tokens: int
+    elapsed: float
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.done / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def add_embedded_texts(vectorstore: VectorStore, texts: list[str], vectors: list[list[float]],
+                       metadatas: list[dict], ids: list[str]) -> list[str]:
+    """
+    Add texts with already computed vectors to a vector store, without embedding them again.
+
+    Vector stores with an add_embeddings method are supported, for the InMemoryVectorStore the
+    entries are written to its public `store` dict in the same format add_documents uses.
+    """
+    if hasattr(vectorstore, "add_embeddings"):
+        return vectorstore.add_embeddings(texts, vectors, metadatas=metadatas, ids=ids)
+    if isinstance(vectorstore, InMemoryVectorStore):
+        for doc_id, text, vector, metadata in zip(ids, texts, vectors, metadatas):
+            vectorstore.store[doc_id] = {"id": doc_id, "vector": vector, "text": text, "metadata": metadata}
+        return ids
+    raise TypeError(f"{type(vectorstore).__name__} doesn't support adding precomputed embeddings")
+
+
+def ingest_texts(vectorstore: VectorStore, texts: list[str], metadatas: list[dict] | None = None,
+                 ids: list[str] | None = None, batch_size: int = 32, max_in_flight: int = 4,
+                 on_progress: Callable[[IngestionProgress], None] | None = None,
+                 token_counter: Callable[[str], int] = _estimate_text_tokens) -> list[str]:
+    """
+    Embed and add many texts to a vector store in concurrent batches.
+
+    Args:
+        vectorstore: Target vector store, its `embeddings` are used to embed the texts.
+        texts: The texts to add.
+        metadatas: Optional metadata per text.
+        ids: Ids per text, required because the batches finish in any order.
+        batch_size: Number of texts per embed_documents call.
+        max_in_flight: Max number of embedding requests running at the same time.
+        on_progress: Called after every finished batch with the current IngestionProgress.
+        token_counter: Used to report the token throughput.
+    Returns:
+        The ids of the added texts.
+    """
+    if batch_size <= 0 or max_in_flight <= 0:
+        raise ValueError("batch_size and max_in_flight must be positive")
+    if ids is None or len(ids) != len(texts):
+        raise ValueError("ids must be given for every text")
+    metadatas = metadatas if metadatas is not None else [{} for _ in texts]
+    embeddings = vectorstore.embeddings
+    if embeddings is None:
+        raise ValueError("The vector store has no embeddings")
+
+    batches = [range(start, min(start + batch_size, len(texts))) for start in range(0, len(texts), batch_size)]
+    progress = IngestionProgress(done=0, total=len(texts), tokens=0, elapsed=0.0)
+    start_time = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="ingest") as executor:
+        in_flight: dict[Future, range] = {}
+        pending = iter(batches)
+        while True:
+            # Keep at most max_in_flight batches running, the next batch is only submitted when one finished
+            for batch in pending:
+                in_flight[executor.submit(embeddings.embed_documents, [texts[i] for i in batch])] = batch
+                if len(in_flight) >= max_in_flight:
+                    break
+            if not in_flight:
+                break
+
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                batch = in_flight.pop(future)
+                batch_texts = [texts[i] for i in batch]
+                add_embedded_texts(vectorstore, batch_texts, future.result(),
+                                   [metadatas[i] for i in batch], [ids[i] for i in batch])
+
+                progress.done += len(batch)
+                progress.tokens += sum(token_counter(text) for text in batch_texts)
+                progress.elapsed = time.perf_counter() - start_time
+                if on_progress is not None:
+                    on_progress(progress)
+
+    return list(ids)
@@ -0,0 +1,78 @@
+"""
+Maximal marginal relevance (MMR) selection and near-duplicate suppression.
+
+Overlapping chunks and repeated boilerplate make the top k of a search look alike, the prompt then
+contains the same facts several times. MMR picks one candidate after the other, each time the one with
+the best trade-off between its relevance and its similarity to the chunks selected so far:
+
+    mmr = lambda_mult * relevance - (1 - lambda_mult) * max cosine to the selected chunks
+
+Candidates whose cosine to a selected chunk is above the duplicate threshold are dropped completely.
+The pairwise similarities of the (few dozen) candidates are one matrix product, every selection step is
+a handful of vector operations, so the whole selection takes microseconds.
+"""
+
+import numpy as np
+
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+
+def mmr_select(relevance: np.ndarray, vectors: np.ndarray, k: int, lambda_mult: float = 0.5,
+               duplicate_threshold: float | None = 0.95) -> list[int]:
+    """
+    Select up to k candidates by maximal marginal relevance.
+
+    Args:
+        relevance: Relevance per candidate, the scale doesn't matter, it is normalized to [0, 1].
+        vectors: Normalized embedding per candidate, one row each.
+        k: Max number of selected candidates.
+        lambda_mult: 1 selects by relevance only, 0 by diversity only.
+        duplicate_threshold: Candidates with a higher cosine to a selected one are never selected,
+            None disables the duplicate suppression.
+    Returns:
+        The indices of the selected candidates in selection order.
+    """
+    count = len(relevance)
+    if count == 0 or k <= 0:
+        return []
+    relevance = np.asarray(relevance, dtype=np.float32)
+    spread = relevance.max() - relevance.min()
+    relevance = (relevance - relevance.min()) / spread if spread > 0 else np.ones_like(relevance)
+
+    similarities = vectors @ vectors.T
+    max_similarity = np.full(count, -np.inf, dtype=np.float32)
+    available = np.ones(count, dtype=bool)
+    selected: list[int] = []
+
+    for _ in range(min(k, count)):
+        diversity_penalty = np.where(np.isfinite(max_similarity), max_similarity, 0.0)
+        scores = lambda_mult * relevance - (1 - lambda_mult) * diversity_penalty
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        if not np.isfinite(scores[best]):
+            break
+        selected.append(best)
+        available[best] = False
+        max_similarity = np.maximum(max_similarity, similarities[best])
+        if duplicate_threshold is not None:
+            available &= max_similarity <= duplicate_threshold
+    return selected
+
+
+def diversify(vectorstore: VectorStore, results: list[tuple[Document, float]], k: int, lambda_mult: float = 0.5,
+              duplicate_threshold: float | None = 0.95) -> list[tuple[Document, float]]:
+    """
+    Apply mmr_select to (document, score) search results, the scores are used as relevance.
+
+    The candidate vectors are taken from the store (see NumpyVectorStore.get_vectors), stores without
+    stored vectors just get the first k results.
+    """
+    if len(results) <= 1 or not hasattr(vectorstore, "get_vectors"):
+        return results[:k]
+    vectors = vectorstore.get_vectors([doc.id for doc, _ in results])
+    if vectors.shape[0] != len(results):
+        return results[:k]
+    selected = mmr_select(np.array([score for _, score in results]), vectors, k, lambda_mult=lambda_mult,
+                          duplicate_threshold=duplicate_threshold)
+    return [results[i] for i in selected]
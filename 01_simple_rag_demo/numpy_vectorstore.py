@@ -0,0 +1,328 @@
+"""
+NumPy backed vector store with memory-mapped persistence.
+
+All vectors are kept L2 normalized in one contiguous float32 matrix, a query is a single matrix-vector
+product followed by an argpartition top-k, which is a lot faster and several times smaller than the
+dict of Python float lists used by the InMemoryVectorStore. The store is saved as vectors.npy plus a
+metadata.json sidecar (ids, texts, metadata) and can be loaded memory-mapped.
+
+For very large corpora an approximate IVF index (see ann_index.py) can be attached, queries then only
+scan a few clusters of the matrix.
+"""
+
+import json
+import os
+
+from pathlib import Path
+from typing import Any, Callable, Iterable, Sequence
+
+import numpy as np
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+VECTORS_FILE = "vectors.npy"
+METADATA_FILE = "metadata.json"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2 normalize the rows of a matrix, zero vectors stay zero."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Return the indices of the k highest scores, best first, using argpartition instead of a full sort."""
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.size:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.size)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Drop-in VectorStore keeping all vectors in one contiguous float32 matrix.
+
+    Scores are cosine similarities like the ones of the InMemoryVectorStore. Adding texts with an
+    existing id replaces the old entry, deleting moves the last row into the free slot so the matrix
+    stays contiguous. `version` is incremented on every change, caches can use it to detect updates.
+
+    With an index (e.g. ann_index.IVFIndex) searches without filter are approximate, pass exact=True
+    to a search to scan the whole matrix anyway.
+    """
+
+    def __init__(self, embedding: Embeddings, index=None):
+        """
+        Args:
+            embedding: Embeddings used for add_texts and for the queries.
+            index: Optional approximate nearest neighbour index, None means exact search.
+        """
+        self.embedding = embedding
+        self.index = index
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._size = 0
+        self._ids: list[str] = []
+        self._texts: list[str] = []
+        self._metadatas: list[dict] = []
+        self._id_to_row: dict[str, int] = {}
+        self.version = 0
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """The normalized vectors of all entries, row i belongs to the i-th id (read-only view)."""
+        view = self._matrix[:self._size]
+        view.flags.writeable = False
+        return view
+
+    def _ensure_capacity(self, rows: int, dim: int) -> None:
+        if self._matrix.shape[1] not in (0, dim):
+            raise ValueError(f"Vector dimension {dim} doesn't match the store dimension {self._matrix.shape[1]}")
+        capacity = self._matrix.shape[0]
+        # A memory-mapped matrix is read-only, the first change copies it into memory
+        if rows <= capacity and self._matrix.shape[1] == dim and not isinstance(self._matrix, np.memmap):
+            return
+        new_capacity = max(rows, capacity * 2 if rows > capacity else capacity, 16)
+        matrix = np.empty((new_capacity, dim), dtype=np.float32)
+        if self._size:
+            matrix[:self._size] = self._matrix[:self._size]
+        self._matrix = matrix
+
+    def add_embeddings(self, texts: Iterable[str], embeddings: Sequence[Sequence[float]],
+                       metadatas: list[dict] | None = None, ids: list[str] | None = None,
+                       **kwargs: Any) -> list[str]:
+        """
+        Add texts with precomputed vectors, an existing id is replaced.
+
+        Args:
+            texts: The texts (page content) of the entries.
+            embeddings: One vector per text.
+            metadatas: Optional metadata per text.
+            ids: Ids per text, required to be able to update or delete entries later.
+        Returns:
+            The ids of the added entries.
+        """
+        texts = list(texts)
+        if ids is None or len(ids) != len(texts):
+            raise ValueError("ids must be given for every text")
+        if len(embeddings) != len(texts):
+            raise ValueError(f"Got {len(embeddings)} embeddings for {len(texts)} texts")
+        if not texts:
+            return []
+        metadatas = metadatas if metadatas is not None else [{} for _ in texts]
+
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        new_ids = [doc_id for doc_id in dict.fromkeys(ids) if doc_id not in self._id_to_row]
+        self._ensure_capacity(self._size + len(new_ids), vectors.shape[1])
+
+        rows = []
+        for doc_id, text, vector, metadata in zip(ids, texts, vectors, metadatas):
+            row = self._id_to_row.get(doc_id)
+            if row is None:
+                row = self._size
+                self._size += 1
+                self._id_to_row[doc_id] = row
+                self._ids.append(doc_id)
+                self._texts.append(text)
+                self._metadatas.append(metadata)
+            else:
+                self._texts[row] = text
+                self._metadatas[row] = metadata
+            self._matrix[row] = vector
+            rows.append(row)
+
+        if self.index is not None:
+            self.index.update(rows, self._matrix[rows])
+        self.version += 1
+        return list(ids)
+
+    def add_texts(self, texts: Iterable[str], metadatas: list[dict] | None = None, *,
+                  ids: list[str] | None = None, **kwargs: Any) -> list[str]:
+        """Embed texts with the store's embeddings and add them."""
+        texts = list(texts)
+        return self.add_embeddings(texts, self.embedding.embed_documents(texts), metadatas=metadatas, ids=ids)
+
+    def delete(self, ids: list[str] | None = None, **kwargs: Any) -> bool | None:
+        """Delete the entries with the given ids, unknown ids are ignored."""
+        if not ids:
+            return True
+        # A set, an id given twice must only be deleted once
+        rows = sorted({self._id_to_row[doc_id] for doc_id in ids if doc_id in self._id_to_row}, reverse=True)
+        if not rows:
+            return True
+        self._ensure_capacity(self._size, self._matrix.shape[1])
+
+        # Delete from the highest row down, the last row is moved into the free slot
+        moved = set()
+        for row in rows:
+            last = self._size - 1
+            del self._id_to_row[self._ids[row]]
+            if row != last:
+                self._matrix[row] = self._matrix[last]
+                self._ids[row] = self._ids[last]
+                self._texts[row] = self._texts[last]
+                self._metadatas[row] = self._metadatas[last]
+                self._id_to_row[self._ids[row]] = row
+                moved.add(row)
+            self._ids.pop()
+            self._texts.pop()
+            self._metadatas.pop()
+            self._size -= 1
+
+        if self.index is not None:
+            self.index.resize(self._size)
+            moved_rows = sorted(row for row in moved if row < self._size)
+            self.index.update(moved_rows, self._matrix[moved_rows])
+        self.version += 1
+        return True
+
+    def _document(self, row: int) -> Document:
+        return Document(id=self._ids[row], page_content=self._texts[row], metadata=self._metadatas[row])
+
+    def get_by_ids(self, ids: Sequence[str], /) -> list[Document]:
+        """Return the documents for the given ids, unknown ids are skipped."""
+        return [self._document(self._id_to_row[doc_id]) for doc_id in ids if doc_id in self._id_to_row]
+
+    def get_vectors(self, ids: Sequence[str]) -> np.ndarray:
+        """Return the normalized vectors of the given ids as a matrix (one row per known id)."""
+        rows = [self._id_to_row[doc_id] for doc_id in ids if doc_id in self._id_to_row]
+        return np.array(self._matrix[rows], dtype=np.float32)
+
+    def scores(self, embedding: Sequence[float]) -> np.ndarray:
+        """Cosine similarity of the query vector to all entries."""
+        if self._size == 0:
+            return np.empty(0, dtype=np.float32)
+        query = _normalize(np.asarray(embedding, dtype=np.float32).reshape(1, -1))[0]
+        return self._matrix[:self._size] @ query
+
+    def sync_index(self) -> bool:
+        """Bring the approximate index up to date with the vectors, returns True if it was (re)trained."""
+        if self.index is None or not self._size:
+            return False
+        return self.index.sync(self._matrix[:self._size])
+
+    def _approximate_search(self, embedding: Sequence[float], k: int,
+                            nprobe: int | None) -> list[tuple[Document, float]] | None:
+        matrix = self._matrix[:self._size]
+        self.index.sync(matrix)
+        query = _normalize(np.asarray(embedding, dtype=np.float32).reshape(1, -1))[0]
+        result = self.index.search(matrix, query, k, nprobe=nprobe)
+        if result is None:
+            return None
+        rows, scores = result
+        return [(self._document(row), float(score)) for row, score in zip(rows, scores)]
+
+    def similarity_search_with_score_by_vector(self, embedding: list[float], k: int = 4,
+                                               filter: Callable[[Document], bool] | None = None,
+                                               exact: bool = False, nprobe: int | None = None,
+                                               **kwargs: Any) -> list[tuple[Document, float]]:
+        """
+        Return the k most similar documents with their cosine similarity, best first.
+
+        Args:
+            embedding: The query vector.
+            k: Number of results.
+            filter: Only documents for which filter returns True are returned (always exact search).
+            exact: Scan the whole matrix even if the store has an approximate index.
+            nprobe: Overrides the nprobe of an IVF index for this query.
+        """
+        if self.index is not None and filter is None and not exact and self._size:
+            results = self._approximate_search(embedding, k, nprobe)
+            if results is not None:
+                return results
+
+        scores = self.scores(embedding)
+        if filter is None:
+            return [(self._document(row), float(scores[row])) for row in top_k_indices(scores, k)]
+
+        results = []
+        for row in top_k_indices(scores, scores.size):
+            document = self._document(row)
+            if filter(document):
+                results.append((document, float(scores[row])))
+                if len(results) == k:
+                    break
+        return results
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> list[tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k=k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k=k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return self._cosine_relevance_score_fn
+
+    @classmethod
+    def from_texts(cls, texts: list[str], embedding: Embeddings, metadatas: list[dict] | None = None, *,
+                   ids: list[str] | None = None, **kwargs: Any) -> "NumpyVectorStore":
+        store = cls(embedding=embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids or [str(i) for i in range(len(texts))])
+        return store
+
+    def save(self, directory: str | Path) -> None:
+        """Save the vectors as vectors.npy and ids, texts and metadata as metadata.json into directory."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        # Write to temporary files first, so a crash never leaves a half written store behind
+        vectors_tmp = directory / f"{VECTORS_FILE}.tmp"
+        with open(vectors_tmp, "wb") as f:
+            np.save(f, np.ascontiguousarray(self._matrix[:self._size]))
+        metadata_tmp = directory / f"{METADATA_FILE}.tmp"
+        metadata_tmp.write_text(json.dumps({"ids": self._ids, "texts": self._texts, "metadatas": self._metadatas}),
+                                encoding="utf-8")
+        os.replace(vectors_tmp, directory / VECTORS_FILE)
+        os.replace(metadata_tmp, directory / METADATA_FILE)
+        if self.index is not None:
+            self.index.save(directory)
+
+    @classmethod
+    def exists(cls, directory: str | Path) -> bool:
+        """True if directory contains a saved store."""
+        directory = Path(directory)
+        return (directory / VECTORS_FILE).is_file() and (directory / METADATA_FILE).is_file()
+
+    @classmethod
+    def load(cls, directory: str | Path, embedding: Embeddings, mmap: bool = True,
+             index=None) -> "NumpyVectorStore":
+        """
+        Load a store saved with save().
+
+        Args:
+            directory: Directory the store was saved to.
+            embedding: Embeddings for new texts and queries.
+            mmap: Memory-map the vectors instead of reading them, they are copied on the first change.
+            index: Optional approximate index, a saved one is loaded if it fits, else it's trained on demand.
+        """
+        directory = Path(directory)
+        data = json.loads((directory / METADATA_FILE).read_text(encoding="utf-8"))
+        # An empty matrix can't be memory-mapped, there is nothing to map anyway
+        matrix = np.load(directory / VECTORS_FILE, mmap_mode="r" if mmap and data["ids"] else None)
+
+        store = cls(embedding=embedding, index=index)
+        if len(data["ids"]) != matrix.shape[0]:
+            raise ValueError(f"{directory} is inconsistent: {len(data['ids'])} ids for {matrix.shape[0]} vectors")
+        store._matrix = matrix if isinstance(matrix, np.memmap) else matrix.astype(np.float32, copy=False)
+        store._size = matrix.shape[0]
+        store._ids = data["ids"]
+        store._texts = data["texts"]
+        store._metadatas = data["metadatas"]
+        store._id_to_row = {doc_id: row for row, doc_id in enumerate(store._ids)}
+        if index is not None:
+            index.load(directory, store._size)
+        return store
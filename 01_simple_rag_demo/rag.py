@@ -0,0 +1,519 @@
+"""
+The RAG pipeline shared by the console REPL (main.py) and the HTTP server (server.py).
+
+- Configuration, prompts and the compiled RAG template.
+- Setup of the embeddings, the LLM and the indexes: the 'documents' directory is synced into the NumPy
+  vector store and the BM25 index, both persisted in ./.rag_cache.
+- get_rag (blocking) and aget_rag (asyncio) build the rendered RAG context of a question, both run the same
+  retrieval stages: enrichment, dense/hybrid search, reranking, MMR and token budget packing.
+"""
+
+import asyncio
+import os
+import time
+
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Callable
+
+from rich.console import Console
+
+from langchain_core.documents import Document
+from langchain_core.language_models import BaseChatModel
+from langchain_core.vectorstores import VectorStore
+from langchain_ollama import OllamaEmbeddings, ChatOllama
+
+from ollama_backend import OllamaBackend
+from token_counter import load_token_counter
+from chunker import MarkdownChunker
+from document_index import CachedEmbeddings, DocumentIndexer
+from ingestion import IngestionProgress
+from numpy_vectorstore import NumpyVectorStore
+from ann_index import IVFIndex
+from bm25 import BM25Index, hybrid_fusion, similarity_floor
+from reranker import CrossEncoderReranker, LexicalReranker, RerankStage
+from mmr import diversify
+from context_packer import ContextPacker
+from embedding_dispatcher import EmbeddingDispatcher
+from rag_cache import RetrievalCache
+from template_manager import TemplateManager
+from enrichment import EmbeddingQueryExpander, RollingSummary
+
+# All Ollama requests go through one pooled keep-alive backend, see backend().
+# OLLAMA_SERVER_URLS="http://gpu1:11434,http://gpu2:11434" spreads them over several servers by outstanding
+# requests, failing servers are skipped for a while (start_health_checks()).
+_OLLAMA_BACKEND: OllamaBackend | None = None
+
+CONSOLE = Console(force_terminal=True, color_system="truecolor")
+
+# Embedding cache, vector store dump and index manifest live here, delete the folder to start from scratch
+RAG_CACHE_DIR = Path(__file__).parent / ".rag_cache"
+
+# The documents that are indexed
+DOCUMENTS_DIR = Path(__file__).parent / "documents"
+
+# Templates are compiled once at startup (bytecode cached on disk) and only reloaded when their file changes
+RAG_TEMPLATE = "ragtemplate.jinja2"
+_TEMPLATES: TemplateManager | None = None
+
+# We cut the max token count of the chat history to keep it smooth
+CHAT_HISTORY_MAX_TOKEN_COUNT = 32000
+
+# Context window of the model, RAG_OUTPUT_TOKENS are kept free for the answer. The rest is split between
+# system prompt, question, retrieved chunks (RAG_CONTEXT_CHUNK_SHARE of what is left) and chat history,
+# chunks the budget doesn't fit are dropped by score per token, unused chunk tokens go to the history.
+RAG_CONTEXT_TOKENS = 16384
+RAG_OUTPUT_TOKENS = 2048
+RAG_CONTEXT_CHUNK_SHARE = 0.4
+
+# How the prompt is assembled:
+# "packed" - the history is cut to whatever fits next to the chunks, its start moves nearly every turn
+# "stable" - the RAG data stays in the history and the history is only trimmed when it doesn't fit anymore,
+#            then in one step down to RAG_HISTORY_LOW_WATER of its budget. The prompt of a turn extends the
+#            prompt of the last one, so Ollama reuses its KV cache instead of prefilling the whole history.
+RAG_PROMPT_MODE = "stable"
+RAG_HISTORY_LOW_WATER = 0.5
+
+# Token counting for chunking and the chat history. Point TOKENIZER_FILE to the tokenizer.json of the model
+# (needs the `tokenizers` package) for exact counts, without it the fast regex estimator is used.
+TOKENIZER_FILE = os.getenv("TOKENIZER_FILE")
+TOKEN_COUNTER = load_token_counter(TOKENIZER_FILE)
+
+# How the question is enriched with the conversation:
+# "summary"   - the LLM summarizes the history before every retrieval (blocking, slowest)
+# "rolling"   - a rolling summary is updated in the background after every answer, retrieval never waits
+# "embedding" - no LLM call, the question embedding is blended with the embeddings of the last questions
+RAG_ENRICH_MODE = "rolling"
+RAG_ENRICH_EMBEDDING_LAST_N = 3
+RAG_ENRICH_EMBEDDING_WEIGHT = 0.3
+
+# Documents are split into chunks of max RAG_CHUNK_MAX_TOKENS, neighbouring chunks share RAG_CHUNK_OVERLAP_TOKENS
+RAG_CHUNK_MAX_TOKENS = 160
+RAG_CHUNK_OVERLAP_TOKENS = 24
+RAG_TOP_K = 4
+
+# "dense" retrieves by embedding similarity only, "hybrid" fuses it with a BM25 keyword search, which finds
+# exact names like "Brakka" or "Ordo Magica". Both retrievers return RAG_HYBRID_FETCH_K candidates and
+# reciprocal rank fusion picks the best RAG_TOP_K, so fewer but better chunks end up in the prompt.
+RAG_RETRIEVAL_MODE = "hybrid"
+RAG_HYBRID_FETCH_K = 20
+
+# Optional rerank stage: RAG_RERANK_FETCH_K candidates are rescored and the best RAG_TOP_K are kept.
+# None disables it, "lexical" needs no model, "cross-encoder" needs sentence-transformers. If the reranker
+# takes longer than RAG_RERANK_BUDGET_MS the retrieval order is used, so it never delays an answer by more.
+RAG_RERANKER = "lexical"
+RAG_RERANK_FETCH_K = 50
+RAG_RERANK_BUDGET_MS = 150
+
+# Maximal marginal relevance: the final RAG_TOP_K chunks are picked for relevance and diversity
+# (1 = relevance only, 0 = diversity only, None disables it), chunks with a cosine similarity above
+# RAG_DUPLICATE_THRESHOLD to an already picked chunk are dropped as near-duplicates
+RAG_MMR_LAMBDA = 0.7
+RAG_DUPLICATE_THRESHOLD = 0.95
+
+# Chunks are embedded in batches of RAG_INGEST_BATCH_SIZE with max RAG_INGEST_MAX_IN_FLIGHT concurrent requests
+RAG_INGEST_BATCH_SIZE = 32
+RAG_INGEST_MAX_IN_FLIGHT = 4
+
+# "exact" compares the question with every chunk, "ivf" uses the approximate IVF index for very large corpora,
+# RAG_IVF_NPROBE is its recall/latency knob (more lists scanned = better recall, slower queries)
+RAG_INDEX_MODE = "exact"
+RAG_IVF_NPROBE = 8
+
+# Repeated questions reuse the query embedding and the search results, results expire when the index changes
+RAG_CACHE_MAX_ENTRIES = 1024
+RAG_CACHE_TTL_SECONDS = 600
+RAG_SUMMARY_SYSTEM_PROMPT = """
+You are professional summary writer for summaries used do enrich queries to vector storage
+for RAG. You write short summaries of max 5 sentences and max 200 words corresponding to
+the question of the user and the previous conversation, also add appropriate information not directly
+associated with the question. You must not use any information that is not part of the conversation.
+You don't return anything else than the summary.
+"""
+
+SYSTEM_PROMPT = """
+You are Thadeus Un, a historian, born 50 years ago in the domic fires of Underville.
+You are a specialist for symbarian history (The history of Symbaroum), ambrien history, albertian history and
+the history of the davokar wood. You are a pretty good story teller, you like putting information into small stories or tales.
+Also you love to tell stories and tales, you always stick to the facts you know.
+You answer in 1-10 sentences or 1-3 paragraphs, unless you are told other, e.g. tell me a story, telle me a tale, tell me a long ..., go into detail ...
+You always structure your answers as markdown, under every circumstances you must structure your answer in markdown.
+You always play your role, you won't do things that do not fit this role. You also always speak and answer like an old historian.
+"""
+
+
+def backend() -> OllamaBackend:
+    """The shared Ollama backend, created from the environment on first use (importing rag starts nothing)."""
+    global _OLLAMA_BACKEND
+    if _OLLAMA_BACKEND is None:
+        _OLLAMA_BACKEND = OllamaBackend.from_env()
+    return _OLLAMA_BACKEND
+
+
+def start_health_checks(interval_seconds: float = 10) -> None:
+    """Check the Ollama servers in the background, so failing ones are skipped (only with several servers)."""
+    if len(backend().nodes) > 1:
+        backend().start_health_checks(interval_seconds=interval_seconds)
+
+
+def create_embeddings() -> CachedEmbeddings:
+    """Every document vector is cached on disk by content hash, unchanged documents are never embedded twice."""
+    return CachedEmbeddings(OllamaEmbeddings(model="bge-m3", base_url=backend().base_url,
+                                             **backend().client_kwargs()),
+                            cache_dir=RAG_CACHE_DIR / "embeddings")
+
+
+def create_template_manager() -> TemplateManager:
+    return TemplateManager(Path(__file__).parent, bytecode_cache_dir=RAG_CACHE_DIR / "templates",
+                           preload=[RAG_TEMPLATE])
+
+
+def templates() -> TemplateManager:
+    """The shared template manager, created on first use (importing rag doesn't touch the filesystem)."""
+    global _TEMPLATES
+    if _TEMPLATES is None:
+        _TEMPLATES = create_template_manager()
+    return _TEMPLATES
+
+
+def create_llm() -> ChatOllama:
+    return ChatOllama(model="gpt-oss:20b", base_url=backend().base_url, num_ctx=RAG_CONTEXT_TOKENS,
+                      **backend().client_kwargs())
+
+
+def create_reranker(workers: int = 1) -> RerankStage | None:
+    """Return the configured rerank stage, None if RAG_RERANKER is None. workers: queries reranked at once."""
+    if RAG_RERANKER is None:
+        return None
+    return RerankStage(CrossEncoderReranker() if RAG_RERANKER == "cross-encoder" else LexicalReranker(),
+                       fetch_k=RAG_RERANK_FETCH_K, budget_seconds=RAG_RERANK_BUDGET_MS / 1000,
+                       workers=workers)
+
+
+def create_context_packer() -> ContextPacker:
+    return ContextPacker(RAG_CONTEXT_TOKENS, output_tokens=RAG_OUTPUT_TOKENS,
+                         chunk_share=RAG_CONTEXT_CHUNK_SHARE, token_counter=TOKEN_COUNTER)
+
+
+def print_ingestion_progress(progress: IngestionProgress):
+    print(f" Embedded {progress.done}/{progress.total} chunks "
+          f"({progress.chunks_per_second:.1f} chunks/s, {progress.tokens_per_second:.0f} tokens/s)")
+
+
+def open_index(embeddings: CachedEmbeddings, documents_dir: str | Path = DOCUMENTS_DIR,
+               log: Callable[[str], None] = print) -> tuple[NumpyVectorStore, BM25Index]:
+    """
+    Load the persisted vector store and BM25 index and sync them with documents_dir.
+
+    Only added or changed documents are embedded, the indexes are saved again if anything changed. The
+    approximate index is trained here (not on the first search) and saved whenever it was (re)trained, so a
+    restart over unchanged documents loads the centroids instead of running k-means again.
+
+    Args:
+        embeddings: Embeddings of the vector store.
+        documents_dir: Directory with the documents.
+        log: Receives the progress messages.
+    Returns:
+        The vector store and the BM25 index.
+    """
+    # All vectors live in one float32 matrix, it is saved as .npy file and memory-mapped on the next start
+    vectorstore_path = RAG_CACHE_DIR / "vectorstore"
+    ann_index = IVFIndex(nprobe=RAG_IVF_NPROBE) if RAG_INDEX_MODE == "ivf" else None
+    if NumpyVectorStore.exists(vectorstore_path):
+        vectorstore = NumpyVectorStore.load(vectorstore_path, embedding=embeddings, index=ann_index)
+    else:
+        vectorstore = NumpyVectorStore(embedding=embeddings, index=ann_index)
+    # The BM25 keyword index is saved next to the vectors, a missing one is rebuilt by the indexer
+    lexical_index = BM25Index.load(vectorstore_path) if BM25Index.exists(vectorstore_path) else BM25Index()
+
+    indexer = DocumentIndexer(vectorstore, manifest_path=RAG_CACHE_DIR / "manifest.json",
+                              chunker=MarkdownChunker(max_tokens=RAG_CHUNK_MAX_TOKENS, token_counter=TOKEN_COUNTER,
+                                                      overlap_tokens=RAG_CHUNK_OVERLAP_TOKENS),
+                              batch_size=RAG_INGEST_BATCH_SIZE, max_in_flight=RAG_INGEST_MAX_IN_FLIGHT,
+                              on_progress=print_ingestion_progress if log is print else None,
+                              lexical_index=lexical_index)
+
+    log("Syncing documents with the vectorstore")
+    index_stats = indexer.sync(documents_dir)
+    for filename in index_stats.added:
+        log(f" Added {filename} to vectorstore")
+    for filename in index_stats.updated:
+        log(f" Updated {filename} in vectorstore")
+    for filename in index_stats.removed:
+        log(f" Removed {filename} from vectorstore")
+    log(f" {len(index_stats.unchanged)} documents unchanged, "
+        f"{embeddings.misses} embedded, {embeddings.hits} taken from the cache")
+
+    index_trained = vectorstore.sync_index()
+    if index_stats.changed:
+        vectorstore.save(vectorstore_path)
+        lexical_index.save(vectorstore_path)
+    elif index_trained:
+        vectorstore.index.save(vectorstore_path)
+    return vectorstore, lexical_index
+
+
+def _candidate_counts(k, retrieval_mode, lexical_index, fetch_k, reranker, mmr_lambda) -> tuple[bool, int, int]:
+    """Return (hybrid, number of search results, number of candidates kept until the final selection)."""
+    # Hybrid retrieval fuses two longer candidate lists into the top k
+    hybrid = retrieval_mode == "hybrid" and lexical_index is not None
+    search_k = k
+    if hybrid:
+        search_k = fetch_k or 4 * k
+    if reranker is not None:
+        search_k = max(search_k, reranker.fetch_k)
+    if mmr_lambda is not None:
+        search_k = max(search_k, fetch_k or 4 * k)
+    # The stages before the final selection keep all candidates
+    pool_k = search_k if reranker is not None or mmr_lambda is not None else k
+    return hybrid, search_k, pool_k
+
+
+@contextmanager
+def _stage(trace: dict | None, name: str):
+    """Add the seconds spent in the with block to trace["timings"][name]."""
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = trace.setdefault("timings", {})
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def _search(vectorstore, question, query_vector, search_k, search_kwargs, cache,
+            query_expander) -> list[tuple[Document, float]]:
+    """Dense search with the embedded question, blended with the previous questions if query_expander is set."""
+    if query_expander is not None:
+        results = vectorstore.similarity_search_with_score_by_vector(
+            query_expander.expand(query_vector), k=search_k, **(search_kwargs or {})
+        )
+        query_expander.remember(query_vector)
+    elif cache is not None:
+        results = cache.similarity_search_with_score_by_vector(vectorstore, question, query_vector, k=search_k,
+                                                               **(search_kwargs or {}))
+    else:
+        results = vectorstore.similarity_search_with_score_by_vector(query_vector, k=search_k,
+                                                                     **(search_kwargs or {}))
+    return results
+
+
+def _select(question, original_question, query_vector, results, vectorstore, threshold, lexical_threshold, k,
+            hybrid, search_k, pool_k, lexical_index, reranker, mmr_lambda, duplicate_threshold, packer,
+            context_budget) -> tuple[list[dict], list[dict]]:
+    """Run the stages after the dense search, return the kept and the dropped results for the template."""
+    # Throw out dense candidates with a similarity score < threshold. Keyword matches only need the lower
+    # lexical_threshold: exact names are what BM25 finds although the embedding ranks them low.
+    dense_scores = {doc.id: score for doc, score in results}
+    results = [(doc, score) for doc, score in results if score >= threshold]
+    score_type = "similarity"
+    if hybrid:
+        lexical_results = similarity_floor(vectorstore, lexical_index.search(question, k=search_k), query_vector,
+                                           lexical_threshold, known_scores=dense_scores)
+        results = hybrid_fusion(vectorstore, results, lexical_results, k=pool_k)
+        score_type = "fusion"
+    if reranker is not None:
+        results, reranked = reranker.rerank(original_question, results, search_k if mmr_lambda is not None else k)
+        if reranked:
+            score_type = "rerank"
+    if mmr_lambda is not None:
+        results = diversify(vectorstore, results, k, lambda_mult=mmr_lambda, duplicate_threshold=duplicate_threshold)
+
+    # Build a list of plain dicts for the template
+    results_for_template = []
+    for doc, score in results:
+        results_for_template.append(
+            {
+                "metadata": doc.metadata,
+                "page_content": doc.page_content,
+                "score": score,
+                "score_type": score_type,
+            }
+        )
+
+    # Drop the chunks that don't fit into the token budget, the best score per token stays
+    dropped = []
+    if packer is not None and context_budget is not None:
+        blocks = [templates().render(RAG_TEMPLATE, results=[result]) for result in results_for_template]
+        kept, _ = packer.pack_chunks(blocks, [result["score"] for result in results_for_template], context_budget)
+        dropped = [result for i, result in enumerate(results_for_template) if i not in kept]
+        results_for_template = [results_for_template[i] for i in kept]
+    return results_for_template, dropped
+
+
+def _print_retrieval(results_for_template, dropped, cache, reranker) -> None:
+    if cache is not None:
+        CONSOLE.print(f"RAG CACHE: {cache.stats()}", style="grey37")
+    if reranker is not None:
+        CONSOLE.print(f"RAG RERANKER: {reranker.stats()}", style="grey37")
+    CONSOLE.print(f"RAG TEMPLATES: {templates().stats()}", style="grey37")
+    for result in results_for_template:
+        metadata = result["metadata"]
+        CONSOLE.print(f"- added {metadata['filename']} "
+                      f"[{metadata.get('heading_path', '')}] ({result['score']})", style="grey37")
+    for result in dropped:
+        metadata = result["metadata"]
+        CONSOLE.print(f"- dropped {metadata['filename']} "
+                      f"[{metadata.get('heading_path', '')}] (over the token budget)", style="grey37")
+
+
+def _summary_chat(chat_history, question) -> list:
+    return ([("system", RAG_SUMMARY_SYSTEM_PROMPT)] + chat_history +
+            [("human", f"Create a summary corresponding to the question: {question}")])
+
+
+def get_rag(question:str, vectorstore:VectorStore, llm:BaseChatModel,  chat_history=[],
+            enrich_with_context=True, print_question=True,
+            threshold=0.25, lexical_threshold=0.1, k=3, search_kwargs=None, cache:RetrievalCache=None,
+            enrich_mode="summary", rolling_summary:RollingSummary=None,
+            query_expander:EmbeddingQueryExpander=None,
+            retrieval_mode="dense", lexical_index:BM25Index=None, fetch_k=None,
+            reranker:RerankStage=None, mmr_lambda=None, duplicate_threshold=0.95,
+            packer:ContextPacker=None, context_budget=None, trace:dict=None) -> str:
+    """
+    Construct a rendered context string for Retrieval-Augmented Generation (RAG).
+
+    Optionally enriches the question with the chat history (when enabled), retrieves
+    the top-k most similar chunks from the vector store, filters them by a similarity score
+    threshold, and renders only the selected chunks using a Jinja2 template.
+
+    Args:
+        question (str): The user's question to be contextualized.
+        vectorstore (VectorStore): Vector store used to perform similarity search.
+        llm (BaseChatModel): Chat model used to summarize/enrich the question when chat history exists.
+        chat_history (list[tuple[str, str]]): Prior conversation as (role, content) pairs; used for enrichment.
+        enrich_with_context (bool): If True, enrich the question with the conversation as selected by enrich_mode.
+        print_question (bool): If True, print the question and any included documents to the console.
+        threshold (float): Minimum similarity score (inclusive) required to include a chunk in the context.
+        lexical_threshold (float): Lower minimum similarity of the keyword matches in the "hybrid" mode, an
+            exact name match is kept although its similarity is below threshold.
+        k (int): Number of top results to retrieve from the vector store.
+        search_kwargs (dict): Extra arguments for the similarity search, e.g. {"exact": True} or {"nprobe": 16}.
+        cache (RetrievalCache): Optional cache for the query embedding and the search results.
+        enrich_mode (str): "summary" summarizes chat_history with the LLM and prepends it to the question,
+            "rolling" prepends the latest background summary of rolling_summary, "embedding" blends
+            the question embedding with the previous questions using query_expander.
+        rolling_summary (RollingSummary): Background summary used by the "rolling" mode.
+        query_expander (EmbeddingQueryExpander): Query expansion used by the "embedding" mode.
+        retrieval_mode (str): "dense" uses the vector search only, "hybrid" fuses it with the BM25 search of
+            lexical_index by reciprocal rank fusion. The keyword matches need a similarity of their stored
+            vector >= lexical_threshold.
+        lexical_index (BM25Index): Keyword index used by the "hybrid" mode.
+        fetch_k (int): Candidates taken from each retriever in the "hybrid" mode, defaults to 4 * k.
+        reranker (RerankStage): Optional rerank stage, reranker.fetch_k candidates are retrieved and
+            rescored against the original question, the best k are kept.
+        mmr_lambda (float): If set, the final k chunks are selected by maximal marginal relevance from the
+            candidates (1 = relevance only, 0 = diversity only).
+        duplicate_threshold (float): With mmr_lambda, candidates with a higher embedding cosine to an already
+            selected chunk are dropped.
+        packer (ContextPacker): Counts the tokens of the rendered chunks for context_budget.
+        context_budget (int): Max tokens of the rendered chunks, chunks are kept by score per token.
+        trace (dict): If given, it receives the seconds spent per stage in trace["timings"] (enrich, embed,
+            search, select, render) and the selected chunks in trace["results"], see benchmark.py.
+
+    Returns:
+        str: Rendered context string intended to precede the assistant's answer.
+    """
+
+    original_question = question
+
+    # We enrich the question if there was a chat already, to provide more context for RAG
+    with _stage(trace, "enrich"):
+        if len(chat_history) > 1 and enrich_with_context and enrich_mode == "summary":
+            result = llm.invoke(_summary_chat(chat_history, question))
+            question = f"{result.content}\n\n{question}"
+        elif enrich_with_context and enrich_mode == "rolling" and rolling_summary is not None:
+            # Never wait for the summary of the last answer, the previous one is good enough for retrieval
+            summary = rolling_summary.current()
+            if summary:
+                question = f"{summary}\n\n{question}"
+
+    if print_question:
+        CONSOLE.print(f"RAG QUESTION: {question}", style="grey37")
+
+    hybrid, search_k, pool_k = _candidate_counts(k, retrieval_mode, lexical_index, fetch_k, reranker, mmr_lambda)
+
+    with _stage(trace, "embed"):
+        if cache is not None:
+            query_vector = cache.embed_query(vectorstore, question)
+        else:
+            query_vector = vectorstore.embeddings.embed_query(question)
+    with _stage(trace, "search"):
+        results = _search(vectorstore, question, query_vector, search_k, search_kwargs, cache,
+                          query_expander if enrich_with_context and enrich_mode == "embedding" else None)
+    with _stage(trace, "select"):
+        results_for_template, dropped = _select(question, original_question, query_vector, results, vectorstore,
+                                                threshold, lexical_threshold, k, hybrid, search_k, pool_k,
+                                                lexical_index, reranker, mmr_lambda, duplicate_threshold, packer,
+                                                context_budget)
+    if print_question:
+        _print_retrieval(results_for_template, dropped, cache, reranker)
+
+    with _stage(trace, "render"):
+        ragdata = templates().render(RAG_TEMPLATE, results=results_for_template)
+    if trace is not None:
+        trace["results"] = results_for_template
+    return ragdata
+
+
+async def aget_rag(question:str, vectorstore:VectorStore, llm:BaseChatModel,  chat_history=[],
+                   enrich_with_context=True, print_question=False,
+                   threshold=0.25, lexical_threshold=0.1, k=3, search_kwargs=None,
+                   cache:RetrievalCache=None,
+                   enrich_mode="summary", rolling_summary:RollingSummary=None,
+                   query_expander:EmbeddingQueryExpander=None,
+                   retrieval_mode="dense", lexical_index:BM25Index=None, fetch_k=None,
+                   reranker:RerankStage=None, mmr_lambda=None, duplicate_threshold=0.95,
+                   packer:ContextPacker=None, context_budget=None,
+                   llm_limit:asyncio.Semaphore=None, embedding_limit:asyncio.Semaphore=None,
+                   query_embeddings:EmbeddingDispatcher=None) -> str:
+    """
+    Async version of get_rag for the server, the LLM and the embeddings are called with ainvoke/aembed_query.
+
+    Takes the same arguments as get_rag and additionally:
+        llm_limit (asyncio.Semaphore): Limits the concurrent LLM requests (summary enrichment).
+        embedding_limit (asyncio.Semaphore): Limits the concurrent embedding requests, cached query
+            embeddings don't need a slot.
+        query_embeddings (EmbeddingDispatcher): Embeds the question instead of the vector store embeddings,
+            e.g. batched with the questions of other sessions.
+
+    The CPU bound stages (search, rerank, MMR, packing) run in a worker thread, so the event loop keeps
+    serving the other sessions.
+    """
+    original_question = question
+
+    if len(chat_history) > 1 and enrich_with_context and enrich_mode == "summary":
+        async with llm_limit or nullcontext():
+            result = await llm.ainvoke(_summary_chat(chat_history, question))
+        question = f"{result.content}\n\n{question}"
+    elif enrich_with_context and enrich_mode == "rolling" and rolling_summary is not None:
+        summary = rolling_summary.current()
+        if summary:
+            question = f"{summary}\n\n{question}"
+
+    if print_question:
+        CONSOLE.print(f"RAG QUESTION: {question}", style="grey37")
+
+    hybrid, search_k, pool_k = _candidate_counts(k, retrieval_mode, lexical_index, fetch_k, reranker, mmr_lambda)
+
+    if cache is not None:
+        query_vector = await cache.aembed_query(vectorstore, question, limit=embedding_limit,
+                                                embeddings=query_embeddings)
+    else:
+        async with embedding_limit or nullcontext():
+            query_vector = await (query_embeddings or vectorstore.embeddings).aembed_query(question)
+
+    def search_and_select() -> tuple[list[dict], list[dict]]:
+        results = _search(vectorstore, question, query_vector, search_k, search_kwargs, cache,
+                          query_expander if enrich_with_context and enrich_mode == "embedding" else None)
+        return _select(question, original_question, query_vector, results, vectorstore, threshold, lexical_threshold,
+                       k, hybrid, search_k, pool_k, lexical_index, reranker, mmr_lambda, duplicate_threshold, packer,
+                       context_budget)
+
+    results_for_template, dropped = await asyncio.to_thread(search_and_select)
+    if print_question:
+        _print_retrieval(results_for_template, dropped, cache, reranker)
+
+    return templates().render(RAG_TEMPLATE, results=results_for_template)
@@ -0,0 +1,160 @@
+"""
+LRU/TTL caches for the retrieval step of get_rag.
+
+Repeated or near-identical questions (same text after lowercasing and collapsing whitespace) neither
+embed the question again nor search the vector store again. Query embeddings only depend on the text,
+search results also on the index version, they are dropped automatically once the vector store changed.
+"""
+
+import asyncio
+import threading
+import time
+
+from collections import OrderedDict
+from contextlib import nullcontext
+from typing import Any, Callable, Hashable
+
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+_MISSING = object()
+
+
+class LRUCache:
+    """A thread-safe LRU cache with an optional time to live and hit/miss counters."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            maxsize: Max number of entries, the least recently used entry is evicted first.
+            ttl: Seconds an entry stays valid, None means forever.
+            clock: Time source, replaceable for tests.
+        """
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value (and mark it as recently used) or default."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and (self.ttl is None or self._clock() - entry[0] < self.ttl):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not _MISSING:
+                del self._data[key]  # expired
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (self._clock(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+
+def normalize_query(text: str) -> str:
+    """Case-fold and collapse whitespace, so trivially different questions share cache entries."""
+    return " ".join(text.casefold().split())
+
+
+class RetrievalCache:
+    """
+    Caches query embeddings and top-k search results for a vector store.
+
+    The index version is taken from the `version` attribute of the vector store (see NumpyVectorStore),
+    stores without one are treated as never changing.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = 600):
+        """
+        Args:
+            maxsize: Max entries of each of the two caches.
+            ttl: Seconds an entry stays valid, None means forever.
+        """
+        self.embeddings = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.results = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _index_version(self, vectorstore: VectorStore) -> Any:
+        version = getattr(vectorstore, "version", None)
+        with self._lock:
+            if version != self._version:
+                # Results of the old index are useless now, free the memory right away
+                self.results.clear()
+                self._version = version
+        return version
+
+    def embed_query(self, vectorstore: VectorStore, query: str) -> list[float]:
+        """Return the embedding of query, computed with the embeddings of the vector store on a miss."""
+        key = normalize_query(query)
+        vector = self.embeddings.get(key)
+        if vector is None:
+            vector = vectorstore.embeddings.embed_query(query)
+            self.embeddings.put(key, vector)
+        return vector
+
+    async def aembed_query(self, vectorstore: VectorStore, query: str, limit: asyncio.Semaphore | None = None,
+                           embeddings: Any = None) -> list[float]:
+        """
+        Async version of embed_query, a miss is embedded with aembed_query of the vector store embeddings.
+
+        Args:
+            limit: Optional semaphore that limits the concurrent embedding requests, hits don't acquire it.
+            embeddings: Embeds the misses instead of the vector store embeddings, e.g. an EmbeddingDispatcher.
+        """
+        key = normalize_query(query)
+        vector = self.embeddings.get(key)
+        if vector is None:
+            async with limit or nullcontext():
+                vector = await (embeddings or vectorstore.embeddings).aembed_query(query)
+            self.embeddings.put(key, vector)
+        return vector
+
+    def _results_key(self, vectorstore: VectorStore, query: str, k: int, search_kwargs: dict) -> tuple:
+        return normalize_query(query), self._index_version(vectorstore), k, tuple(sorted(search_kwargs.items()))
+
+    def similarity_search_with_score(self, vectorstore: VectorStore, query: str, k: int = 4,
+                                     **search_kwargs: Any) -> list[tuple[Document, float]]:
+        """Cached version of vectorstore.similarity_search_with_score (search_kwargs must be hashable)."""
+        key = self._results_key(vectorstore, query, k, search_kwargs)
+        results = self.results.get(key)
+        if results is None:
+            vector = self.embed_query(vectorstore, query)
+            results = vectorstore.similarity_search_with_score_by_vector(vector, k=k, **search_kwargs)
+            self.results.put(key, results)
+        return list(results)
+
+    def similarity_search_with_score_by_vector(self, vectorstore: VectorStore, query: str, vector: list[float],
+                                               k: int = 4, **search_kwargs: Any) -> list[tuple[Document, float]]:
+        """Like similarity_search_with_score for an already embedded query (vector must be the embedding of query)."""
+        key = self._results_key(vectorstore, query, k, search_kwargs)
+        results = self.results.get(key)
+        if results is None:
+            results = vectorstore.similarity_search_with_score_by_vector(vector, k=k, **search_kwargs)
+            self.results.put(key, results)
+        return list(results)
+
+    def stats(self) -> dict:
+        return {"embeddings": self.embeddings.stats(), "results": self.results.stats()}
@@ -0,0 +1,176 @@
+"""
+Reranking of retrieved chunks with a hard latency budget.
+
+The retrieval over-fetches candidates (e.g. the top 50), a reranker rescores them in batches against the
+question and only the best few go into the prompt. Scoring runs on worker threads (one per concurrent
+query), if it doesn't finish within the budget the candidates are returned in their original retrieval order, so a slow reranker never
+delays the answer by more than the budget.
+
+- LexicalReranker needs no model: it scores the coverage of the question terms, weighted by how rare a
+  term is among the candidates, and rewards chunks that contain the terms as a phrase.
+- CrossEncoderReranker uses a small sentence-transformers cross-encoder on the CPU (optional dependency).
+"""
+
+import math
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Protocol
+
+from langchain_core.documents import Document
+
+from bm25 import tokenize
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:  # optional, only needed for the CrossEncoderReranker
+    CrossEncoder = None
+
+
+class Reranker(Protocol):
+    """Interface of all rerankers."""
+
+    def score(self, query: str, texts: list[str]) -> list[float]:
+        """Return a relevance score per text, higher is better."""
+        ...
+
+
+class LexicalReranker:
+    """Model-free reranker based on the question terms found in a chunk."""
+
+    def __init__(self, phrase_bonus: float = 0.5):
+        """
+        Args:
+            phrase_bonus: Added to the score of a chunk per pair of neighbouring question terms it contains.
+        """
+        self.phrase_bonus = phrase_bonus
+
+    def score(self, query: str, texts: list[str]) -> list[float]:
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if not query_terms:
+            return [0.0] * len(texts)
+        documents = [tokenize(text) for text in texts]
+        term_sets = [set(terms) for terms in documents]
+        # Terms found in few candidates separate them best
+        weights = {term: math.log(1 + len(texts) / (1 + sum(term in terms for terms in term_sets)))
+                   for term in query_terms}
+        total_weight = sum(weights.values())
+        query_pairs = set(zip(query_terms, query_terms[1:]))
+
+        scores = []
+        for terms, term_set in zip(documents, term_sets):
+            coverage = sum(weights[term] for term in query_terms if term in term_set) / total_weight
+            phrases = len(query_pairs.intersection(zip(terms, terms[1:])))
+            scores.append(coverage + self.phrase_bonus * phrases)
+        return scores
+
+
+class CrossEncoderReranker:
+    """Reranker with a local sentence-transformers cross-encoder, small models run fine on the CPU."""
+
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2", device: str = "cpu"):
+        """
+        Args:
+            model_name: Name or local path of the cross-encoder model.
+            device: Torch device the model runs on.
+        Raises:
+            ImportError: If sentence-transformers is not installed.
+        """
+        if CrossEncoder is None:
+            raise ImportError("The cross-encoder reranker needs 'sentence-transformers' "
+                              "(pip install sentence-transformers)")
+        self._model = CrossEncoder(model_name, device=device)
+
+    def score(self, query: str, texts: list[str]) -> list[float]:
+        return [float(score) for score in self._model.predict([(query, text) for text in texts],
+                                                              batch_size=len(texts) or 1)]
+
+
+class RerankStage:
+    """
+    Reranks over-fetched retrieval results within a latency budget.
+
+    Attributes:
+        fetch_k: Number of candidates the retrieval should return for reranking.
+        reranked: Number of queries that were reranked in time.
+        fallbacks: Number of queries that ran out of budget (or failed) and kept the retrieval order.
+    """
+
+    def __init__(self, reranker: Reranker, fetch_k: int = 50, batch_size: int = 16, budget_seconds: float = 0.15,
+                 workers: int = 1):
+        """
+        Args:
+            reranker: Scores the candidates.
+            fetch_k: Number of candidates the retrieval should return for reranking.
+            batch_size: Candidates scored per reranker call.
+            budget_seconds: Max time spent on reranking per query.
+            workers: Queries scored at the same time. The budget starts when rerank() is called, so match it to
+                the number of threads that rerank concurrently, or queued queries spend their budget waiting.
+        """
+        if batch_size <= 0:
+            raise ValueError("batch_size must be positive")
+        self.reranker = reranker
+        self.fetch_k = fetch_k
+        self.batch_size = batch_size
+        self.budget_seconds = budget_seconds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reranker")
+        self._lock = threading.Lock()
+        self.reranked = 0
+        self.fallbacks = 0
+        self.last_seconds = 0.0
+        self.last_error: Exception | None = None
+
+    def _score(self, query: str, texts: list[str], deadline: float) -> list[float] | None:
+        scores: list[float] = []
+        for start in range(0, len(texts), self.batch_size):
+            if time.perf_counter() > deadline:
+                return None  # the caller already gave up, don't waste more CPU on this query
+            scores.extend(self.reranker.score(query, texts[start:start + self.batch_size]))
+        return scores
+
+    def rerank(self, query: str, results: list[tuple[Document, float]],
+               k: int) -> tuple[list[tuple[Document, float]], bool]:
+        """
+        Return the k best results by reranker score, or the first k results if the budget ran out.
+
+        Args:
+            query: The question.
+            results: (document, retrieval score) pairs, best first.
+            k: Number of results to return.
+        Returns:
+            The results with their reranker score (or their retrieval score on fallback) and True if
+            they were reranked.
+        """
+        if not results:
+            return [], True
+        start = time.perf_counter()
+        deadline = start + self.budget_seconds
+        future = self._executor.submit(self._score, query, [doc.page_content for doc, _ in results], deadline)
+        try:
+            scores = future.result(timeout=self.budget_seconds)
+        except TimeoutError:
+            scores = None
+        except Exception as e:
+            # A broken reranker must not break the answer, the retrieval order is good enough
+            with self._lock:
+                self.last_error = e
+            scores = None
+        with self._lock:
+            self.last_seconds = time.perf_counter() - start
+            if scores is None:
+                self.fallbacks += 1
+            else:
+                self.reranked += 1
+
+        if scores is None:
+            return results[:k], False
+        order = sorted(range(len(results)), key=lambda i: scores[i], reverse=True)[:k]
+        return [(results[i][0], scores[i]) for i in order], True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"reranked": self.reranked, "fallbacks": self.fallbacks, "last_ms": 1000 * self.last_seconds}
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
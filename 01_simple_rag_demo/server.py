@@ -0,0 +1,346 @@
+"""
+Async multi-session RAG server, an HTTP/JSON entry point next to the console REPL in main.py.
+
+Many conversations share one vector store, BM25 index, retrieval cache and LLM. Every session has its
+own chat history, query expansion and history trimmer, questions of the same session are answered one
+after the other, different sessions run concurrently on one event loop:
+
+- The LLM and the embeddings are called with ainvoke/aembed_query, the CPU bound retrieval stages run in
+  worker threads (see rag.aget_rag).
+- Each backend has its own concurrency limit, requests above the limit wait in the server instead of
+  piling up in the queue of the Ollama server (match RAG_SERVER_MAX_LLM_REQUESTS to OLLAMA_NUM_PARALLEL).
+- The questions of concurrent sessions are embedded together in batches (see embedding_dispatcher.py).
+- Idle sessions beyond RAG_SERVER_MAX_SESSIONS are dropped, least recently used first.
+
+Endpoints (HTTP/1.1 with keep-alive, JSON bodies):
+    POST   /chat            {"session_id": "...", "question": "..."} -> {"session_id", "answer", "context"}
+                            without session_id a new session is created
+    DELETE /sessions/<id>   forget a session
+    GET    /health          number of sessions and cache/reranker stats
+
+Run it with `python server.py --port 8000`.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import uuid
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from http import HTTPStatus
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.vectorstores import VectorStore
+
+from tokenhelper import ChatHistory
+from bm25 import BM25Index
+from reranker import RerankStage
+from context_packer import ContextPacker
+from prompt_prefix import HysteresisTrimmer
+from rag_cache import RetrievalCache
+from enrichment import EmbeddingQueryExpander
+from embedding_dispatcher import EmbeddingDispatcher
+from rag import (CHAT_HISTORY_MAX_TOKEN_COUNT, RAG_PROMPT_MODE, RAG_HISTORY_LOW_WATER,
+                 RAG_ENRICH_EMBEDDING_LAST_N, RAG_ENRICH_EMBEDDING_WEIGHT, RAG_TOP_K, RAG_RETRIEVAL_MODE,
+                 RAG_HYBRID_FETCH_K, RAG_MMR_LAMBDA, RAG_DUPLICATE_THRESHOLD, RAG_INDEX_MODE,
+                 RAG_CACHE_MAX_ENTRIES, RAG_CACHE_TTL_SECONDS, SYSTEM_PROMPT,
+                 create_embeddings, create_llm, create_reranker, create_context_packer, open_index, aget_rag,
+                 start_health_checks)
+
+RAG_SERVER_HOST = "127.0.0.1"
+RAG_SERVER_PORT = 8000
+
+# Max concurrent requests per backend, the other requests wait in the server
+RAG_SERVER_MAX_LLM_REQUESTS = 2
+RAG_SERVER_MAX_EMBEDDING_REQUESTS = 4
+
+# Questions reranked at the same time. The retrieval stages run in the default pool of asyncio.to_thread, this
+# many sessions can rerank at once, each needs its own reranker worker or it spends its budget waiting.
+RAG_SERVER_RERANK_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+# Questions arriving within RAG_SERVER_EMBEDDING_MAX_WAIT_MS are embedded in one request of up to
+# RAG_SERVER_EMBEDDING_BATCH_SIZE texts, this is the max latency added to a question for the higher throughput.
+# A batch size of 0 embeds every question on its own.
+RAG_SERVER_EMBEDDING_BATCH_SIZE = 32
+RAG_SERVER_EMBEDDING_MAX_WAIT_MS = 5
+
+# Sessions kept in memory, the least recently used session is dropped first
+RAG_SERVER_MAX_SESSIONS = 1000
+
+# "embedding" needs no LLM call per question, "summary" costs one extra LLM request (and slot) per question,
+# None disables the enrichment. The background "rolling" summary of the REPL is not available here.
+RAG_SERVER_ENRICH_MODE = "embedding"
+
+# Larger request bodies are rejected
+RAG_SERVER_MAX_BODY_BYTES = 64 * 1024
+
+
+@dataclass
+class Session:
+    """State of one conversation."""
+    session_id: str
+    history: ChatHistory
+    query_expander: EmbeddingQueryExpander
+    trimmer: HysteresisTrimmer | None = None
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class SessionStore:
+    """Sessions by id, the least recently used sessions are dropped beyond max_sessions."""
+
+    def __init__(self, packer: ContextPacker, max_sessions: int = 1000, prompt_mode: str = "stable",
+                 history_max_tokens: int = 32000, history_low_water: float = 0.5):
+        """
+        Args:
+            packer: Counts the message tokens for the history trimmer.
+            max_sessions: Max number of sessions kept.
+            prompt_mode: "stable" gives every session a HysteresisTrimmer (see rag.RAG_PROMPT_MODE).
+            history_max_tokens: Max tokens of a session history.
+            history_low_water: Low-water mark of the history trimmer.
+        """
+        self.packer = packer
+        self.max_sessions = max_sessions
+        self.prompt_mode = prompt_mode
+        self.history_max_tokens = history_max_tokens
+        self.history_low_water = history_low_water
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def get(self, session_id: str) -> Session:
+        """Return the session with the given id, a new one if it doesn't exist."""
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+            return session
+
+        trimmer = None
+        if self.prompt_mode == "stable":
+            trimmer = HysteresisTrimmer(self.history_max_tokens,
+                                        message_tokens=lambda message: self.packer.message_tokens(*message),
+                                        low_water=self.history_low_water,
+                                        start_on=lambda message: message[0] == "human")
+        session = Session(session_id=session_id,
+                          history=ChatHistory(max_tokens=self.history_max_tokens,
+                                              token_counter=self.packer.token_counter),
+                          query_expander=EmbeddingQueryExpander(last_n=RAG_ENRICH_EMBEDDING_LAST_N,
+                                                                history_weight=RAG_ENRICH_EMBEDDING_WEIGHT),
+                          trimmer=trimmer)
+        self._sessions[session_id] = session
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        """Forget a session, return False if it didn't exist."""
+        return self._sessions.pop(session_id, None) is not None
+
+
+class RAGServer:
+    """Answers the questions of many sessions concurrently with one shared index and LLM."""
+
+    def __init__(self, vectorstore: VectorStore, llm: BaseChatModel, packer: ContextPacker,
+                 lexical_index: BM25Index = None, cache: RetrievalCache = None, reranker: RerankStage = None,
+                 max_llm_requests: int = 2, max_embedding_requests: int = 4, max_sessions: int = 1000,
+                 enrich_mode: str | None = "embedding", prompt_mode: str = "stable", system_prompt: str = SYSTEM_PROMPT,
+                 rag_kwargs: dict | None = None, embedding_dispatcher: EmbeddingDispatcher = None):
+        """
+        Args:
+            vectorstore: Shared vector store.
+            llm: Shared chat model.
+            packer: Splits the context window and packs chunks and history.
+            lexical_index: Optional BM25 index for the hybrid retrieval.
+            cache: Optional retrieval cache shared by all sessions.
+            reranker: Optional rerank stage.
+            max_llm_requests: Max concurrent LLM requests.
+            max_embedding_requests: Max concurrent embedding requests (without embedding_dispatcher, else
+                its max_in_flight applies).
+            max_sessions: Max number of sessions kept.
+            enrich_mode: "embedding", "summary" or None, see RAG_SERVER_ENRICH_MODE.
+            prompt_mode: "stable" or "packed", see rag.RAG_PROMPT_MODE.
+            system_prompt: System prompt of the answers.
+            rag_kwargs: Extra arguments for aget_rag, e.g. k or threshold.
+            embedding_dispatcher: Optional dispatcher that embeds the questions of all sessions in batches.
+        """
+        self.vectorstore = vectorstore
+        self.llm = llm
+        self.packer = packer
+        self.lexical_index = lexical_index
+        self.cache = cache
+        self.reranker = reranker
+        self.enrich_mode = enrich_mode
+        self.prompt_mode = prompt_mode
+        self.system_prompt = system_prompt
+        self.rag_kwargs = rag_kwargs or {}
+        self.embedding_dispatcher = embedding_dispatcher
+        self.llm_limit = asyncio.Semaphore(max_llm_requests)
+        self.embedding_limit = asyncio.Semaphore(max_embedding_requests)
+        self.sessions = SessionStore(packer, max_sessions=max_sessions, prompt_mode=prompt_mode,
+                                     history_max_tokens=CHAT_HISTORY_MAX_TOKEN_COUNT,
+                                     history_low_water=RAG_HISTORY_LOW_WATER)
+        self.requests = 0
+        self.errors = 0
+
+    async def chat(self, session_id: str, question: str) -> dict:
+        """Answer a question within a session, return the JSON response."""
+        session = self.sessions.get(session_id)
+        # One question per session at a time, the history must be extended in order
+        async with session.lock:
+            context_budget = self.packer.split(self.system_prompt, question)
+            ragdata = await aget_rag(question, vectorstore=self.vectorstore, llm=self.llm,
+                                     chat_history=session.history.messages,
+                                     enrich_with_context=self.enrich_mode is not None,
+                                     enrich_mode=self.enrich_mode, query_expander=session.query_expander,
+                                     cache=self.cache, lexical_index=self.lexical_index, reranker=self.reranker,
+                                     packer=self.packer, context_budget=context_budget.chunks,
+                                     llm_limit=self.llm_limit,
+                                     embedding_limit=None if self.embedding_dispatcher else self.embedding_limit,
+                                     query_embeddings=self.embedding_dispatcher,
+                                     **self.rag_kwargs)
+
+            history, packing_report = self.packer.pack_history(session.history.messages, context_budget,
+                                                               self.packer.message_tokens("assistant", ragdata),
+                                                               trimmer=session.trimmer)
+            messages = ([("system", self.system_prompt)] + history +
+                        [("assistant", ragdata),
+                         ("human", question)])
+            async with self.llm_limit:
+                result = await self.llm.ainvoke(messages)
+            answer = result.content
+
+            if self.prompt_mode == "stable":
+                session.history.append("assistant", ragdata)
+            session.history.append("human", question)
+            session.history.append("assistant", answer)
+        return {"session_id": session_id, "answer": answer, "context": str(packing_report)}
+
+    def health(self) -> dict:
+        stats = {"status": "ok", "sessions": len(self.sessions), "requests": self.requests, "errors": self.errors}
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        if self.reranker is not None:
+            stats["reranker"] = self.reranker.stats()
+        if self.embedding_dispatcher is not None:
+            stats["embedding_batches"] = self.embedding_dispatcher.stats()
+        return stats
+
+    async def _route(self, method: str, path: str, body: bytes) -> tuple[HTTPStatus, dict]:
+        if method == "GET" and path == "/health":
+            return HTTPStatus.OK, self.health()
+        if method == "DELETE" and path.startswith("/sessions/"):
+            if self.sessions.delete(path.removeprefix("/sessions/")):
+                return HTTPStatus.OK, {"deleted": True}
+            return HTTPStatus.NOT_FOUND, {"error": "unknown session"}
+        if method == "POST" and path == "/chat":
+            try:
+                request = json.loads(body)
+            except ValueError:
+                return HTTPStatus.BAD_REQUEST, {"error": "invalid JSON"}
+            if not isinstance(request, dict) or not isinstance(request.get("question"), str) \
+                    or not request["question"].strip():
+                return HTTPStatus.BAD_REQUEST, {"error": "'question' is required"}
+            session_id = str(request.get("session_id") or uuid.uuid4().hex)
+            return HTTPStatus.OK, await self.chat(session_id, request["question"])
+        return HTTPStatus.NOT_FOUND, {"error": f"no route for {method} {path}"}
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close"
+
+                length = int(headers.get("content-length", 0))
+                if length > RAG_SERVER_MAX_BODY_BYTES:
+                    status, response = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "body too large"}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    self.requests += 1
+                    try:
+                        status, response = await self._route(method, path, body)
+                    except Exception as e:
+                        # A failing backend must not take the connection (or the server) down
+                        self.errors += 1
+                        status, response = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+
+                payload = json.dumps(response).encode("utf-8")
+                writer.write((f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                              f"Content-Type: application/json\r\n"
+                              f"Content-Length: {len(payload)}\r\n"
+                              f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode("latin-1")
+                             + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass  # client went away or sent garbage, just close the connection
+        finally:
+            writer.close()
+
+    async def start(self, host: str = RAG_SERVER_HOST, port: int = RAG_SERVER_PORT) -> asyncio.Server:
+        """Start listening, port 0 picks a free port (see server.sockets)."""
+        return await asyncio.start_server(self._handle_connection, host, port)
+
+
+async def serve(server: RAGServer, host: str, port: int) -> None:
+    http_server = await server.start(host, port)
+    print(f"Serving RAG on http://{host}:{http_server.sockets[0].getsockname()[1]}")
+    async with http_server:
+        await http_server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Async multi-session RAG server")
+    parser.add_argument("--host", default=RAG_SERVER_HOST)
+    parser.add_argument("--port", type=int, default=RAG_SERVER_PORT)
+    parser.add_argument("--max-llm-requests", type=int, default=RAG_SERVER_MAX_LLM_REQUESTS)
+    parser.add_argument("--max-embedding-requests", type=int, default=RAG_SERVER_MAX_EMBEDDING_REQUESTS)
+    args = parser.parse_args()
+
+    start_health_checks()
+    embeddings = create_embeddings()
+    vectorstore, lexical_index = open_index(embeddings)
+    reranker = create_reranker(workers=RAG_SERVER_RERANK_WORKERS)
+    embedding_dispatcher = None
+    if RAG_SERVER_EMBEDDING_BATCH_SIZE > 0:
+        # The model behind the disk cache, questions are not cached on disk
+        embedding_dispatcher = EmbeddingDispatcher(embeddings.embeddings,
+                                                   max_batch_size=RAG_SERVER_EMBEDDING_BATCH_SIZE,
+                                                   max_wait_ms=RAG_SERVER_EMBEDDING_MAX_WAIT_MS,
+                                                   max_in_flight=args.max_embedding_requests)
+    server = RAGServer(vectorstore, create_llm(), create_context_packer(), lexical_index=lexical_index,
+                       cache=RetrievalCache(maxsize=RAG_CACHE_MAX_ENTRIES, ttl=RAG_CACHE_TTL_SECONDS),
+                       reranker=reranker, max_llm_requests=args.max_llm_requests,
+                       max_embedding_requests=args.max_embedding_requests, max_sessions=RAG_SERVER_MAX_SESSIONS,
+                       enrich_mode=RAG_SERVER_ENRICH_MODE, prompt_mode=RAG_PROMPT_MODE,
+                       rag_kwargs={"k": RAG_TOP_K, "search_kwargs": {"exact": RAG_INDEX_MODE == "exact"},
+                                   "retrieval_mode": RAG_RETRIEVAL_MODE, "fetch_k": RAG_HYBRID_FETCH_K,
+                                   "mmr_lambda": RAG_MMR_LAMBDA, "duplicate_threshold": RAG_DUPLICATE_THRESHOLD},
+                       embedding_dispatcher=embedding_dispatcher)
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if reranker is not None:
+            reranker.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Streaming of LLM answers to the console with incremental Markdown rendering.
+
+The answer is rendered with rich.live while the chunks arrive, so the user sees text as soon as the
+model produces it. Time to first token and the token throughput are measured per answer.
+"""
+
+import time
+
+from dataclasses import dataclass
+from typing import Callable
+
+from langchain_core.language_models import BaseChatModel
+from rich.console import Console, ConsoleOptions, RenderResult
+from rich.live import Live
+from rich.markdown import Markdown
+
+from tokenhelper import _estimate_text_tokens
+
+
+@dataclass
+class StreamStats:
+    """Timing of a streamed answer, all times in seconds."""
+    time_to_first_token: float | None
+    total_seconds: float
+    tokens: int
+
+    @property
+    def tokens_per_second(self) -> float:
+        """Output tokens per second after the first token arrived."""
+        if self.time_to_first_token is None:
+            return 0.0
+        generation = self.total_seconds - self.time_to_first_token
+        return self.tokens / generation if generation > 0 else 0.0
+
+    def __str__(self) -> str:
+        ttft = f"{self.time_to_first_token:.2f}s" if self.time_to_first_token is not None else "-"
+        return (f"time to first token {ttft}, {self.tokens} tokens in {self.total_seconds:.2f}s "
+                f"({self.tokens_per_second:.1f} tokens/s)")
+
+
+class _StreamedMarkdown:
+    """
+    Renderable of the answer so far, the Markdown is only parsed when it is drawn.
+
+    rich parses the markup when a Markdown is created, creating one per chunk would re-parse the whole answer
+    for every chunk on the streaming thread. Live draws at most refresh_per_second times, on its own thread.
+    """
+
+    def __init__(self, style: str):
+        self.style = style
+        self.parts: list[str] = []
+        self._markdown = Markdown("", style=style)
+        self._parsed_parts = 0
+
+    def append(self, text: str) -> None:
+        self.parts.append(text)
+
+    def __rich_console__(self, console: Console, options: ConsoleOptions) -> RenderResult:
+        parts = len(self.parts)
+        if parts != self._parsed_parts:
+            self._markdown = Markdown("".join(self.parts[:parts]), style=self.style)
+            self._parsed_parts = parts
+        yield self._markdown
+
+
+def stream_markdown(llm: BaseChatModel, messages: list, console: Console, style: str = "blue",
+                    refresh_per_second: float = 8,
+                    token_counter: Callable[[str], int] = _estimate_text_tokens) -> tuple[str, StreamStats]:
+    """
+    Stream the answer of llm for messages and render it live as Markdown.
+
+    Args:
+        llm: The chat model, its stream() method is used.
+        messages: The prompt messages.
+        console: Console to render to.
+        style: Style of the rendered Markdown.
+        refresh_per_second: Max redraws per second, the Markdown is parsed at most once per redraw.
+        token_counter: Used if the model doesn't report its output token count.
+    Returns:
+        The complete answer and its StreamStats.
+    """
+    markdown = _StreamedMarkdown(style)
+    output_tokens = None
+    time_to_first_token = None
+    start = time.perf_counter()
+
+    with Live(markdown, console=console, refresh_per_second=refresh_per_second,
+              vertical_overflow="visible"):
+        for chunk in llm.stream(messages):
+            usage = getattr(chunk, "usage_metadata", None)
+            if usage:
+                output_tokens = usage.get("output_tokens", output_tokens)
+            if not chunk.content:
+                continue
+            if time_to_first_token is None:
+                time_to_first_token = time.perf_counter() - start
+            markdown.append(chunk.content)
+
+    answer = "".join(markdown.parts)
+    stats = StreamStats(time_to_first_token=time_to_first_token, total_seconds=time.perf_counter() - start,
+                        tokens=output_tokens if output_tokens is not None else token_counter(answer))
+    return answer, stats
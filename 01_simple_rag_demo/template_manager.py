@@ -0,0 +1,74 @@
+"""
+Compile-once Jinja2 template manager.
+
+Templates are loaded and compiled once, later renders reuse the compiled template and only check the file
+modification time, a template is reloaded only if its file changed. Compiled bytecode can be cached on
+disk, so even the first render after a restart skips the compilation.
+"""
+
+import threading
+import time
+
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
+
+
+class TemplateManager:
+    """
+    Loads, compiles and renders the templates of one directory.
+
+    Render calls are timed, stats() returns the number of renders, (re)loads and the mean render time,
+    so the per query template overhead can be measured.
+    """
+
+    def __init__(self, directory: str | Path, bytecode_cache_dir: str | Path | None = None,
+                 preload: tuple[str, ...] | list[str] = ()):
+        """
+        Args:
+            directory: Directory containing the templates.
+            bytecode_cache_dir: Directory for compiled template bytecode, None disables the disk cache.
+            preload: Template names compiled right away (e.g. at startup).
+        """
+        bytecode_cache = None
+        if bytecode_cache_dir is not None:
+            Path(bytecode_cache_dir).mkdir(parents=True, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(str(bytecode_cache_dir))
+
+        # auto_reload compares the file mtime on every lookup and recompiles only if it changed
+        self.environment = Environment(loader=FileSystemLoader(str(directory)), auto_reload=True,
+                                       bytecode_cache=bytecode_cache)
+        self._lock = threading.Lock()
+        self._templates: dict[str, Template] = {}
+        self.loads = 0
+        self.renders = 0
+        self.render_seconds = 0.0
+
+        for name in preload:
+            self.get(name)
+
+    def get(self, name: str) -> Template:
+        """Return the compiled template, it is reloaded if its file changed since the last call."""
+        template = self.environment.get_template(name)
+        with self._lock:
+            if self._templates.get(name) is not template:
+                self._templates[name] = template
+                self.loads += 1
+        return template
+
+    def render(self, template_name: str, /, **context) -> str:
+        """Render the template template_name with the given context."""
+        start = time.perf_counter()
+        result = self.get(template_name).render(**context)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.renders += 1
+            self.render_seconds += elapsed
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "loads": self.loads,
+            "renders": self.renders,
+            "mean_render_us": 1e6 * self.render_seconds / self.renders if self.renders else 0.0,
+        }
@@ -0,0 +1,100 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from ann_index import IVFIndex, recall_at_k
+from numpy_vectorstore import NumpyVectorStore
+
+
+def clustered_vectors(rows, dim=32, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim))
+    vectors = centers[rng.integers(clusters, size=rows)] + 0.3 * rng.standard_normal((rows, dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+class TestIVFIndex(unittest.TestCase):
+    def setUp(self):
+        self.vectors = clustered_vectors(3000)
+        self.queries = clustered_vectors(50, seed=1)
+
+    def test_untrained_index_returns_none(self):
+        index = IVFIndex(min_train_size=10_000)
+        index.sync(self.vectors)
+        self.assertFalse(index.is_trained)
+        self.assertIsNone(index.search(self.vectors, self.queries[0], 5))
+
+    def test_probing_all_lists_is_exact(self):
+        index = IVFIndex(nlist=16, min_train_size=0)
+        index.train(self.vectors)
+        report = recall_at_k(self.vectors, index, self.queries, k=10, nprobe=16)
+        self.assertEqual(report["recall@10"], 1.0)
+        self.assertEqual(report["nlist"], 16)
+
+    def test_recall_grows_with_nprobe(self):
+        index = IVFIndex(nlist=64, min_train_size=0)
+        index.train(self.vectors)
+        low = recall_at_k(self.vectors, index, self.queries, k=10, nprobe=1)["recall@10"]
+        high = recall_at_k(self.vectors, index, self.queries, k=10, nprobe=16)["recall@10"]
+        self.assertGreaterEqual(high, low)
+        self.assertGreater(high, 0.9)
+
+
+class TestVectorStoreWithIndex(unittest.TestCase):
+    def setUp(self):
+        self.embedding = DeterministicFakeEmbedding(size=32)
+        self.texts = [f"entry {i}" for i in range(300)]
+        self.ids = [f"id{i}" for i in range(300)]
+
+    def _store(self, **index_kwargs):
+        store = NumpyVectorStore(embedding=self.embedding,
+                                 index=IVFIndex(nlist=8, nprobe=8, min_train_size=100, **index_kwargs))
+        store.add_texts(self.texts, ids=self.ids)
+        return store
+
+    def _assert_same_as_exact(self, store, queries):
+        for query in queries:
+            approximate = store.similarity_search_with_score(query, k=5)
+            exact = store.similarity_search_with_score(query, k=5, exact=True)
+            self.assertEqual([doc.id for doc, _ in approximate], [doc.id for doc, _ in exact])
+
+    def test_index_is_trained_on_demand_and_follows_changes(self):
+        store = self._store()
+        self.assertFalse(store.index.is_trained)
+        self._assert_same_as_exact(store, ["entry 1", "entry 150"])
+        self.assertTrue(store.index.is_trained)
+
+        store.delete([f"id{i}" for i in range(0, 300, 3)])
+        store.add_texts(["brand new", "entry 151"], ids=["new", "id151"])
+        self._assert_same_as_exact(store, ["entry 4", "brand new", "entry 151", "entry 299"])
+        self.assertEqual(store.similarity_search("brand new", k=1)[0].id, "new")
+
+    def test_save_and_load_keeps_index(self):
+        store = self._store()
+        store.similarity_search("entry 1")
+        with tempfile.TemporaryDirectory() as tmp:
+            store.save(tmp)
+            index = IVFIndex(nlist=8, nprobe=8, min_train_size=100)
+            loaded = NumpyVectorStore.load(tmp, embedding=self.embedding, index=index)
+            self.assertTrue(index.is_trained)
+            np.testing.assert_array_equal(index.centroids, store.index.centroids)
+            self._assert_same_as_exact(loaded, ["entry 7", "entry 250"])
+
+    def test_sync_index_reports_training(self):
+        store = self._store()
+        self.assertTrue(store.sync_index())
+        self.assertFalse(store.sync_index())
+        with tempfile.TemporaryDirectory() as tmp:
+            store.save(tmp)
+            loaded = NumpyVectorStore.load(tmp, embedding=self.embedding,
+                                           index=IVFIndex(nlist=8, nprobe=8, min_train_size=100))
+            # The saved centroids fit, nothing to train (and to save) after a restart
+            self.assertFalse(loaded.sync_index())
+
+
+if __name__ == "__main__":
+    unittest.main()
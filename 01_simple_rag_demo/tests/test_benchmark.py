@@ -0,0 +1,84 @@
+import json
+import tempfile
+import unittest
+
+from pathlib import Path
+
+import numpy as np
+
+from benchmark import (HashingEmbeddings, build_index, latency_summary, load_questions, main, recall_at_k,
+                       reciprocal_rank, run_benchmark)
+
+DOCUMENTS = {
+    "brakka.md": "# Brakka\n\n## Background\nA troll smith who forges tools for the grove.\n",
+    "pipkin.md": "# Pipkin\n\n## Background\nA goblin scout who sells paths through the forest.\n",
+    "grond.md": "# Grond\n\n## Background\nAn ogre mercenary who protects caravans on the Titan Road.\n",
+}
+
+
+class TestMetrics(unittest.TestCase):
+    def test_recall_at_k(self):
+        self.assertEqual(recall_at_k(["a", "b", "c"], ["b", "d"], k=2), 0.5)
+        self.assertEqual(recall_at_k(["a", "b", "c"], ["c"], k=2), 0.0)
+
+    def test_reciprocal_rank(self):
+        self.assertEqual(reciprocal_rank(["a", "b", "c"], ["c", "b"]), 0.5)
+        self.assertEqual(reciprocal_rank(["a"], ["b"]), 0.0)
+
+    def test_latency_summary_in_milliseconds(self):
+        summary = latency_summary([i / 1000 for i in range(1, 101)])
+        self.assertAlmostEqual(summary["p50"], 50.5)
+        self.assertAlmostEqual(summary["p99"], 99.01)
+        self.assertEqual(summary["count"], 100)
+
+    def test_hashing_embeddings_are_deterministic_and_normalized(self):
+        embeddings = HashingEmbeddings(size=64)
+        vector = embeddings.embed_query("Brakka the troll smith")
+        self.assertEqual(vector, embeddings.embed_documents(["brakka THE troll smith"])[0])
+        self.assertAlmostEqual(float(np.linalg.norm(vector)), 1.0, places=5)
+
+
+class TestBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.documents_dir = Path(self.tmp_dir.name) / "documents"
+        self.documents_dir.mkdir()
+        for filename, text in DOCUMENTS.items():
+            (self.documents_dir / filename).write_text(text, encoding="utf-8")
+        self.questions = [{"question": "Who forges tools for the grove?", "expected": ["brakka.md"]},
+                          {"question": "Who protects caravans?", "expected": ["grond.md"]}]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_run_benchmark_reports_quality_and_stage_latencies(self):
+        vectorstore, lexical_index = build_index(HashingEmbeddings(), self.documents_dir)
+        report = run_benchmark(self.questions, vectorstore, lexical_index, repeat=2, k=1, threshold=0.0,
+                               retrieval_mode="hybrid")
+        self.assertEqual(report["metrics"]["recall@1"], 1.0)
+        self.assertEqual(report["metrics"]["mrr"], 1.0)
+        for stage in ["embed", "search", "select", "render", "total"]:
+            self.assertEqual(report["latency_ms"][stage]["count"], 4)
+        self.assertNotIn("llm", report["latency_ms"])
+        self.assertEqual(report["questions"][1]["retrieved"], ["grond.md"])
+
+    def test_load_questions_requires_labels(self):
+        path = Path(self.tmp_dir.name) / "questions.json"
+        path.write_text(json.dumps([{"question": "Who?"}]), encoding="utf-8")
+        with self.assertRaises(ValueError):
+            load_questions(path)
+
+    def test_cli_writes_json(self):
+        questions = Path(self.tmp_dir.name) / "questions.json"
+        questions.write_text(json.dumps(self.questions), encoding="utf-8")
+        output = Path(self.tmp_dir.name) / "results" / "report.json"
+        main(["--questions", str(questions), "--documents", str(self.documents_dir), "--k", "2",
+              "--repeat", "1", "--reranker", "none", "--output", str(output)])
+        report = json.loads(output.read_text(encoding="utf-8"))
+        self.assertIn("recall@2", report["metrics"])
+        self.assertEqual(report["config"]["k"], 2)
+        self.assertEqual(report["index"]["chunks"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import tempfile
+import unittest
+
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+from bm25 import BM25Index, hybrid_fusion, reciprocal_rank_fusion, similarity_floor, tokenize
+from numpy_vectorstore import NumpyVectorStore
+
+TEXTS = {
+    "brakka#0": "Brakka — Troll Smith\nBrakka forges heavy armor for the guardians.",
+    "jorun#0": "Jorun Draft\nAn adept of the Ordo Magica, studies the arts of fire.",
+    "pipkin#0": "Pipkin\nA goblin scout who knows every path of the Davokar wood.",
+}
+
+
+class TestBM25Index(unittest.TestCase):
+    def setUp(self):
+        self.index = BM25Index()
+        self.index.add(TEXTS.keys(), TEXTS.values())
+
+    def test_tokenize_case_folds(self):
+        self.assertEqual(tokenize("Ordo MAGICA, fire!"), ["ordo", "magica", "fire"])
+
+    def test_exact_names_rank_first(self):
+        self.assertEqual(self.index.search("Who is Brakka?", k=1)[0][0], "brakka#0")
+        self.assertEqual(self.index.search("ordo magica", k=3)[0][0], "jorun#0")
+
+    def test_only_matching_chunks_are_returned(self):
+        self.assertEqual([doc_id for doc_id, _ in self.index.search("goblin", k=3)], ["pipkin#0"])
+        self.assertEqual(self.index.search("dragon", k=3), [])
+
+    def test_add_replaces_and_delete_removes(self):
+        self.index.add(["pipkin#0"], ["Pipkin rides a dragon"])
+        self.assertEqual(self.index.search("goblin", k=3), [])
+        self.assertEqual(self.index.search("dragon", k=3)[0][0], "pipkin#0")
+        self.index.delete(["pipkin#0", "unknown"])
+        self.assertNotIn("pipkin#0", self.index)
+        self.assertEqual(self.index.search("dragon", k=3), [])
+        self.assertEqual(len(self.index), 2)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertFalse(BM25Index.exists(directory))
+            self.index.save(directory)
+            self.assertTrue(BM25Index.exists(directory))
+            loaded = BM25Index.load(directory)
+        self.assertEqual(loaded.search("troll armor", k=3), self.index.search("troll armor", k=3))
+
+
+class TestFusion(unittest.TestCase):
+    def test_reciprocal_rank_fusion_prefers_ids_found_by_both(self):
+        fused = reciprocal_rank_fusion([["a", "b"], ["b", "c"]], k=60)
+        self.assertEqual([doc_id for doc_id, _ in fused], ["b", "a", "c"])
+        self.assertAlmostEqual(fused[0][1], 1 / 62 + 1 / 61)
+
+    def test_hybrid_fusion_fetches_lexical_only_documents(self):
+        store = NumpyVectorStore(embedding=DeterministicFakeEmbedding(size=16))
+        store.add_texts(list(TEXTS.values()), ids=list(TEXTS.keys()))
+        dense = [(store.get_by_ids(["pipkin#0"])[0], 0.5)]
+        lexical = [("jorun#0", 3.2), ("pipkin#0", 1.0)]
+
+        results = hybrid_fusion(store, dense, lexical, k=2)
+
+        self.assertEqual([doc.id for doc, _ in results], ["pipkin#0", "jorun#0"])
+        self.assertIn("Ordo Magica", results[1][0].page_content)
+
+    def test_similarity_floor_applies_the_threshold_to_lexical_only_results(self):
+        store = NumpyVectorStore(embedding=DeterministicFakeEmbedding(size=16))
+        store.add_texts(list(TEXTS.values()), ids=list(TEXTS.keys()))
+        query_vector = store.get_vectors(["jorun#0"])[0]
+        similarity = store.get_vectors(["brakka#0"])[0] @ query_vector
+        lexical = [("brakka#0", 3.2), ("jorun#0", 2.0), ("pipkin#0", 1.0), ("unknown#0", 0.5)]
+
+        kept = similarity_floor(store, lexical, query_vector, threshold=0.99, known_scores={"pipkin#0": 0.1})
+        self.assertEqual([doc_id for doc_id, _ in kept], ["jorun#0", "unknown#0"])
+
+        kept = similarity_floor(store, lexical, query_vector, threshold=float(similarity) - 1e-6)
+        self.assertIn("brakka#0", [doc_id for doc_id, _ in kept])
+
+
+class FixedEmbeddings(Embeddings):
+    """Returns the given vector per text."""
+
+    def __init__(self, vectors: dict[str, list[float]]):
+        self.vectors = vectors
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.vectors[text]
+
+
+class TestHybridRetrieval(unittest.TestCase):
+    def test_exact_name_below_the_dense_threshold_reaches_the_top_k(self):
+        from rag import get_rag
+
+        question = "Who is Brakka?"
+        chunks = {  # text: vector, the question is [1, 0, 0] so the first value is the similarity
+            "Brakka forges heavy armor.": [0.2, 0.98, 0.0],
+            "The caravan guards watch the road.": [0.9, 0.436, 0.0],
+            "Druids tend the grove.": [0.8, 0.0, 0.6],
+            "A cousin of Brakka sells fish far away.": [-0.5, 0.0, 0.866],
+        }
+        store = NumpyVectorStore(embedding=FixedEmbeddings({question: [1.0, 0.0, 0.0], **chunks}))
+        ids = [f"chunk{i}" for i in range(len(chunks))]
+        store.add_texts(list(chunks), ids=ids)
+        lexical_index = BM25Index()
+        lexical_index.add(ids, list(chunks))
+
+        trace = {}
+        get_rag(question, store, llm=None, enrich_with_context=False, print_question=False, threshold=0.25,
+                lexical_threshold=0.1, k=2, retrieval_mode="hybrid", lexical_index=lexical_index, fetch_k=4,
+                trace=trace)
+
+        selected = [result["page_content"] for result in trace["results"]]
+        self.assertEqual(selected, ["The caravan guards watch the road.", "Brakka forges heavy armor."])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+
+from chunker import MarkdownChunker, WholeDocumentChunker
+from tokenhelper import _estimate_text_tokens
+
+DOCUMENT = """# Brakka — Troll Smith
+
+- Ancestry: Troll
+- Origin: Deep Davokar
+
+## Core Skills
+- Heavy armor craft and repair
+- Stone shaping and patient watches
+
+```
+# not a heading
+```
+
+## Goals
+Replace broken oaths with new ones that make sense.
+"""
+
+
+class TestChunker(unittest.TestCase):
+    def test_whole_document_chunker(self):
+        chunks = WholeDocumentChunker().split(DOCUMENT, "brakka.md")
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(chunks[0].text, DOCUMENT)
+        self.assertEqual(WholeDocumentChunker().split("  \n", "empty.md"), [])
+
+    def test_sections_get_heading_path_and_offset(self):
+        chunks = MarkdownChunker(max_tokens=500, overlap_tokens=0).split(DOCUMENT, "brakka.md")
+        paths = [chunk.metadata["heading_path"] for chunk in chunks]
+        self.assertEqual(paths, [
+            "Brakka — Troll Smith",
+            "Brakka — Troll Smith > Core Skills",
+            "Brakka — Troll Smith > Goals",
+        ])
+        self.assertEqual([chunk.metadata["chunk"] for chunk in chunks], [0, 1, 2])
+        self.assertTrue(all(chunk.metadata["filename"] == "brakka.md" for chunk in chunks))
+
+        skills = chunks[1]
+        self.assertTrue(skills.text.startswith("Brakka — Troll Smith > Core Skills\n- Heavy armor"))
+        # The fenced block belongs to the section, its '#' line is no heading
+        self.assertIn("# not a heading", skills.text)
+        self.assertTrue(DOCUMENT[skills.metadata["offset"]:].startswith("- Heavy armor"))
+
+    def test_chunks_respect_token_budget(self):
+        chunker = MarkdownChunker(max_tokens=20, overlap_tokens=0)
+        chunks = chunker.split(DOCUMENT, "brakka.md")
+        self.assertGreater(len(chunks), 3)
+        for chunk in chunks:
+            self.assertLessEqual(_estimate_text_tokens(chunk.text), 20)
+
+    def test_overlap_repeats_trailing_lines(self):
+        text = "# T\n" + "".join(f"line {i}\n" for i in range(6))
+        chunks = MarkdownChunker(max_tokens=7, overlap_tokens=2).split(text, "t.md")
+        self.assertEqual([chunk.text for chunk in chunks], [
+            "T\nline 0\nline 1\nline 2",
+            "T\nline 2\nline 3\nline 4",
+            "T\nline 4\nline 5",
+        ])
+
+    def test_long_line_is_split_at_words(self):
+        text = " ".join(f"w{i}" for i in range(10))
+        chunks = MarkdownChunker(max_tokens=4, overlap_tokens=0).split(text, "long.md")
+        self.assertEqual([chunk.text for chunk in chunks], ["w0 w1 w2 w3", "w4 w5 w6 w7", "w8 w9"])
+        self.assertEqual([chunk.metadata["offset"] for chunk in chunks], [0, 12, 24])
+
+    def test_invalid_configuration(self):
+        with self.assertRaises(ValueError):
+            MarkdownChunker(max_tokens=0)
+        with self.assertRaises(ValueError):
+            MarkdownChunker(max_tokens=10, overlap_tokens=10)
+
+
+if __name__ == "__main__":
+    unittest.main()
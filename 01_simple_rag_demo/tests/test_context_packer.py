@@ -0,0 +1,58 @@
+import unittest
+
+from context_packer import ContextPacker, pack_by_score
+
+
+class TestPackByScore(unittest.TestCase):
+    def test_prefers_score_per_token(self):
+        # The long chunk has the best score but the two short ones are worth more per token
+        self.assertEqual(pack_by_score([0.9, 0.8, 0.7], [100, 10, 10], budget=50), [1, 2])
+
+    def test_fills_remaining_budget(self):
+        self.assertEqual(pack_by_score([0.9, 0.5, 0.1], [10, 40, 5], budget=20), [0, 2])
+
+    def test_negative_scores(self):
+        self.assertEqual(pack_by_score([-2.0, 3.0], [10, 10], budget=10), [1])
+
+    def test_empty(self):
+        self.assertEqual(pack_by_score([], [], budget=10), [])
+
+
+class TestContextPacker(unittest.TestCase):
+    def setUp(self):
+        # One token per character keeps the numbers readable
+        self.packer = ContextPacker(200, output_tokens=50, chunk_share=0.5, token_counter=len)
+
+    def test_split(self):
+        budget = self.packer.split("s" * 16, "q" * 5)
+        self.assertEqual(budget.system, 4 + 6 + 16)
+        self.assertEqual(budget.question, 4 + 5 + 5)
+        self.assertEqual(budget.chunks + budget.history, 200 - 50 - 26 - 14)
+        self.assertEqual(budget.chunks, 55)
+
+    def test_split_never_negative(self):
+        budget = self.packer.split("s" * 500, "q")
+        self.assertEqual((budget.chunks, budget.history), (0, 0))
+
+    def test_pack_chunks(self):
+        kept, tokens = self.packer.pack_chunks(["a" * 40, "b" * 30, "c" * 20], [0.9, 0.8, 0.7], budget=55)
+        self.assertEqual(kept, [1, 2])
+        self.assertEqual(tokens, 50)
+
+    def test_history_gets_unused_chunk_budget_and_keeps_newest(self):
+        budget = self.packer.split("s" * 16, "q" * 5)
+        history = [("human", "x" * 40), ("assistant", "y" * 40), ("human", "z" * 40)]
+
+        kept, report = self.packer.pack_history(history, budget, chunk_tokens=budget.chunks)
+        self.assertEqual(kept, history[2:])
+        self.assertEqual(report.dropped_messages, 2)
+
+        kept, report = self.packer.pack_history(history, budget, chunk_tokens=0)
+        self.assertEqual(kept, history[1:])
+        self.assertEqual(report.history_tokens, 4 + 9 + 40 + 4 + 5 + 40)
+        self.assertLessEqual(report.prompt_tokens, 200 - 50)
+        self.assertIn("dropped 1 history messages", str(report))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from bm25 import BM25Index
+from chunker import MarkdownChunker
+from document_index import CachedEmbeddings, DocumentIndexer
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    """Deterministic fake embeddings that count how many texts were embedded."""
+    embedded_texts: int = 0
+
+    def embed_documents(self, texts):
+        self.embedded_texts += len(texts)
+        return super().embed_documents(texts)
+
+
+class TestDocumentIndex(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = Path(self._tmp.name)
+        self.docs = self.tmp / "documents"
+        self.docs.mkdir()
+        (self.docs / "a.md").write_text("Brakka the troll smith", encoding="utf-8")
+        (self.docs / "b.md").write_text("Pipkin the goblin scout", encoding="utf-8")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _start(self, chunker=None):
+        """Simulate an application start: fresh model, persisted store and manifest from disk."""
+        model = CountingEmbedding(size=8)
+        embeddings = CachedEmbeddings(model, cache_dir=self.tmp / "cache")
+        store_path = self.tmp / "store.json"
+        if store_path.is_file():
+            store = InMemoryVectorStore.load(str(store_path), embedding=embeddings)
+        else:
+            store = InMemoryVectorStore(embedding=embeddings)
+        indexer = DocumentIndexer(store, manifest_path=self.tmp / "manifest.json", chunker=chunker)
+        stats = indexer.sync(self.docs)
+        if stats.changed:
+            store.dump(str(store_path))
+        return model, embeddings, store, stats
+
+    def test_cache_deduplicates_and_hits(self):
+        model = CountingEmbedding(size=8)
+        embeddings = CachedEmbeddings(model, cache_dir=self.tmp / "cache")
+        first = embeddings.embed_documents(["x", "y", "x"])
+        self.assertEqual(model.embedded_texts, 2)
+        second = embeddings.embed_documents(["y", "x"])
+        self.assertEqual(model.embedded_texts, 2)
+        self.assertEqual(second, [first[1], first[0]])
+        self.assertEqual(embeddings.embedding_calls, 1)
+
+    def test_warm_restart_makes_no_embedding_calls(self):
+        model, _, _, stats = self._start()
+        self.assertEqual(sorted(stats.added), ["a.md", "b.md"])
+        self.assertEqual(model.embedded_texts, 2)
+
+        model, embeddings, store, stats = self._start()
+        self.assertFalse(stats.changed)
+        self.assertEqual(sorted(stats.unchanged), ["a.md", "b.md"])
+        self.assertEqual(model.embedded_texts, 0)
+        self.assertEqual(embeddings.embedding_calls, 0)
+        self.assertEqual(len(store.get_by_ids(["a.md#0", "b.md#0"])), 2)
+
+    def test_only_changed_files_are_embedded_and_deleted_dropped(self):
+        self._start()
+        (self.docs / "a.md").write_text("Brakka the troll smith, now retired", encoding="utf-8")
+        (self.docs / "b.md").unlink()
+        (self.docs / "c.md").write_text("Mirel the changeling spy", encoding="utf-8")
+
+        model, _, store, stats = self._start()
+        self.assertEqual(stats.updated, ["a.md"])
+        self.assertEqual(stats.removed, ["b.md"])
+        self.assertEqual(stats.added, ["c.md"])
+        self.assertEqual(model.embedded_texts, 2)
+        self.assertEqual(store.get_by_ids(["b.md#0"]), [])
+        self.assertIn("retired", store.get_by_ids(["a.md#0"])[0].page_content)
+
+    def test_lost_vectorstore_is_rebuilt_from_cache(self):
+        self._start()
+        (self.tmp / "store.json").unlink()
+
+        model, _, store, stats = self._start()
+        self.assertEqual(sorted(stats.updated), ["a.md", "b.md"])
+        self.assertEqual(model.embedded_texts, 0)
+        self.assertEqual(len(store.get_by_ids(["a.md#0", "b.md#0"])), 2)
+
+    def test_changed_chunker_reindexes_everything(self):
+        self._start()
+        model, _, store, stats = self._start(chunker=MarkdownChunker(max_tokens=3, overlap_tokens=0))
+        self.assertEqual(sorted(stats.updated), ["a.md", "b.md"])
+        self.assertEqual(model.embedded_texts, 4)
+        self.assertEqual(store.get_by_ids(["a.md#0"])[0].page_content, "Brakka the troll")
+        self.assertEqual(store.get_by_ids(["a.md#1"])[0].page_content, "smith")
+
+    def test_progress_counts_tokens_with_the_chunker_token_counter(self):
+        store = InMemoryVectorStore(embedding=DeterministicFakeEmbedding(size=8))
+        progress = []
+        indexer = DocumentIndexer(store, manifest_path=self.tmp / "manifest.json",
+                                  chunker=MarkdownChunker(token_counter=len), on_progress=progress.append)
+        indexer.sync(self.docs)
+        # Characters, not the 4 + 4 words of the regex estimate
+        self.assertEqual(progress[-1].tokens, len("Brakka the troll smith") + len("Pipkin the goblin scout"))
+        self.assertEqual(progress[-1].done, 2)
+
+    def test_lexical_index_follows_the_vector_store(self):
+        store = InMemoryVectorStore(embedding=CountingEmbedding(size=8))
+        lexical_index = BM25Index()
+        indexer = DocumentIndexer(store, manifest_path=self.tmp / "manifest.json", lexical_index=lexical_index)
+        indexer.sync(self.docs)
+        self.assertEqual(lexical_index.search("goblin", k=2)[0][0], "b.md#0")
+
+        (self.docs / "b.md").unlink()
+        indexer.sync(self.docs)
+        self.assertEqual(lexical_index.search("goblin", k=2), [])
+        self.assertEqual(len(lexical_index), 1)
+
+    def test_missing_lexical_index_is_rebuilt(self):
+        self._start()
+        store = InMemoryVectorStore.load(str(self.tmp / "store.json"), embedding=CountingEmbedding(size=8))
+        lexical_index = BM25Index()
+        indexer = DocumentIndexer(store, manifest_path=self.tmp / "manifest.json", lexical_index=lexical_index)
+        stats = indexer.sync(self.docs)
+        self.assertEqual(sorted(stats.updated), ["a.md", "b.md"])
+        self.assertEqual(len(lexical_index), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import asyncio
+import unittest
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from embedding_dispatcher import EmbeddingDispatcher
+
+
+class BatchRecordingEmbedding(DeterministicFakeEmbedding):
+    """Fake embeddings that record the texts of every aembed_documents request."""
+    batches: list = []
+    fail: bool = False
+
+    async def aembed_documents(self, texts):
+        self.batches.append(list(texts))
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise RuntimeError("server down")
+        return self.embed_documents(texts)
+
+
+class TestEmbeddingDispatcher(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.embedding = BatchRecordingEmbedding(size=8, batches=[])
+
+    async def test_concurrent_queries_are_batched(self):
+        dispatcher = EmbeddingDispatcher(self.embedding, max_batch_size=4, max_wait_ms=50)
+        texts = [f"question {i}" for i in range(10)]
+        vectors = await asyncio.gather(*[dispatcher.aembed_query(text) for text in texts])
+
+        self.assertEqual([len(batch) for batch in self.embedding.batches], [4, 4, 2])
+        for text, vector in zip(texts, vectors):
+            self.assertEqual(vector, self.embedding.embed_query(text))
+        self.assertEqual(dispatcher.stats()["batches"], 3)
+
+    async def test_identical_texts_are_embedded_once(self):
+        dispatcher = EmbeddingDispatcher(self.embedding, max_wait_ms=5)
+        vectors = await asyncio.gather(*[dispatcher.aembed_query("Who is Brakka?") for _ in range(5)])
+        self.assertEqual(self.embedding.batches, [["Who is Brakka?"]])
+        self.assertTrue(all(vector == vectors[0] for vector in vectors))
+        self.assertEqual(dispatcher.stats()["deduplicated"], 4)
+
+    async def test_single_query_waits_at_most_max_wait(self):
+        dispatcher = EmbeddingDispatcher(self.embedding, max_wait_ms=20)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await dispatcher.aembed_query("Who is Brakka?")
+        # 20 ms window + 10 ms fake request, with generous slack for slow machines
+        self.assertLess(loop.time() - start, 0.5)
+        self.assertEqual(len(self.embedding.batches), 1)
+
+    async def test_errors_reach_every_caller(self):
+        self.embedding.fail = True
+        dispatcher = EmbeddingDispatcher(self.embedding, max_wait_ms=5)
+        results = await asyncio.gather(dispatcher.aembed_query("a"), dispatcher.aembed_query("b"),
+                                       return_exceptions=True)
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+
+    async def test_cancelled_caller_keeps_shared_vector(self):
+        dispatcher = EmbeddingDispatcher(self.embedding, max_wait_ms=20)
+        first = asyncio.ensure_future(dispatcher.aembed_query("Who is Brakka?"))
+        second = asyncio.ensure_future(dispatcher.aembed_query("Who is Brakka?"))
+        await asyncio.sleep(0)
+        first.cancel()
+        self.assertEqual(await second, self.embedding.embed_query("Who is Brakka?"))
+
+
+if __name__ == "__main__":
+    unittest.main()
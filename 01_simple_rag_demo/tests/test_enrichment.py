@@ -0,0 +1,76 @@
+import threading
+import unittest
+
+import numpy as np
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from enrichment import EmbeddingQueryExpander, RollingSummary
+
+
+class BlockingChatModel(FakeListChatModel):
+    """Fake chat model that waits for a release event before answering."""
+    prompts: list = []
+
+    def model_post_init(self, context):
+        self._release = threading.Event()
+
+    def invoke(self, input, config=None, **kwargs):
+        self.prompts.append(input)
+        self._release.wait(timeout=5)
+        return super().invoke(input, config, **kwargs)
+
+
+class TestRollingSummary(unittest.TestCase):
+    def test_current_never_waits_for_running_update(self):
+        llm = BlockingChatModel(responses=["Summary one", "Summary two"], prompts=[])
+        summary = RollingSummary(llm, "Summarize")
+
+        summary.update("Who is Brakka?", "A troll smith.")
+        self.assertEqual(summary.current(), "")  # the update is still running
+
+        llm._release.set()
+        summary.wait(timeout=5)
+        self.assertEqual(summary.current(), "Summary one")
+
+        summary.update("What are his goals?", "New oaths.")
+        summary.wait(timeout=5)
+        self.assertEqual(summary.current(), "Summary two")
+        # The second update builds on the first summary
+        self.assertIn("Summary one", llm.prompts[1][1][1])
+        summary.close()
+
+    def test_failed_update_keeps_old_summary(self):
+        class FailingModel(FakeListChatModel):
+            def invoke(self, input, config=None, **kwargs):
+                raise RuntimeError("server down")
+
+        summary = RollingSummary(FailingModel(responses=[]), "Summarize")
+        summary.update("q", "a")
+        summary.wait(timeout=5)
+        self.assertEqual(summary.current(), "")
+        self.assertIsInstance(summary.last_error, RuntimeError)
+        summary.close()
+
+
+class TestEmbeddingQueryExpander(unittest.TestCase):
+    def test_without_history_query_is_unchanged(self):
+        expander = EmbeddingQueryExpander()
+        np.testing.assert_allclose(expander.expand([3.0, 4.0]), [0.6, 0.8], rtol=1e-6)
+
+    def test_blends_last_n_questions(self):
+        expander = EmbeddingQueryExpander(last_n=2, history_weight=0.5)
+        expander.remember([0.0, 0.0, 1.0])  # pushed out by the next two
+        expander.remember([0.0, 1.0, 0.0])
+        expander.remember([0.0, 1.0, 0.0])
+
+        expanded = np.array(expander.expand([1.0, 0.0, 0.0]))
+        np.testing.assert_allclose(expanded, np.array([1.0, 1.0, 0.0]) / np.sqrt(2), rtol=1e-6)
+
+    def test_invalid_weight(self):
+        with self.assertRaises(ValueError):
+            EmbeddingQueryExpander(history_weight=1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
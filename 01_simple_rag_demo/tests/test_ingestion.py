@@ -0,0 +1,69 @@
+import threading
+import time
+import unittest
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from ingestion import ingest_texts
+
+
+class SlowEmbedding(DeterministicFakeEmbedding):
+    """Fake embeddings that take a while per call and record batch sizes and concurrency."""
+    batch_sizes: list = []
+    max_concurrent: int = 0
+
+    def model_post_init(self, context):
+        self._lock = threading.Lock()
+        self._running = 0
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self._running += 1
+            self.max_concurrent = max(self.max_concurrent, self._running)
+            self.batch_sizes.append(len(texts))
+        time.sleep(0.02)
+        with self._lock:
+            self._running -= 1
+        return super().embed_documents(texts)
+
+
+class TestIngestion(unittest.TestCase):
+    def test_batches_are_bounded_and_all_texts_added(self):
+        embedding = SlowEmbedding(size=8, batch_sizes=[])
+        store = InMemoryVectorStore(embedding=embedding)
+        texts = [f"text {i}" for i in range(25)]
+        ids = [f"id{i}" for i in range(25)]
+        progress = []
+
+        ingest_texts(store, texts, metadatas=[{"n": i} for i in range(25)], ids=ids,
+                     batch_size=4, max_in_flight=2, on_progress=lambda p: progress.append((p.done, p.tokens)))
+
+        self.assertEqual(sorted(embedding.batch_sizes), [1, 4, 4, 4, 4, 4, 4])
+        self.assertEqual(embedding.max_concurrent, 2)
+        self.assertEqual(progress[-1], (25, 50))
+        self.assertEqual(len(progress), 7)
+
+        docs = store.get_by_ids(ids)
+        self.assertEqual([doc.page_content for doc in docs], texts)
+        self.assertEqual(docs[7].metadata, {"n": 7})
+        # Vectors must be the same as if the texts had been added one by one
+        self.assertEqual(store.store["id3"]["vector"], DeterministicFakeEmbedding(size=8).embed_query("text 3"))
+
+    def test_requires_ids_and_positive_sizes(self):
+        store = InMemoryVectorStore(embedding=DeterministicFakeEmbedding(size=8))
+        with self.assertRaises(ValueError):
+            ingest_texts(store, ["a"])
+        with self.assertRaises(ValueError):
+            ingest_texts(store, ["a"], ids=["a"], batch_size=0)
+
+    def test_throughput_is_reported(self):
+        store = InMemoryVectorStore(embedding=SlowEmbedding(size=8, batch_sizes=[]))
+        progress = []
+        ingest_texts(store, ["a b c"] * 4, ids=list("abcd"), batch_size=2, on_progress=progress.append)
+        self.assertGreater(progress[-1].chunks_per_second, 0)
+        self.assertAlmostEqual(progress[-1].tokens_per_second / progress[-1].chunks_per_second, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import time
+import unittest
+
+import numpy as np
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from mmr import diversify, mmr_select
+from numpy_vectorstore import NumpyVectorStore
+
+
+def _unit(*rows):
+    vectors = np.array(rows, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class TestMMR(unittest.TestCase):
+    def test_relevance_only_keeps_order(self):
+        vectors = _unit([1, 0], [0, 1], [1, 1])
+        self.assertEqual(mmr_select(np.array([0.9, 0.5, 0.7]), vectors, k=3, lambda_mult=1.0,
+                                    duplicate_threshold=None), [0, 2, 1])
+
+    def test_prefers_diverse_candidate(self):
+        # Candidate 1 is nearly the same as 0, candidate 2 is a bit less relevant but different
+        vectors = _unit([1, 0], [1, 0.05], [0, 1])
+        selected = mmr_select(np.array([0.9, 0.89, 0.8]), vectors, k=2, lambda_mult=0.5, duplicate_threshold=None)
+        self.assertEqual(selected, [0, 2])
+
+    def test_drops_near_duplicates(self):
+        vectors = _unit([1, 0], [1, 0.01], [1, 0.02])
+        selected = mmr_select(np.array([0.9, 0.8, 0.7]), vectors, k=3, lambda_mult=1.0, duplicate_threshold=0.95)
+        self.assertEqual(selected, [0])
+
+    def test_empty(self):
+        self.assertEqual(mmr_select(np.array([]), np.empty((0, 2), dtype=np.float32), k=3), [])
+
+    def test_selection_is_fast(self):
+        rng = np.random.default_rng(0)
+        vectors = _unit(*rng.standard_normal((50, 1024)))
+        relevance = rng.random(50)
+        start = time.perf_counter()
+        for _ in range(100):
+            mmr_select(relevance, vectors, k=5)
+        self.assertLess((time.perf_counter() - start) / 100, 0.005)
+
+    def test_diversify_uses_store_vectors(self):
+        store = NumpyVectorStore(embedding=DeterministicFakeEmbedding(size=16))
+        store.add_texts(["same text", "other text"], ids=["a", "b"])
+        store.add_embeddings(["same text copy"], store.get_vectors(["a"]).tolist(), ids=["c"])
+        results = [(store.get_by_ids([doc_id])[0], score) for doc_id, score in [("a", 0.9), ("c", 0.89), ("b", 0.5)]]
+
+        selected = diversify(store, results, k=3, lambda_mult=1.0, duplicate_threshold=0.95)
+
+        self.assertEqual([doc.id for doc, _ in selected], ["a", "b"])
+
+    def test_diversify_without_store_vectors(self):
+        results = [(Document(id=str(i), page_content=str(i)), 1.0) for i in range(4)]
+        self.assertEqual(diversify(object(), results, k=2), results[:2])
+
+
+if __name__ == "__main__":
+    unittest.main()
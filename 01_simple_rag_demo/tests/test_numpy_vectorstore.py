@@ -0,0 +1,106 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from numpy_vectorstore import NumpyVectorStore, top_k_indices
+
+TEXTS = [f"document number {i}" for i in range(40)]
+IDS = [f"doc{i}" for i in range(40)]
+
+
+class TestNumpyVectorStore(unittest.TestCase):
+    def setUp(self):
+        self.embedding = DeterministicFakeEmbedding(size=16)
+        self.store = NumpyVectorStore(embedding=self.embedding)
+        self.store.add_texts(TEXTS, [{"n": i} for i in range(40)], ids=IDS)
+
+    def test_top_k_indices(self):
+        scores = np.array([0.1, 0.9, 0.5, 0.7, 0.3])
+        self.assertEqual(top_k_indices(scores, 3).tolist(), [1, 3, 2])
+        self.assertEqual(top_k_indices(scores, 10).tolist(), [1, 3, 2, 4, 0])
+        self.assertEqual(top_k_indices(scores, 0).tolist(), [])
+
+    def test_same_results_as_in_memory_vectorstore(self):
+        reference = InMemoryVectorStore(embedding=self.embedding)
+        reference.add_texts(TEXTS, [{"n": i} for i in range(40)], ids=IDS)
+
+        for query in ["document number 3", "something else", "number"]:
+            expected = reference.similarity_search_with_score(query, k=5)
+            actual = self.store.similarity_search_with_score(query, k=5)
+            self.assertEqual([doc.id for doc, _ in actual], [doc.id for doc, _ in expected])
+            for (_, score), (_, expected_score) in zip(actual, expected):
+                self.assertAlmostEqual(score, expected_score, places=5)
+
+    def test_exact_match_and_filter(self):
+        doc, score = self.store.similarity_search_with_score("document number 7", k=1)[0]
+        self.assertEqual(doc.id, "doc7")
+        self.assertEqual(doc.metadata, {"n": 7})
+        self.assertAlmostEqual(score, 1.0, places=5)
+
+        results = self.store.similarity_search_with_score("document number 7", k=3,
+                                                          filter=lambda d: d.metadata["n"] % 2 == 0)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(d.metadata["n"] % 2 == 0 for d, _ in results))
+
+    def test_upsert_and_delete_keep_store_consistent(self):
+        self.store.add_texts(["replaced"], [{"n": -1}], ids=["doc3"])
+        self.assertEqual(len(self.store), 40)
+        self.assertEqual(self.store.get_by_ids(["doc3"])[0].page_content, "replaced")
+
+        version = self.store.version
+        self.store.delete(["doc0", "doc39", "doc5", "unknown"])
+        self.assertGreater(self.store.version, version)
+        self.assertEqual(len(self.store), 37)
+        self.assertEqual(self.store.get_by_ids(["doc0", "doc5", "doc39"]), [])
+
+        # Every remaining entry must still find itself
+        for doc_id, text in [("doc38", "document number 38"), ("doc3", "replaced"), ("doc20", "document number 20")]:
+            self.assertEqual(self.store.similarity_search(text, k=1)[0].id, doc_id)
+
+    def test_delete_with_duplicate_ids(self):
+        self.store.delete(["doc7", "doc7", "doc39", "doc39"])
+        self.assertEqual(len(self.store), 38)
+        self.assertEqual(self.store.get_by_ids(["doc7", "doc39"]), [])
+        for doc_id, text in [("doc38", "document number 38"), ("doc8", "document number 8")]:
+            self.assertEqual(self.store.similarity_search(text, k=1)[0].id, doc_id)
+
+    def test_get_vectors_are_normalized(self):
+        vectors = self.store.get_vectors(["doc1", "doc2", "missing"])
+        self.assertEqual(vectors.shape, (2, 16))
+        np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-5)
+
+    def test_save_and_load_memory_mapped(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertFalse(NumpyVectorStore.exists(tmp))
+            self.store.save(tmp)
+            self.assertTrue(NumpyVectorStore.exists(tmp))
+
+            loaded = NumpyVectorStore.load(tmp, embedding=self.embedding)
+            self.assertIsInstance(loaded.vectors, np.memmap)
+            self.assertEqual(loaded.vectors.dtype, np.float32)
+            self.assertEqual(loaded.similarity_search("document number 12", k=1)[0].id, "doc12")
+
+            # Changes after a memory-mapped load must not touch the file
+            loaded.add_texts(["new one"], ids=["new"])
+            loaded.delete(["doc1"])
+            self.assertEqual(len(loaded), 40)
+            reloaded = NumpyVectorStore.load(tmp, embedding=self.embedding, mmap=False)
+            self.assertEqual(len(reloaded), 40)
+            self.assertEqual(reloaded.get_by_ids(["doc1"])[0].page_content, "document number 1")
+
+    def test_save_and_load_empty_store(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            NumpyVectorStore(embedding=self.embedding).save(tmp)
+            loaded = NumpyVectorStore.load(tmp, embedding=self.embedding)
+            self.assertEqual(len(loaded), 0)
+            self.assertEqual(loaded.similarity_search("anything"), [])
+            loaded.add_texts(["a"], ids=["a"])
+            self.assertEqual(loaded.similarity_search("a", k=1)[0].id, "a")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+from langchain_ollama import ChatOllama, OllamaEmbeddings
+
+from ollama_backend import OllamaBackend
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, ndjson=False):
+        body = (json.dumps(payload) + "\n").encode() if not ndjson else \
+            "".join(json.dumps(line) + "\n" for line in payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/x-ndjson" if ndjson else "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.record(self)
+        self._send_json(self.server.status, {"version": "0.0.0"})
+
+    def do_POST(self):
+        self.server.record(self)
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.server.status >= 500:
+            self._send_json(self.server.status, {"error": "overloaded"})
+        elif self.path == "/api/embed":
+            inputs = request["input"] if isinstance(request["input"], list) else [request["input"]]
+            self._send_json(200, {"model": request["model"], "embeddings": [[1.0, 0.0, float(len(text))]
+                                                                            for text in inputs]})
+        elif self.path == "/api/chat":
+            done = {"model": request["model"], "created_at": "2025-01-01T00:00:00Z",
+                    "message": {"role": "assistant", "content": ""}, "done": True, "done_reason": "stop"}
+            self._send_json(200, [{"model": request["model"], "created_at": "2025-01-01T00:00:00Z",
+                                   "message": {"role": "assistant", "content": f"from {self.server.name}"},
+                                   "done": False}, done], ndjson=True)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, name):
+        super().__init__(("127.0.0.1", 0), FakeOllamaHandler)
+        self.name = name
+        self.status = 200
+        self.requests = 0
+        self.clients = set()
+        threading.Thread(target=self.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+    def record(self, handler):
+        self.requests += 1
+        self.clients.add(handler.client_address)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+def unused_url():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}"  # nothing listens here once the socket is closed
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestOllamaBackend(unittest.TestCase):
+    def setUp(self):
+        self.servers = [FakeOllamaServer("a"), FakeOllamaServer("b")]
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def test_least_outstanding_balancing(self):
+        backend = OllamaBackend([server.url for server in self.servers])
+        first = backend.acquire()
+        second = backend.acquire()
+        self.assertIsNot(first, second)
+        backend.release(first)
+        # The second server is still busy
+        self.assertIs(backend.acquire(), first)
+
+    def test_requests_reuse_pooled_connections(self):
+        backend = OllamaBackend([self.servers[0].url])
+        with httpx.Client(transport=backend.transport) as client:
+            for _ in range(5):
+                self.assertEqual(client.get(f"{backend.base_url}/api/version").status_code, 200)
+        self.assertEqual(self.servers[0].requests, 5)
+        self.assertEqual(len(self.servers[0].clients), 1)
+        self.assertEqual(backend.stats()[0]["outstanding"], 0)
+
+    def test_unreachable_server_is_skipped_and_opened(self):
+        clock = FakeClock()
+        backend = OllamaBackend([unused_url(), self.servers[0].url], failure_threshold=2, cooldown_seconds=10,
+                                clock=clock)
+        with httpx.Client(transport=backend.transport) as client:
+            for _ in range(6):
+                self.assertEqual(client.get(f"{backend.base_url}/api/version").status_code, 200)
+        stats = backend.stats()
+        self.assertEqual(stats[0]["state"], "open")
+        self.assertEqual(stats[0]["failures"], 2)
+        self.assertEqual(self.servers[0].requests, 6)
+
+        # After the cooldown one trial request goes to the dead server, it fails over and reopens the circuit
+        clock.now = 11
+        self.assertEqual(backend.stats()[0]["state"], "half-open")
+        with httpx.Client(transport=backend.transport) as client:
+            self.assertEqual(client.get(f"{backend.base_url}/api/version").status_code, 200)
+        self.assertEqual(backend.stats()[0]["state"], "open")
+
+    def test_server_errors_open_the_circuit(self):
+        self.servers[0].status = 503
+        backend = OllamaBackend([server.url for server in self.servers], failure_threshold=1)
+        with httpx.Client(transport=backend.transport) as client:
+            statuses = [client.post(f"{backend.base_url}/api/embed", json={"model": "m", "input": "x"}).status_code
+                        for _ in range(4)]
+        self.assertEqual(statuses.count(503), 1)
+        self.assertEqual(backend.stats()[0]["state"], "open")
+
+    def test_all_servers_down_still_tries(self):
+        backend = OllamaBackend([self.servers[0].url], failure_threshold=1)
+        self.servers[0].status = 503
+        with httpx.Client(transport=backend.transport) as client:
+            client.get(f"{backend.base_url}/api/version")
+            self.servers[0].status = 200
+            self.assertEqual(client.get(f"{backend.base_url}/api/version").status_code, 200)
+        self.assertEqual(backend.stats()[0]["state"], "closed")
+
+    def test_health_check(self):
+        clock = FakeClock()
+        backend = OllamaBackend([unused_url(), self.servers[0].url], health_timeout=1, clock=clock)
+        results = backend.check_health()
+        self.assertEqual(list(results.values()), [False, True])
+        self.assertEqual([node["state"] for node in backend.stats()], ["open", "closed"])
+
+    def test_langchain_clients_use_the_backend(self):
+        backend = OllamaBackend([server.url for server in self.servers])
+        llm = ChatOllama(model="fake", base_url=backend.base_url, **backend.client_kwargs())
+        embeddings = OllamaEmbeddings(model="fake", base_url=backend.base_url, **backend.client_kwargs())
+
+        answers = {llm.invoke("Hello").content for _ in range(4)}
+        self.assertEqual(answers, {"from a", "from b"})
+        self.assertEqual(embeddings.embed_documents(["ab", "abc"]), [[1.0, 0.0, 2.0], [1.0, 0.0, 3.0]])
+
+        async def async_calls():
+            return await llm.ainvoke("Hello"), await embeddings.aembed_query("abcd")
+        answer, vector = asyncio.run(async_calls())
+        self.assertIn(answer.content, {"from a", "from b"})
+        self.assertEqual(vector, [1.0, 0.0, 4.0])
+        self.assertTrue(all(node["outstanding"] == 0 for node in backend.stats()))
+
+
+class TestRagBackend(unittest.TestCase):
+    def test_importing_rag_creates_no_backend_and_starts_no_thread(self):
+        # In a fresh interpreter, so the modules imported by the other tests don't matter
+        code = ("import threading\n"
+                "import ollama_backend\n"
+                "class Fail:\n"
+                "    @classmethod\n"
+                "    def from_env(cls): raise AssertionError('OllamaBackend created')\n"
+                "ollama_backend.OllamaBackend = Fail\n"
+                "import rag\n"
+                "assert rag._OLLAMA_BACKEND is None\n"
+                "assert threading.active_count() == 1, threading.enumerate()\n")
+        env = {**os.environ, "OLLAMA_SERVER_URLS": "http://127.0.0.1:1,http://127.0.0.1:2"}
+        result = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).parent.parent, env=env,
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_backend_is_created_once(self):
+        import rag
+
+        self.assertIs(rag.backend(), rag.backend())
+
+
+if __name__ == "__main__":
+    unittest.main()
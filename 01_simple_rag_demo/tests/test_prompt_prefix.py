@@ -0,0 +1,69 @@
+import unittest
+
+from prompt_prefix import HysteresisTrimmer, PrefixTracker
+
+
+def _tokens(message):
+    return len(message[1])
+
+
+class TestHysteresisTrimmer(unittest.TestCase):
+    def test_window_start_is_stable_until_budget_exceeded(self):
+        trimmer = HysteresisTrimmer(100, message_tokens=_tokens, low_water=0.5)
+        history = []
+        windows = []
+        for i in range(12):
+            history.append(("human", f"{i:02d}" * 10))
+            windows.append(trimmer(history))
+            self.assertLessEqual(sum(map(_tokens, windows[-1])), 100)
+
+        # Turns 0-4 fit, turn 5 trims down to 40 tokens (2 messages), then it grows again until turn 9
+        starts = [history.index(window[0]) for window in windows]
+        self.assertEqual(starts, [0, 0, 0, 0, 0, 4, 4, 4, 4, 8, 8, 8])
+        self.assertEqual(trimmer.trims, 2)
+
+    def test_start_on(self):
+        trimmer = HysteresisTrimmer(40, message_tokens=_tokens, low_water=0.5,
+                                    start_on=lambda message: message[0] == "human")
+        history = [("human", "a" * 20), ("assistant", "b" * 20), ("human", "c" * 5), ("assistant", "d" * 5)]
+        self.assertEqual(trimmer(history), history[2:])
+
+    def test_follows_front_eviction_of_the_history(self):
+        trimmer = HysteresisTrimmer(100, message_tokens=_tokens)
+        history = [("human", "a" * 30), ("human", "b" * 30), ("human", "c" * 30)]
+        self.assertEqual(trimmer(history), history)
+        del history[0]
+        history.append(("human", "d"))
+        self.assertEqual(trimmer(history), history)
+
+    def test_max_tokens_per_call(self):
+        trimmer = HysteresisTrimmer(1000, message_tokens=_tokens, low_water=1.0)
+        history = [("human", "a" * 30), ("human", "b" * 30)]
+        self.assertEqual(trimmer(history, max_tokens=40), history[1:])
+
+
+class TestPrefixTracker(unittest.TestCase):
+    def test_reused_prefix(self):
+        tracker = PrefixTracker(len, message_text=lambda message: message, message_overhead=0)
+        first = [("system", "abc"), ("human", "hello")]
+        stats = tracker.track(first)
+        self.assertEqual(stats.reused_tokens, 0)
+        self.assertEqual(stats.prompt_tokens, 6 + 3 + 5 + 5)
+
+        stats = tracker.track(first + [("assistant", "hi"), ("human", "more")])
+        self.assertEqual(stats.reused_tokens, 6 + 3 + 5 + 5)
+
+        # The human message differs after "hel", the tokens behind it must be prefilled again
+        stats = tracker.track([("system", "abc"), ("human", "help!")])
+        self.assertEqual(stats.reused_tokens, 6 + 3 + 5 + 3)
+        self.assertIn("prefix reused", str(stats))
+
+    def test_changed_system_prompt_reuses_nothing_behind_it(self):
+        tracker = PrefixTracker(len, message_text=lambda message: message, message_overhead=0)
+        tracker.track([("system", "abc"), ("human", "x")])
+        stats = tracker.track([("system", "xbc"), ("human", "x")])
+        self.assertEqual(stats.reused_tokens, 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import asyncio
+import unittest
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from numpy_vectorstore import NumpyVectorStore
+from rag_cache import LRUCache, RetrievalCache, normalize_query
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    queries: int = 0
+
+    def embed_query(self, text):
+        self.queries += 1
+        return super().embed_query(text)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats()["hits"], 3)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_entries_expire(self):
+        clock = FakeClock()
+        cache = LRUCache(maxsize=10, ttl=5, clock=clock)
+        cache.put("a", 1)
+        clock.now = 4.9
+        self.assertEqual(cache.get("a"), 1)
+        clock.now = 5.0
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+
+class TestRetrievalCache(unittest.TestCase):
+    def setUp(self):
+        self.embedding = CountingEmbedding(size=8)
+        self.store = NumpyVectorStore(embedding=self.embedding)
+        self.store.add_texts(["Brakka", "Pipkin", "Mirel"], ids=["a", "b", "c"])
+        self.cache = RetrievalCache()
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query("  Who is\n BRAKKA? "), "who is brakka?")
+
+    def test_repeated_query_hits_cache(self):
+        first = self.cache.similarity_search_with_score(self.store, "Who is Brakka?", k=2)
+        second = self.cache.similarity_search_with_score(self.store, "who is  brakka?", k=2)
+        self.assertEqual(first, second)
+        self.assertEqual(self.embedding.queries, 1)
+        self.assertEqual(self.cache.stats()["results"]["hits"], 1)
+
+        # Another k is another search, but the embedding is reused
+        self.cache.similarity_search_with_score(self.store, "Who is Brakka?", k=1)
+        self.assertEqual(self.embedding.queries, 1)
+        self.assertEqual(self.cache.stats()["results"]["misses"], 2)
+
+    def test_index_change_invalidates_results(self):
+        self.cache.similarity_search_with_score(self.store, "Grond", k=1)
+        self.store.add_texts(["Grond"], ids=["d"])
+        result = self.cache.similarity_search_with_score(self.store, "Grond", k=1)
+        self.assertEqual(result[0][0].id, "d")
+        self.assertEqual(self.cache.stats()["results"]["hits"], 0)
+        # The query embedding doesn't depend on the index and stays cached
+        self.assertEqual(self.embedding.queries, 1)
+
+    def test_async_embedding_shares_the_cache(self):
+        vector = asyncio.run(self.cache.aembed_query(self.store, "Who is Brakka?", limit=asyncio.Semaphore(1)))
+        self.assertEqual(self.cache.embed_query(self.store, "who is brakka?"), vector)
+        self.assertEqual(self.embedding.queries, 1)
+
+        first = self.cache.similarity_search_with_score_by_vector(self.store, "Who is Brakka?", vector, k=2)
+        second = self.cache.similarity_search_with_score(self.store, "Who is Brakka?", k=2)
+        self.assertEqual(first, second)
+        self.assertEqual(self.cache.stats()["results"]["hits"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
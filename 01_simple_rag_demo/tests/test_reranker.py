@@ -0,0 +1,115 @@
+import threading
+import time
+import unittest
+
+from langchain_core.documents import Document
+
+from reranker import LexicalReranker, RerankStage
+
+
+def _results(*texts):
+    return [(Document(id=str(i), page_content=text), 1.0 - i / 10) for i, text in enumerate(texts)]
+
+
+class SlowReranker:
+    def __init__(self):
+        self.release = threading.Event()
+
+    def score(self, query, texts):
+        self.release.wait(5)
+        return [1.0] * len(texts)
+
+
+class FailingReranker:
+    def score(self, query, texts):
+        raise RuntimeError("model crashed")
+
+
+class RecordingReranker:
+    def __init__(self):
+        self.batches = []
+
+    def score(self, query, texts):
+        self.batches.append(len(texts))
+        return [float(len(text)) for text in texts]
+
+
+class SleepingReranker:
+    def score(self, query, texts):
+        time.sleep(0.05)
+        return [float(len(text)) for text in texts]
+
+
+class TestLexicalReranker(unittest.TestCase):
+    def test_prefers_rare_terms_and_phrases(self):
+        scores = LexicalReranker().score("Who belongs to the Ordo Magica?", [
+            "The troll smith forges armor.",
+            "Magica is a word the goblins fear.",
+            "Jorun is an adept of the Ordo Magica.",
+        ])
+        self.assertEqual(max(range(3), key=scores.__getitem__), 2)
+        self.assertGreater(scores[1], scores[0])
+
+    def test_empty_query(self):
+        self.assertEqual(LexicalReranker().score("?!", ["a", "b"]), [0.0, 0.0])
+
+
+class TestRerankStage(unittest.TestCase):
+    def test_reranks_in_batches_and_keeps_k(self):
+        reranker = RecordingReranker()
+        stage = RerankStage(reranker, batch_size=2, budget_seconds=5)
+        results, reranked = stage.rerank("q", _results("a", "ccc", "bb", "dddd", "e"), k=2)
+        stage.close()
+
+        self.assertTrue(reranked)
+        self.assertEqual([doc.page_content for doc, _ in results], ["dddd", "ccc"])
+        self.assertEqual([score for _, score in results], [4.0, 3.0])
+        self.assertEqual(reranker.batches, [2, 2, 1])
+
+    def test_falls_back_to_retrieval_order_when_budget_runs_out(self):
+        reranker = SlowReranker()
+        stage = RerankStage(reranker, budget_seconds=0.01)
+        candidates = _results("a", "b", "c")
+        results, reranked = stage.rerank("q", candidates, k=2)
+        reranker.release.set()
+        stage.close()
+
+        self.assertFalse(reranked)
+        self.assertEqual(results, candidates[:2])
+        self.assertEqual(stage.stats()["fallbacks"], 1)
+        self.assertLess(stage.last_seconds, 1.0)
+
+    def test_falls_back_when_reranker_fails(self):
+        stage = RerankStage(FailingReranker())
+        candidates = _results("a", "b")
+        results, reranked = stage.rerank("q", candidates, k=1)
+        stage.close()
+
+        self.assertFalse(reranked)
+        self.assertEqual(results, candidates[:1])
+        self.assertIsInstance(stage.last_error, RuntimeError)
+
+    def test_concurrent_queries_are_all_reranked(self):
+        # Each query needs 0.05 s, one worker would make the fourth wait 0.15 s and run out of budget
+        stage = RerankStage(SleepingReranker(), budget_seconds=0.12, workers=4)
+        start = threading.Barrier(4)
+        outcomes = []
+
+        def query():
+            start.wait()
+            outcomes.append(stage.rerank("q", _results("a", "bb", "ccc"), k=2)[1])
+
+        threads = [threading.Thread(target=query) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stage.close()
+
+        self.assertEqual(outcomes, [True] * 4)
+        self.assertEqual(stage.stats()["reranked"], 4)
+        self.assertEqual(stage.stats()["fallbacks"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import unittest
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+
+from context_packer import ContextPacker
+from embedding_dispatcher import EmbeddingDispatcher
+from numpy_vectorstore import NumpyVectorStore
+from rag_cache import RetrievalCache
+from server import RAGServer, SessionStore
+
+
+class SlowChatModel(FakeListChatModel):
+    """Fake chat model that answers asynchronously and records the prompts and its peak concurrency."""
+    prompts: list = []
+    active: int = 0
+    max_active: int = 0
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        self.prompts.append(input)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.02)
+        finally:
+            self.active -= 1
+        return AIMessage(content=f"Answer to: {input[-1][1]}")
+
+
+class SlowEmbedding(DeterministicFakeEmbedding):
+    """Fake embeddings with an async query embedding that records its peak concurrency."""
+    active: int = 0
+    max_active: int = 0
+
+    async def aembed_query(self, text):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.01)
+        finally:
+            self.active -= 1
+        return self.embed_query(text)
+
+
+async def request(port, method, path, body=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    data = json.dumps(body).encode() if body is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(data)}\r\n"
+                 f"Connection: close\r\n\r\n".encode() + data)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(payload)
+
+
+class TestSessionStore(unittest.TestCase):
+    def test_drops_least_recently_used_session(self):
+        sessions = SessionStore(ContextPacker(4096), max_sessions=2)
+        first = sessions.get("a")
+        sessions.get("b")
+        self.assertIs(sessions.get("a"), first)
+        sessions.get("c")
+        self.assertIn("a", sessions)
+        self.assertNotIn("b", sessions)
+        self.assertEqual(len(sessions), 2)
+
+    def test_trimmer_only_in_stable_mode(self):
+        self.assertIsNotNone(SessionStore(ContextPacker(4096), prompt_mode="stable").get("a").trimmer)
+        self.assertIsNone(SessionStore(ContextPacker(4096), prompt_mode="packed").get("a").trimmer)
+
+
+class TestRAGServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.embeddings = SlowEmbedding(size=16)
+        vectorstore = NumpyVectorStore(embedding=self.embeddings)
+        vectorstore.add_texts([f"Chapter {i} of the chronicles of Ambria." for i in range(10)],
+                              metadatas=[{"filename": f"doc{i}.md"} for i in range(10)],
+                              ids=[f"doc{i}" for i in range(10)])
+        self.llm = SlowChatModel(responses=[], prompts=[])
+        self.server = RAGServer(vectorstore, self.llm, ContextPacker(4096, output_tokens=512),
+                                cache=RetrievalCache(), max_llm_requests=2, max_embedding_requests=1,
+                                rag_kwargs={"threshold": -1.0})
+        self.http_server = await self.server.start("127.0.0.1", 0)
+        self.port = self.http_server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.http_server.close()
+        await self.http_server.wait_closed()
+
+    async def test_concurrent_sessions_respect_backend_limits(self):
+        responses = await asyncio.gather(*[
+            request(self.port, "POST", "/chat", {"session_id": f"s{i}", "question": f"Question {i}?"})
+            for i in range(6)
+        ])
+        for i, (status, response) in enumerate(responses):
+            self.assertEqual(status, 200)
+            self.assertEqual(response["session_id"], f"s{i}")
+            self.assertEqual(response["answer"], f"Answer to: Question {i}?")
+        self.assertEqual(self.llm.max_active, 2)
+        self.assertEqual(self.embeddings.max_active, 1)
+        self.assertEqual(len(self.server.sessions), 6)
+
+    async def test_questions_of_sessions_are_embedded_in_batches(self):
+        self.server.embedding_dispatcher = EmbeddingDispatcher(self.embeddings, max_batch_size=8, max_wait_ms=50)
+        await asyncio.gather(*[
+            request(self.port, "POST", "/chat", {"session_id": f"s{i}", "question": f"Question {i}?"})
+            for i in range(6)
+        ])
+        self.assertEqual(self.server.embedding_dispatcher.stats()["requests"], 6)
+        self.assertLess(self.server.embedding_dispatcher.stats()["batches"], 6)
+        self.assertEqual(self.embeddings.max_active, 0)  # no single query embeddings
+
+    async def test_sessions_have_separate_histories(self):
+        await request(self.port, "POST", "/chat", {"session_id": "a", "question": "Who is Brakka?"})
+        await request(self.port, "POST", "/chat", {"session_id": "b", "question": "Where is Thistle Hold?"})
+        await request(self.port, "POST", "/chat", {"session_id": "a", "question": "And his goals?"})
+
+        prompt_b, prompt_a = self.llm.prompts[1], self.llm.prompts[2]
+        self.assertNotIn(("human", "Who is Brakka?"), prompt_b)
+        self.assertIn(("human", "Who is Brakka?"), prompt_a)
+        self.assertNotIn(("human", "Where is Thistle Hold?"), prompt_a)
+
+    async def test_new_session_and_delete(self):
+        status, response = await request(self.port, "POST", "/chat", {"question": "Who is Brakka?"})
+        self.assertEqual(status, 200)
+        session_id = response["session_id"]
+        self.assertIn(session_id, self.server.sessions)
+
+        status, _ = await request(self.port, "DELETE", f"/sessions/{session_id}")
+        self.assertEqual(status, 200)
+        self.assertNotIn(session_id, self.server.sessions)
+        status, _ = await request(self.port, "DELETE", f"/sessions/{session_id}")
+        self.assertEqual(status, 404)
+
+    async def test_bad_requests(self):
+        status, _ = await request(self.port, "POST", "/chat", {"session_id": "a"})
+        self.assertEqual(status, 400)
+        status, _ = await request(self.port, "GET", "/nothing")
+        self.assertEqual(status, 404)
+        status, health = await request(self.port, "GET", "/health")
+        self.assertEqual(status, 200)
+        self.assertEqual(health["sessions"], 0)
+
+    async def test_keep_alive_connection(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        for _ in range(2):
+            writer.write(b"GET /health HTTP/1.1\r\nHost: test\r\n\r\n")
+            await writer.drain()
+            head = await reader.readuntil(b"\r\n\r\n")
+            self.assertTrue(head.startswith(b"HTTP/1.1 200"))
+            length = int(next(line.split(b":")[1] for line in head.split(b"\r\n")
+                              if line.lower().startswith(b"content-length")))
+            self.assertEqual(json.loads(await reader.readexactly(length))["status"], "ok")
+        writer.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import io
+import unittest
+
+from unittest import mock
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from rich.console import Console
+
+import streaming
+from streaming import StreamStats, stream_markdown
+
+
+class TestStreaming(unittest.TestCase):
+    def test_streams_complete_answer_with_stats(self):
+        llm = FakeListChatModel(responses=["# Brakka\n\nA *troll* smith."], sleep=0.001)
+        output = io.StringIO()
+        console = Console(file=output, force_terminal=False, width=80)
+
+        answer, stats = stream_markdown(llm, [("human", "Who is Brakka?")], console)
+
+        self.assertEqual(answer, "# Brakka\n\nA *troll* smith.")
+        self.assertIn("troll", output.getvalue())
+        self.assertIsNotNone(stats.time_to_first_token)
+        self.assertLessEqual(stats.time_to_first_token, stats.total_seconds)
+        self.assertEqual(stats.tokens, 8)  # estimated, the fake model reports no usage
+        self.assertGreater(stats.tokens_per_second, 0)
+
+    def test_markdown_is_parsed_once_per_redraw_not_per_chunk(self):
+        answer = "Brakka forges *heavy* armor for the guardians of the grove. " * 40
+        llm = FakeListChatModel(responses=[answer], sleep=0.0005)
+        console = Console(file=io.StringIO(), force_terminal=True, width=80)
+        parses = []
+
+        class CountingMarkdown(streaming.Markdown):
+            def __init__(self, markup, *args, **kwargs):
+                parses.append(len(markup))
+                super().__init__(markup, *args, **kwargs)
+
+        with mock.patch.object(streaming, "Markdown", CountingMarkdown):
+            streamed, stats = stream_markdown(llm, [("human", "Who is Brakka?")], console, refresh_per_second=10)
+
+        self.assertEqual(streamed, answer)
+        # One parse per redraw at most (plus the empty start and the final draw), not one per chunk
+        self.assertLessEqual(len(parses), stats.total_seconds * 10 + 3)
+        self.assertLess(len(parses), len(answer) // 10)
+        self.assertEqual(parses[-1], len(answer))
+
+    def test_stats_without_tokens(self):
+        stats = StreamStats(time_to_first_token=None, total_seconds=1.0, tokens=0)
+        self.assertEqual(stats.tokens_per_second, 0.0)
+        self.assertIn("time to first token -", str(stats))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from template_manager import TemplateManager
+
+
+class TestTemplateManager(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = Path(self._tmp.name)
+        self.template = self.tmp / "greeting.jinja2"
+        self.template.write_text("Hello {{ name }}", encoding="utf-8")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_template_is_compiled_once(self):
+        manager = TemplateManager(self.tmp, preload=["greeting.jinja2"])
+        self.assertEqual(manager.loads, 1)
+        first = manager.get("greeting.jinja2")
+        for _ in range(10):
+            self.assertEqual(manager.render("greeting.jinja2", name="Brakka"), "Hello Brakka")
+        self.assertIs(manager.get("greeting.jinja2"), first)
+        stats = manager.stats()
+        self.assertEqual(stats["loads"], 1)
+        self.assertEqual(stats["renders"], 10)
+        self.assertGreater(stats["mean_render_us"], 0)
+
+    def test_changed_file_is_reloaded(self):
+        manager = TemplateManager(self.tmp)
+        self.assertEqual(manager.render("greeting.jinja2", name="Pipkin"), "Hello Pipkin")
+
+        self.template.write_text("Bye {{ name }}", encoding="utf-8")
+        mtime = self.template.stat().st_mtime + 10
+        os.utime(self.template, (mtime, mtime))
+
+        self.assertEqual(manager.render("greeting.jinja2", name="Pipkin"), "Bye Pipkin")
+        self.assertEqual(manager.loads, 2)
+
+    def test_bytecode_cache_is_written(self):
+        cache_dir = self.tmp / "bytecode"
+        TemplateManager(self.tmp, bytecode_cache_dir=cache_dir, preload=["greeting.jinja2"])
+        self.assertTrue(any(cache_dir.iterdir()))
+
+        # A new manager (e.g. after a restart) loads the bytecode instead of compiling
+        manager = TemplateManager(self.tmp, bytecode_cache_dir=cache_dir)
+        self.assertEqual(manager.render("greeting.jinja2", name="Mirel"), "Hello Mirel")
+
+
+
+class TestRagTemplates(unittest.TestCase):
+    def test_importing_rag_creates_no_template_manager(self):
+        # In a fresh interpreter, so the modules imported by the other tests don't matter
+        code = ("import template_manager\n"
+                "class Fail:\n"
+                "    def __init__(self, *args, **kwargs): raise AssertionError('TemplateManager created')\n"
+                "template_manager.TemplateManager = Fail\n"
+                "import rag\n"
+                "assert rag._TEMPLATES is None\n")
+        result = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).parent.parent,
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_templates_are_created_once(self):
+        import rag
+
+        self.assertIs(rag.templates(), rag.templates())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import warnings
+
+import token_counter
+from token_counter import (
+    BPETokenCounter,
+    CachedTokenCounter,
+    RegexTokenCounter,
+    TokenCounter,
+    load_token_counter,
+)
+from tokenhelper import ChatHistory, _estimate_text_tokens
+
+
+class TestTokenCounter(unittest.TestCase):
+    def test_regex_counter_matches_estimator(self):
+        counter = RegexTokenCounter()
+        for text in ["", "Hello, world!", "Brakka — Troll Smith > Core Skills"]:
+            self.assertEqual(counter(text), _estimate_text_tokens(text))
+        self.assertIsInstance(counter, TokenCounter)
+
+    def test_cached_counter_counts_each_text_once(self):
+        calls = []
+
+        def counter(text):
+            calls.append(text)
+            return len(text)
+
+        cached = CachedTokenCounter(counter, maxsize=8)
+        self.assertEqual(cached("abc"), 3)
+        self.assertEqual(cached("abc"), 3)
+        self.assertEqual(calls, ["abc"])
+        self.assertEqual(cached.stats(), {"hits": 1, "misses": 1, "size": 1})
+
+    def test_falls_back_to_regex_without_tokenizer_file(self):
+        self.assertEqual(load_token_counter().name, "regex")
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            counter = load_token_counter("does/not/exist/tokenizer.json")
+        self.assertEqual(counter.name, "regex")
+        self.assertEqual(len(caught), 1)
+
+    @unittest.skipIf(token_counter.Tokenizer is None, "tokenizers is not installed")
+    def test_bpe_counter_missing_file(self):
+        with self.assertRaises(FileNotFoundError):
+            BPETokenCounter("does/not/exist/tokenizer.json")
+
+    def test_chat_history_uses_given_counter(self):
+        history = ChatHistory(max_tokens=100, token_counter=len)
+        history.append("human", "hello")
+        self.assertEqual(history.total_tokens, 4 + len("human") + len("hello"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 
 from tokenhelper import (
+    ChatHistory,
     trim_chat_history,
     _estimate_text_tokens,
     _estimate_message_tokens,
@@ -93,6 +94,70 @@ class TestTokenHelper(unittest.TestCase):
         trimmed = trim_chat_history(chat, budget)
         self.assertEqual(trimmed, chat[1:])
 
+    def test_trim_chat_history_keeps_older_message_after_skipping(self):
+        """The greedy semantics are kept: a too large message is skipped, older ones that fit are kept."""
+        chat = [
+            ("human", "A"),
+            ("system", "this message is much too long for the budget"),
+            ("human", "C"),
+        ]
+        budget = _estimate_message_tokens(*chat[0]) + _estimate_message_tokens(*chat[2])
+        self.assertEqual(trim_chat_history(chat, budget), [chat[0], chat[2]])
+
+
+class TestChatHistory(unittest.TestCase):
+    def test_keeps_everything_within_budget(self):
+        chat = [("human", "one"), ("system", "two three"), ("human", "Hello, world!")]
+        total = sum(_estimate_message_tokens(r, c) for r, c in chat)
+        history = ChatHistory(max_tokens=total, messages=chat)
+        self.assertEqual(history.messages, chat)
+        self.assertEqual(list(history), chat)
+        self.assertEqual(len(history), 3)
+        self.assertEqual(history.total_tokens, total)
+
+    def test_evicts_oldest_first(self):
+        chat = [("human", "A"), ("system", "BB"), ("human", "CCC"), ("system", "DDDD")]
+        budget = sum(_estimate_message_tokens(r, c) for r, c in chat[1:])
+        history = ChatHistory(max_tokens=budget)
+        for role, content in chat:
+            history.append(role, content)
+        self.assertEqual(history.messages, chat[1:])
+        self.assertEqual(history.total_tokens, budget)
+
+    def test_keeps_longest_fitting_suffix_of_growing_history(self):
+        chat = [("human" if i % 2 else "assistant", "word " * (i % 7 + 1)) for i in range(50)]
+        history = ChatHistory(max_tokens=60)
+        for i, (role, content) in enumerate(chat):
+            history.append(role, content)
+            kept = history.messages
+            self.assertEqual(kept, chat[i + 1 - len(kept):i + 1])
+            self.assertLessEqual(history.total_tokens, 60)
+            # One more message wouldn't have fit
+            older = chat[i - len(kept)] if len(kept) <= i else None
+            if older is not None:
+                self.assertGreater(history.total_tokens + _estimate_message_tokens(*older), 60)
+
+    def test_too_large_message_empties_history(self):
+        history = ChatHistory(max_tokens=10, messages=[("human", "hi")])
+        history.append("human", "this message is much too long for the budget")
+        self.assertEqual(history.messages, [])
+        self.assertEqual(history.total_tokens, 0)
+
+    def test_select_skips_messages_that_do_not_fit(self):
+        chat = [("human", "A"), ("system", "this message is much too long for the budget"), ("human", "C")]
+        history = ChatHistory(max_tokens=1000, messages=chat)
+        budget = _estimate_message_tokens(*chat[0]) + _estimate_message_tokens(*chat[2])
+        self.assertEqual(history.select(budget), [chat[0], chat[2]])
+        self.assertEqual(history.select(_estimate_message_tokens(*chat[2]) - 1), [])
+        # Selecting doesn't change the history
+        self.assertEqual(history.messages, chat)
+
+    def test_clear(self):
+        history = ChatHistory(max_tokens=100, messages=[("human", "hi")])
+        history.clear()
+        self.assertEqual(len(history), 0)
+        self.assertEqual(history.total_tokens, 0)
+
 
 if __name__ == "__main__":
     unittest.main()
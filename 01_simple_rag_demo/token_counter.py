@@ -0,0 +1,113 @@
+"""
+Pluggable token counters.
+
+The regex estimator is fast but can be far off the real token count of the model. The BPE counter loads
+the tokenizer of the model from a local tokenizer.json (Hugging Face `tokenizers` format, e.g. downloaded
+from the model repository) and returns exact counts. CachedTokenCounter memoizes counts, so texts that
+are counted again and again (chat history, system prompt) are only tokenized once.
+
+All counters are plain callables text -> token count, they can be passed wherever a token_counter is
+expected (chunker, ingestion, chat history, streaming).
+"""
+
+import warnings
+
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Protocol, runtime_checkable
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:  # optional, only needed for the BPE counter
+    Tokenizer = None
+
+from tokenhelper import _estimate_text_tokens
+
+@runtime_checkable
+class TokenCounter(Protocol):
+    """Interface of all token counters."""
+
+    name: str
+
+    def __call__(self, text: str) -> int:
+        """Return the number of tokens of text."""
+        ...
+
+
+class RegexTokenCounter:
+    """Estimates tokens as words plus punctuation marks, no dependencies and no model files needed."""
+
+    name = "regex"
+
+    def __call__(self, text: str) -> int:
+        return _estimate_text_tokens(text)
+
+
+class BPETokenCounter:
+    """Exact token counts with the BPE tokenizer of the model, loaded from a local tokenizer.json."""
+
+    def __init__(self, tokenizer_file: str | Path):
+        """
+        Args:
+            tokenizer_file: Path of the tokenizer.json of the model.
+        Raises:
+            ImportError: If the `tokenizers` package is not installed.
+            FileNotFoundError: If tokenizer_file doesn't exist.
+        """
+        if Tokenizer is None:
+            raise ImportError("The BPE token counter needs the 'tokenizers' package (pip install tokenizers)")
+        tokenizer_file = Path(tokenizer_file)
+        if not tokenizer_file.is_file():
+            raise FileNotFoundError(f"Tokenizer file '{tokenizer_file}' not found")
+        self._tokenizer = Tokenizer.from_file(str(tokenizer_file))
+        self.name = f"bpe:{tokenizer_file.parent.name or tokenizer_file.stem}"
+
+    def __call__(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def count_batch(self, texts: list[str]) -> list[int]:
+        """Count many texts at once, the tokenizer encodes the batch in parallel."""
+        return [len(encoding.ids) for encoding in self._tokenizer.encode_batch(texts, add_special_tokens=False)]
+
+
+class CachedTokenCounter:
+    """Memoizes the counts of another counter in an LRU cache."""
+
+    def __init__(self, counter: Callable[[str], int], maxsize: int = 8192):
+        """
+        Args:
+            counter: The counter whose results are cached.
+            maxsize: Max number of cached texts.
+        """
+        self.counter = counter
+        self.name = getattr(counter, "name", "custom")
+        self._count = lru_cache(maxsize=maxsize)(counter)
+
+    def __call__(self, text: str) -> int:
+        return self._count(text)
+
+    def stats(self) -> dict:
+        info = self._count.cache_info()
+        return {"hits": info.hits, "misses": info.misses, "size": info.currsize}
+
+
+def load_token_counter(tokenizer_file: str | Path | None = None, cache_size: int = 8192) -> CachedTokenCounter:
+    """
+    Return the most accurate available counter, wrapped in a cache.
+
+    Falls back to the regex estimator (with a warning) if no tokenizer file is given, the file is missing
+    or the `tokenizers` package is not installed.
+
+    Args:
+        tokenizer_file: Path of the tokenizer.json of the model, None uses the regex estimator.
+        cache_size: Max number of cached texts.
+    """
+    counter: Callable[[str], int] = RegexTokenCounter()
+    if tokenizer_file is not None:
+        try:
+            counter = BPETokenCounter(tokenizer_file)
+        except (ImportError, FileNotFoundError) as e:
+            warnings.warn(f"{e}, falling back to the regex token estimator")
+    return CachedTokenCounter(counter, maxsize=cache_size)
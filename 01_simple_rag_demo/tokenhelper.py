@@ -1,5 +1,10 @@
+import math
 import re
-from typing import List, Tuple
+from collections import deque
+from typing import Callable, Iterator, List, Tuple
+
+# Smallest possible message: the per message overhead with empty role and content
+_MIN_MESSAGE_TOKENS = 4
 
 
 def _estimate_text_tokens(text: str) -> int:
@@ -14,13 +19,14 @@ def _estimate_text_tokens(text: str) -> int:
     return len(tokens)
 
 
-def _estimate_message_tokens(role: str, content: str) -> int:
+def _estimate_message_tokens(role: str, content: str,
+                             token_counter: Callable[[str], int] = _estimate_text_tokens) -> int:
     """
     Roughly estimate tokens for a single message.
     Adds a small overhead per message to account for formatting/roles.
     """
     overhead = 4  # small constant overhead for role/formatting
-    return overhead + _estimate_text_tokens(role) + _estimate_text_tokens(content)
+    return overhead + token_counter(role) + token_counter(content)
 
 
 def trim_chat_history(chat_history: List[Tuple[str, str]], max_tokens: int) -> List[Tuple[str, str]]:
@@ -29,6 +35,10 @@ def trim_chat_history(chat_history: List[Tuple[str, str]], max_tokens: int) -> L
     - Preserves the most recent messages by working backwards from the end.
     - Returns messages in chronological order.
     - If even the most recent message doesn't fit, returns an empty list.
+    - Older messages that still fit are kept even if a newer one was skipped.
+
+    Compatibility wrapper over ChatHistory.select(). For a history that grows turn by turn keep a
+    ChatHistory instead, it counts every message only once.
 
     Parameters:
         chat_history: list of (role, content) tuples in chronological order.
@@ -39,20 +49,74 @@ def trim_chat_history(chat_history: List[Tuple[str, str]], max_tokens: int) -> L
     """
     if max_tokens <= 0 or not chat_history:
         return []
+    return ChatHistory(max_tokens=math.inf, messages=chat_history).select(max_tokens)
 
-    # If the most recent message cannot fit, return an empty history
-    last_role, last_content = chat_history[-1]
-    if _estimate_message_tokens(last_role, last_content) > max_tokens:
-        return []
 
-    kept_reversed: List[Tuple[str, str]] = []
-    total = 0
+class ChatHistory:
+    """
+    Chat history that always fits into a token budget.
+
+    The token estimate of every message is computed once when it is added, the history keeps a running
+    total and evicts the oldest messages when the budget is exceeded, so adding a message costs amortized
+    O(1) instead of re-tokenizing the whole history every turn. The kept messages are always the most
+    recent contiguous suffix; if the newest message alone exceeds the budget the history becomes empty.
+    """
+
+    def __init__(self, max_tokens: int, messages: List[Tuple[str, str]] | None = None,
+                 token_counter: Callable[[str], int] = _estimate_text_tokens):
+        """
+        Parameters:
+            max_tokens: maximum allowed token budget for the entire history.
+            messages: optional initial (role, content) tuples in chronological order.
+            token_counter: function returning the token count of a text (see token_counter.py).
+        """
+        self.max_tokens = max_tokens
+        self._token_counter = token_counter
+        self._messages: deque[Tuple[str, str, int]] = deque()
+        self.total_tokens = 0
+        for role, content in messages or []:
+            self.append(role, content)
+
+    def append(self, role: str, content: str) -> None:
+        """Add a message and evict the oldest messages until the history fits into the budget again."""
+        tokens = _estimate_message_tokens(role, content, self._token_counter)
+        self._messages.append((role, content, tokens))
+        self.total_tokens += tokens
+        self.trim(self.max_tokens)
+
+    def trim(self, max_tokens: int) -> None:
+        """Evict the oldest messages until the total is within max_tokens."""
+        while self._messages and self.total_tokens > max_tokens:
+            self.total_tokens -= self._messages.popleft()[2]
+
+    def select(self, max_tokens: int) -> List[Tuple[str, str]]:
+        """
+        Greedy selection from the newest to the oldest message with the cached token counts: a message that
+        doesn't fit is skipped, older messages that still fit are kept. Empty if the newest one doesn't fit.
+        """
+        if max_tokens <= 0 or not self._messages or self._messages[-1][2] > max_tokens:
+            return []
+        kept_reversed: List[Tuple[str, str]] = []
+        total = 0
+        for role, content, tokens in reversed(self._messages):
+            if max_tokens - total < _MIN_MESSAGE_TOKENS:
+                break  # nothing can fit anymore
+            if total + tokens <= max_tokens:
+                kept_reversed.append((role, content))
+                total += tokens
+        return list(reversed(kept_reversed))
+
+    def clear(self) -> None:
+        self._messages.clear()
+        self.total_tokens = 0
+
+    @property
+    def messages(self) -> List[Tuple[str, str]]:
+        """The kept messages as (role, content) tuples in chronological order."""
+        return [(role, content) for role, content, _ in self._messages]
 
-    # Greedily keep from newest to oldest; skip any that don't fit
-    for role, content in reversed(chat_history):
-        msg_tokens = _estimate_message_tokens(role, content)
-        if total + msg_tokens <= max_tokens:
-            kept_reversed.append((role, content))
-            total += msg_tokens
+    def __len__(self) -> int:
+        return len(self._messages)
 
-    return list(reversed(kept_reversed))
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        return ((role, content) for role, content, _ in self._messages)
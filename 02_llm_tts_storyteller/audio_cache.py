@@ -0,0 +1,129 @@
+"""
+Persistent cache of synthesized audio.
+
+The storyteller repeats itself: recurring narration, character names, answers spoken again after a retry.
+AudioCache keeps the audio of every synthesized text on disk as .npy file, keyed by the sha256 of the
+normalized text, the voice, the language code and the model revision, so a repeated line is played back
+right away without synthesis. A new Kokoro version or model gives new keys, stale audio is never played.
+
+The audio is stored as int16 (half the size of float32, no audible difference for speech). The cache is
+capped at max_bytes, the least recently used files are deleted first (the file mtime is the last use, so
+the order survives restarts).
+"""
+
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+
+def kokoro_revision(repo_id: str = "hexgrad/Kokoro-82M") -> str:
+    """Model revision for the cache key: the model repo and the installed kokoro version."""
+    try:
+        from importlib.metadata import version
+
+        return f"{repo_id}@{version('kokoro')}"
+    except Exception:
+        return f"{repo_id}@unknown"
+
+
+def normalize_text(text: str) -> str:
+    """Unicode NFC and collapsed whitespace, spacing differences don't change the speech.
+
+    The case is kept, it changes the pronunciation ("US" and "us").
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+class AudioCache:
+    """Size capped, least recently used on-disk cache of synthesized audio."""
+
+    def __init__(self, cache_dir: str | Path, max_bytes: int = 512 * 1024 * 1024, dtype: str = "int16"):
+        """
+        Args:
+            cache_dir: Directory of the .npy files, created if missing.
+            max_bytes: Size cap of all cached files.
+            dtype: "int16" (compact) or "float32" (lossless) storage.
+        """
+        if dtype not in ("int16", "float32"):
+            raise ValueError(f"unsupported dtype {dtype}")
+        self._cache_dir = Path(cache_dir)
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.dtype = dtype
+        self._lock = threading.Lock()
+        # key -> file size, least recently used first
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._bytes = 0
+        for path in sorted(self._cache_dir.glob("*.npy"), key=lambda p: p.stat().st_mtime):
+            self._entries[path.stem] = path.stat().st_size
+            self._bytes += path.stat().st_size
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str, voice: str | None, lang_code: str, model_revision: str) -> str:
+        """Cache key of a text spoken by voice."""
+        parts = [normalize_text(text), str(voice), lang_code, model_revision]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self._cache_dir / f"{key}.npy"
+
+    def get(self, key: str) -> np.ndarray | None:
+        """Return the float32 audio of key, or None."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        path = self._path(key)
+        try:
+            audio = np.load(path)
+            os.utime(path)  # mark as recently used for the next start
+        except (OSError, ValueError, EOFError):
+            # A broken or deleted entry is just a miss, it gets overwritten with the fresh audio
+            with self._lock:
+                self._bytes -= self._entries.pop(key, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        if audio.dtype == np.int16:
+            return audio.astype(np.float32) / 32767
+        return audio.astype(np.float32, copy=False)
+
+    def put(self, key: str, audio: np.ndarray) -> None:
+        """Store audio (float32 samples in -1..1) under key and evict the least recently used entries."""
+        audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+        if self.dtype == "int16":
+            audio = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+        path = self._path(key)
+        tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, audio)
+        os.replace(tmp_path, path)
+        size = path.stat().st_size
+
+        evicted = []
+        with self._lock:
+            self._bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            self._path(old_key).unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"cache_entries": len(self._entries), "cache_bytes": self._bytes,
+                    "cache_hits": self.hits, "cache_misses": self.misses}
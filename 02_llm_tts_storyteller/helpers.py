@@ -41,12 +41,37 @@ def silence_pytorch_warnings():
     )
 
 
+def message_token_counter(text_counter, tokens_per_message: int = 3):
+    """Build a message token counter for trim_messages from a text token counter.
+
+    Like count_tokens_approximately, every message costs its role and content tokens plus a small
+    per-message overhead, but the content is counted with text_counter (e.g. the BPE counter of
+    token_counter.load_token_counter), so the trimmer sees the real token count of the model.
+
+    Args:
+        text_counter: Callable returning the token count of a text.
+        tokens_per_message: Overhead added per message for the chat template.
+
+    Returns:
+        A callable taking a list of messages and returning their token count.
+    """
+    def count(messages) -> int:
+        total = 0
+        for message in messages:
+            content = message.content if isinstance(message.content, str) else str(message.content)
+            total += tokens_per_message + text_counter(message.type) + text_counter(content)
+        return total
+
+    return count
+
+
 def _print_message(message):
     """Print a single, clipped message line in a dim style.
 
     The output shows up to 100 characters and replaces newlines with a vertical bar separator.
     """
-    CONSOLE.print(f"[grey50]\\[{message[:100].replace('\n', ' | ')}][/grey50]")
+    clipped = message[:100].replace("\n", " | ")
+    CONSOLE.print(f"[grey50]\\[{clipped}][/grey50]")
 
 
 def _debug_print(data):
@@ -4,39 +4,67 @@ import sys
 from langchain_core.messages import (
     HumanMessage,
     SystemMessage,
-    trim_messages,
 )
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages.utils import count_tokens_approximately
-from langchain_core.runnables import RunnableWithMessageHistory
+from langchain_core.runnables import RunnableLambda, RunnableWithMessageHistory
 from langchain_core.runnables.base import RunnableBindingBase
 from langchain_ollama import ChatOllama
 from langchain_openai import ChatOpenAI
 
 from helpers import CONSOLE, CONSOLE_STDERR, RunnableLambdas, silence_pytorch_warnings, select_interactive_mode, \
     validate_result, drop_last_message, read_multiline_input
-from helpers import prepare_speaker_text, process_result
+from helpers import prepare_speaker_text, process_result, message_token_counter
+from token_counter import load_token_counter
+from prompt_prefix import HysteresisTrimmer, PrefixTracker
 from history_store import ChatHistoryStore
+from sentence_stream import SentenceStream
+from ollama_backend import OllamaBackend
 
 # kokoro produces pytorch warnings, we don't want to see them in our chat!
 silence_pytorch_warnings()
 
 from speaker import Speaker, select_speaker_voice
+from audio_cache import AudioCache
 
 
 REMOVE_HIDDEN_MESSAGES = True
 SHOW_DEBUG_MESSAGES = False
+# Speak every sentence as soon as the LLM has written it, instead of waiting for the whole answer
+STREAM_TO_SPEAKER = True
+# Sentences synthesized in parallel (each worker loads its own Kokoro model), the audio is played in order.
+# The worker threads share SPEAKER_TORCH_THREADS PyTorch threads (the setting is process-wide), on a CPU it
+# should not exceed the cores.
+SPEAKER_SYNTHESIS_WORKERS = 2
+SPEAKER_TORCH_THREADS = None
+# Synthesized sentences are kept on disk, a repeated sentence is played without synthesis (None disables it)
+AUDIO_CACHE_DIR = ".audio_cache"
+AUDIO_CACHE_MAX_MB = 512
+# Print queue depths, synthesis real-time factor and playback gaps of the speaker after every answer
+SHOW_SPEAKER_STATS = False
+# Print how much of the previous prompt could be reused from the KV cache of the server
+SHOW_PREFIX_STATS = False
 
 MODEL = "gpt-oss:20b"
 
 # We cut the max token count of the chat history to keep it smooth (~150 Book pages)
 CHAT_HISTORY_MAX_TOKEN_COUNT = 8000
 
-# if you want to use Ollama
-base_url = os.getenv('OLLAMA_SERVER_URL', "http://localhost:11434")
-llm = ChatOllama(model=MODEL, base_url=base_url,
+# Point TOKENIZER_FILE to the tokenizer.json of the model (needs the `tokenizers` package) to trim the
+# history with exact token counts, without it the fast regex estimator is used.
+TOKEN_COUNTER = load_token_counter(os.getenv("TOKENIZER_FILE"))
+
+# When the history exceeds its budget, it is cut down to CHAT_HISTORY_LOW_WATER of it in one step
+CHAT_HISTORY_LOW_WATER = 0.5
+
+# if you want to use Ollama, OLLAMA_SERVER_URLS="http://gpu1:11434,http://gpu2:11434" spreads the requests over
+# several servers (pooled keep-alive connections, failing servers are skipped for a while)
+ollama_backend = OllamaBackend.from_env()
+if len(ollama_backend.nodes) > 1:
+    ollama_backend.start_health_checks(interval_seconds=10)
+llm = ChatOllama(model=MODEL, base_url=ollama_backend.base_url,
                  num_ctx=round(CHAT_HISTORY_MAX_TOKEN_COUNT * 1.33), num_gpu=999,
                  reasoning="high",
+                 **ollama_backend.client_kwargs(),
                  )
 
 # If you want to use OpenAI compatible apis
@@ -66,15 +94,33 @@ prompt = ChatPromptTemplate.from_messages([
 
 
 # we want to trim the max tokens to CHAT_HISTORY_MAX_TOKEN_COUNT, so we throw
-# away the oldest messages (exception is the system prompt, we keep it)
-trimmer = trim_messages(
-    max_tokens=CHAT_HISTORY_MAX_TOKEN_COUNT,
-    token_counter=count_tokens_approximately,
-    start_on="human",
-    end_on=("human", "tool"),
-    include_system = True
+# away the oldest messages (the system prompt is added after trimming, we keep it).
+# The history is not shifted by one message every turn but trimmed in large steps, in between the prompt
+# of a turn starts with the prompt of the last turn and Ollama can reuse its KV cache for that prefix.
+count_message_tokens = message_token_counter(TOKEN_COUNTER)
+history_trimmer = HysteresisTrimmer(
+    CHAT_HISTORY_MAX_TOKEN_COUNT,
+    message_tokens=lambda message: count_message_tokens([message]),
+    low_water=CHAT_HISTORY_LOW_WATER,
+    start_on=lambda message: message.type == "human",
+)
+trimmer = RunnableLambda(lambda messages: history_trimmer(messages))
+
+prefix_tracker = PrefixTracker(
+    TOKEN_COUNTER,
+    message_text=lambda message: (message.type, message.content if isinstance(message.content, str)
+                                  else str(message.content)),
 )
 
+
+def track_prompt_prefix(prompt_value):
+    """Measure the prefix shared with the previous prompt and pass the prompt on unchanged."""
+    stats = prefix_tracker.track(prompt_value.to_messages())
+    if SHOW_PREFIX_STATS:
+        CONSOLE.print(f"[grey30]{stats}[/grey30]")
+    return prompt_value
+
+
 #history_store = ChatHistoryStore()
 #history_store(session_id="1").messages.append(HumanMessage("1"))
 #history_store(session_id="1").messages.append(HumanMessage("2"))
@@ -83,9 +129,10 @@ trimmer = trim_messages(
 #chain = merge | trimmer | debug_print | prompt | debug_print
 #result = chain.invoke({"messages": [HumanMessage("Hi there")], "chat_history": history_store(session_id="1").messages})
 
-chain = RunnableLambdas.merge | trimmer | prompt | llm
+chain = RunnableLambdas.merge | trimmer | prompt | RunnableLambda(track_prompt_prefix) | llm
 if SHOW_DEBUG_MESSAGES:
-    chain = RunnableLambdas.merge | trimmer | prompt | RunnableLambdas.debug_print | llm
+    chain = (RunnableLambdas.merge | trimmer | prompt | RunnableLambda(track_prompt_prefix)
+             | RunnableLambdas.debug_print | llm)
 
 # Print the chain graph and see how it looks
 # chain.get_graph().print_ascii()
@@ -100,7 +147,9 @@ storyteller = RunnableWithMessageHistory(
 
 selected_voice_id = select_speaker_voice()
 
-speaker = Speaker(voice=selected_voice_id)
+audio_cache = AudioCache(AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_MAX_MB * 1024 * 1024) if AUDIO_CACHE_DIR else None
+speaker = Speaker(voice=selected_voice_id, synthesis_workers=SPEAKER_SYNTHESIS_WORKERS,
+                  torch_threads=SPEAKER_TORCH_THREADS, cache=audio_cache)
 speaker.start()
 
 interactive_mode = select_interactive_mode()
@@ -128,6 +177,45 @@ def retry_invoke(runnable:RunnableBindingBase, question:str, retries:int, sessio
     raise exception
 
 
+def retry_stream(runnable:RunnableBindingBase, question:str, retries:int, session_id="1"):
+    """Like retry_invoke, but streams the answer and hands every finished sentence to the speaker.
+
+    The hidden blocks are dropped while streaming, the whole answer is validated at the end. An invalid
+    answer has been partly spoken already, the rest of its audio is dropped before the retry.
+    """
+    exception = None
+    while retries > 0:
+        retries -= 1
+        sentences = SentenceStream()
+        chunks = []
+        try:
+            for chunk in runnable.stream(
+                {"messages": [HumanMessage(question)]},
+                config={"configurable": {"session_id": session_id}},
+            ):
+                chunks.append(chunk.content)
+                for sentence in sentences.feed(chunk.content):
+                    speaker.add_text(prepare_speaker_text(sentence))
+            for sentence in sentences.flush():
+                speaker.add_text(prepare_speaker_text(sentence))
+
+            answer = "".join(chunks)
+            if not validate_result(answer):
+                speaker.clear()
+                drop_last_message(history_store=history_store, session_id=session_id) # Invalid Answer
+                drop_last_message(history_store=history_store, session_id=session_id) # Human Message
+                CONSOLE_STDERR.print(f"[red]Invalid result -> retry[/red]")
+                exception = BaseException("Invalid result")
+                continue
+            return answer
+        except Exception as e:
+            speaker.clear()
+            drop_last_message(history_store=history_store, session_id=session_id) # Human Message
+            CONSOLE_STDERR.print(f"[red]Error on invoke -> retry[/red]")
+            exception = e
+    raise exception
+
+
 CONSOLE.print(f"[green]Press Ctrl+D or triple Enter to send message[/green]")
 
 ROUNDS = 15
@@ -143,14 +231,20 @@ while True:
     if question in exit_words or (current_round == ROUNDS and not interactive_mode == 1):
         break
 
-    result = retry_invoke(storyteller, question,5)
-    answer = result.content
+    if STREAM_TO_SPEAKER:
+        answer = retry_stream(storyteller, question, 5)
+    else:
+        result = retry_invoke(storyteller, question,5)
+        answer = result.content
 
-    speaker_text = prepare_speaker_text(answer)
-    speaker.add_text(speaker_text)
+        speaker_text = prepare_speaker_text(answer)
+        speaker.add_text(speaker_text)
 
     print_text = process_result(answer, remove_hidden=REMOVE_HIDDEN_MESSAGES)
     CONSOLE.print(print_text, style="blue")
 
+    if SHOW_SPEAKER_STATS:
+        CONSOLE.print(f"[grey30]{speaker.stats()}[/grey30]")
+
 CONSOLE.input("[green]>>> Hit Return To Quit[/green]")
 speaker.stop_wait()
@@ -0,0 +1,313 @@
+"""
+Shared, pooled HTTP backend for one or more Ollama servers.
+
+ChatOllama and OllamaEmbeddings talk to Ollama through httpx, this module plugs in httpx transports that:
+
+- keep a pool of keep-alive connections per server, shared by every client using the backend (LLM,
+  embeddings, background summaries), so no request pays for a new TCP connection,
+- send every request to the server with the fewest outstanding requests (least-outstanding load
+  balancing), a slow server collects outstanding requests and gets fewer new ones,
+- open the circuit of a server after failure_threshold consecutive failures (connection errors, timeouts,
+  5xx answers). It gets no requests for cooldown_seconds, then one trial request decides whether it is
+  back. Requests that failed to connect are retried on the next server, nothing was sent yet.
+- optionally check the health of all servers in the background (GET /api/version), so a recovered
+  server is used again without a trial request and a dead one is skipped before a request fails.
+
+If all servers are open the one that failed longest ago is tried anyway, with a single server the
+behaviour is the same as without the backend.
+
+Configure the servers with OLLAMA_SERVER_URLS (comma separated) or OLLAMA_SERVER_URL:
+
+    backend = OllamaBackend.from_env()
+    llm = ChatOllama(model=..., base_url=backend.base_url, **backend.client_kwargs())
+"""
+
+import os
+import threading
+import time
+
+from dataclasses import dataclass
+from typing import Callable
+
+import httpx
+
+
+@dataclass
+class BackendNode:
+    """One Ollama server and its health state."""
+    url: httpx.URL
+    transport: httpx.HTTPTransport
+    async_transport: httpx.AsyncHTTPTransport
+    outstanding: int = 0
+    requests: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    open_until: float = 0.0
+    trial_running: bool = False
+    last_error: str | None = None
+
+    def state(self, now: float) -> str:
+        """"closed" (healthy), "open" (skipped) or "half-open" (one trial request allowed)."""
+        if self.open_until == 0.0:
+            return "closed"
+        return "open" if now < self.open_until or self.trial_running else "half-open"
+
+
+class OllamaBackend:
+    """Load balancing, circuit breaking and connection pooling over several Ollama servers."""
+
+    def __init__(self, base_urls: list[str], max_connections: int = 16, max_keepalive_connections: int = 8,
+                 keepalive_expiry: float = 60.0, failure_threshold: int = 3, cooldown_seconds: float = 15.0,
+                 health_timeout: float = 2.0, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            base_urls: Ollama servers, e.g. ["http://gpu1:11434", "http://gpu2:11434"].
+            max_connections: Max open connections per server.
+            max_keepalive_connections: Max idle connections kept open per server.
+            keepalive_expiry: Seconds an idle connection is kept open.
+            failure_threshold: Consecutive failures that open the circuit of a server.
+            cooldown_seconds: Seconds an open server gets no requests before the next trial.
+            health_timeout: Timeout of a health check request.
+            clock: Time source, replaceable for tests.
+        """
+        if not base_urls:
+            raise ValueError("at least one base url is required")
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections,
+                              keepalive_expiry=keepalive_expiry)
+        self.nodes = [BackendNode(url=httpx.URL(url.rstrip("/")), transport=httpx.HTTPTransport(limits=limits),
+                                  async_transport=httpx.AsyncHTTPTransport(limits=limits))
+                      for url in base_urls]
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.health_timeout = health_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._health_thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self.transport = BalancedTransport(self)
+        self.async_transport = AsyncBalancedTransport(self)
+
+    @classmethod
+    def from_env(cls, default: str = "http://localhost:11434", **kwargs) -> "OllamaBackend":
+        """Create the backend from OLLAMA_SERVER_URLS (comma separated) or OLLAMA_SERVER_URL."""
+        urls = os.getenv("OLLAMA_SERVER_URLS") or os.getenv("OLLAMA_SERVER_URL", default)
+        return cls([url.strip() for url in urls.split(",") if url.strip()], **kwargs)
+
+    @property
+    def base_url(self) -> str:
+        """URL for the base_url of the clients, the transports send the requests to the picked server."""
+        return str(self.nodes[0].url)
+
+    def client_kwargs(self) -> dict:
+        """Keyword arguments for ChatOllama/OllamaEmbeddings that route all requests through the backend."""
+        return {"sync_client_kwargs": {"transport": self.transport},
+                "async_client_kwargs": {"transport": self.async_transport}}
+
+    def acquire(self, exclude: set[int] = frozenset()) -> BackendNode | None:
+        """Pick the server for the next request and count it as outstanding, None if all were excluded."""
+        with self._lock:
+            now = self._clock()
+            candidates = [node for i, node in enumerate(self.nodes) if i not in exclude]
+            if not candidates:
+                return None
+            available = [node for node in candidates if node.state(now) != "open"]
+            if available:
+                # Least outstanding requests, ties go to the server picked least often (round robin)
+                node = min(available, key=lambda n: (n.outstanding, n.requests))
+                if node.state(now) == "half-open":
+                    node.trial_running = True
+            else:
+                # Everything is down, trying one is better than failing right away
+                node = min(candidates, key=lambda n: n.open_until)
+            node.outstanding += 1
+            node.requests += 1
+            return node
+
+    def release(self, node: BackendNode, error: str | None = None) -> None:
+        """Finish a request of node, error is None if it succeeded."""
+        with self._lock:
+            node.outstanding -= 1
+            node.trial_running = False
+            if error is None:
+                node.consecutive_failures = 0
+                node.open_until = 0.0
+                return
+            node.failures += 1
+            node.consecutive_failures += 1
+            node.last_error = error
+            if node.consecutive_failures >= self.failure_threshold or node.open_until:
+                node.open_until = self._clock() + self.cooldown_seconds
+
+    def check_health(self) -> dict[str, bool]:
+        """Ask every server for its version, closes or opens the circuits. Returns url -> healthy."""
+        results = {}
+        timeout = {"connect": self.health_timeout, "read": self.health_timeout,
+                   "write": self.health_timeout, "pool": self.health_timeout}
+        for node in self.nodes:
+            request = httpx.Request("GET", node.url.join("/api/version"), extensions={"timeout": timeout})
+            try:
+                response = node.transport.handle_request(request)
+                response.read()
+                response.close()
+                healthy = response.status_code < 500
+                error = None if healthy else f"health check: HTTP {response.status_code}"
+            except httpx.TransportError as e:
+                healthy, error = False, f"health check: {e!r}"
+            with self._lock:
+                if healthy:
+                    node.consecutive_failures = 0
+                    node.open_until = 0.0
+                else:
+                    node.failures += 1
+                    node.consecutive_failures = max(node.consecutive_failures + 1, self.failure_threshold)
+                    node.last_error = error
+                    node.open_until = self._clock() + self.cooldown_seconds
+            results[str(node.url)] = healthy
+        return results
+
+    def start_health_checks(self, interval_seconds: float = 10.0) -> None:
+        """Check the health of all servers every interval_seconds on a daemon thread."""
+        if self._health_thread is not None:
+            return
+
+        def run():
+            while not self._stop.wait(interval_seconds):
+                self.check_health()
+
+        self._health_thread = threading.Thread(target=run, name="ollama-health", daemon=True)
+        self._health_thread.start()
+
+    def stats(self) -> list[dict]:
+        with self._lock:
+            now = self._clock()
+            return [{"url": str(node.url), "state": node.state(now), "outstanding": node.outstanding,
+                     "requests": node.requests, "failures": node.failures, "last_error": node.last_error}
+                    for node in self.nodes]
+
+    def close(self) -> None:
+        """Stop the health checks and close the pooled connections of the blocking transports."""
+        self._stop.set()
+        for node in self.nodes:
+            node.transport.close()
+
+
+def _route(request: httpx.Request, node: BackendNode) -> None:
+    request.url = request.url.copy_with(scheme=node.url.scheme, host=node.url.host, port=node.url.port)
+    request.headers["Host"] = node.url.netloc.decode("ascii")
+
+
+def _status_error(response: httpx.Response) -> str | None:
+    return f"HTTP {response.status_code}" if response.status_code >= 500 else None
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """Response body that finishes the request of its server once it is read and closed."""
+
+    def __init__(self, stream: httpx.SyncByteStream, release: Callable[[str | None], None], error: str | None):
+        self._stream = stream
+        self._release = release
+        self._error = error
+        self._released = False
+
+    def __iter__(self):
+        try:
+            yield from self._stream
+        except httpx.TransportError as e:
+            self._error = repr(e)
+            raise
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            if not self._released:
+                self._released = True
+                self._release(self._error)
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    """Async version of _ReleasingStream."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[str | None], None], error: str | None):
+        self._stream = stream
+        self._release = release
+        self._error = error
+        self._released = False
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        except httpx.TransportError as e:
+            self._error = repr(e)
+            raise
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._release(self._error)
+
+
+class BalancedTransport(httpx.BaseTransport):
+    """Blocking httpx transport that sends every request through an OllamaBackend."""
+
+    def __init__(self, backend: OllamaBackend):
+        self.backend = backend
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        tried: set[int] = set()
+        while True:
+            node = self.backend.acquire(exclude=tried)
+            if node is None:
+                raise httpx.ConnectError("no Ollama server reachable", request=request)
+            _route(request, node)
+            try:
+                response = node.transport.handle_request(request)
+            except httpx.TransportError as e:
+                self.backend.release(node, repr(e))
+                if isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)):
+                    tried.add(self.backend.nodes.index(node))
+                    continue  # nothing was sent, the next server can take it
+                raise
+            return httpx.Response(status_code=response.status_code, headers=response.headers,
+                                  stream=_ReleasingStream(response.stream,
+                                                          lambda error: self.backend.release(node, error),
+                                                          _status_error(response)),
+                                  extensions=response.extensions, request=request)
+
+    def close(self) -> None:
+        pass  # the pools belong to the backend, shared by all clients
+
+
+class AsyncBalancedTransport(httpx.AsyncBaseTransport):
+    """Async httpx transport that sends every request through an OllamaBackend, use it on one event loop."""
+
+    def __init__(self, backend: OllamaBackend):
+        self.backend = backend
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        tried: set[int] = set()
+        while True:
+            node = self.backend.acquire(exclude=tried)
+            if node is None:
+                raise httpx.ConnectError("no Ollama server reachable", request=request)
+            _route(request, node)
+            try:
+                response = await node.async_transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                self.backend.release(node, repr(e))
+                if isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)):
+                    tried.add(self.backend.nodes.index(node))
+                    continue
+                raise
+            return httpx.Response(status_code=response.status_code, headers=response.headers,
+                                  stream=_AsyncReleasingStream(response.stream,
+                                                               lambda error: self.backend.release(node, error),
+                                                               _status_error(response)),
+                                  extensions=response.extensions, request=request)
+
+    async def aclose(self) -> None:
+        pass
@@ -0,0 +1,153 @@
+"""
+Prompt prefix stability for KV-cache reuse on the model server.
+
+Ollama (llama.cpp) keeps the KV cache of the last prompt and only has to prefill the part of a new prompt
+behind the longest common prefix. A trimmer that drops the oldest message every turn changes the very
+beginning of the history and therefore the whole prompt, everything is prefilled again.
+
+- HysteresisTrimmer keeps the start of the history window fixed while it fits. Only when the window gets
+  larger than max_tokens it drops the oldest messages in one big step down to a low-water mark, so the
+  prefix changes once every few turns instead of every turn.
+- PrefixTracker compares every prompt with the previous one and reports how many tokens of the prefix
+  could be reused, to measure the prefill savings.
+
+Messages can be of any type, the callers pass functions for token counting and text extraction.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Generic, Sequence, TypeVar
+
+M = TypeVar("M")
+
+
+class HysteresisTrimmer(Generic[M]):
+    """
+    Trims a growing message list in large, infrequent steps.
+
+    The trimmer remembers the first message of its window, as long as the window fits into max_tokens
+    it starts at the same message. Keep one trimmer per conversation.
+    """
+
+    def __init__(self, max_tokens: int, message_tokens: Callable[[M], int], low_water: float = 0.5,
+                 start_on: Callable[[M], bool] | None = None):
+        """
+        Args:
+            max_tokens: Max tokens of the window, can be overridden per call.
+            message_tokens: Function returning the token count of a message.
+            low_water: When trimming, the window is cut down to low_water * max_tokens.
+            start_on: Only messages for which this returns True can start the window (e.g. human messages).
+        """
+        if not 0 < low_water <= 1:
+            raise ValueError("low_water must be > 0 and <= 1")
+        self.max_tokens = max_tokens
+        self.low_water = low_water
+        self._message_tokens = message_tokens
+        self._start_on = start_on
+        self._start = 0
+        self._first: M | None = None
+        self.trims = 0
+
+    def _window_start(self, messages: Sequence[M]) -> int:
+        """Index of the remembered first message (0 if it is gone, e.g. after the history was cleared)."""
+        if self._first is None:
+            return 0
+        if self._start < len(messages) and messages[self._start] == self._first:
+            return self._start
+        # The list was shortened at the front (or edited), look for the message again
+        for index in range(min(self._start, len(messages) - 1), -1, -1):
+            if messages[index] == self._first:
+                return index
+        return 0
+
+    def __call__(self, messages: Sequence[M], max_tokens: int | None = None) -> list[M]:
+        """Return the window of messages, only trimmed if it exceeds max_tokens."""
+        max_tokens = self.max_tokens if max_tokens is None else max_tokens
+        start = self._window_start(messages)
+        counts = [self._message_tokens(message) for message in messages[start:]]
+        total = sum(counts)
+
+        if total > max_tokens:
+            self.trims += 1
+            target = self.low_water * max_tokens
+            offset = 0
+            while offset < len(counts) and total > target:
+                total -= counts[offset]
+                offset += 1
+            if self._start_on is not None:
+                while offset < len(counts) and not self._start_on(messages[start + offset]):
+                    offset += 1
+            start += offset
+
+        self._start = start
+        self._first = messages[start] if start < len(messages) else None
+        return list(messages[start:])
+
+
+@dataclass
+class PrefixStats:
+    """Reuse of the previous prompt by the current one."""
+    reused_tokens: int
+    prompt_tokens: int
+
+    @property
+    def reused_ratio(self) -> float:
+        return self.reused_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    def __str__(self) -> str:
+        return (f"prefix reused {self.reused_tokens}/{self.prompt_tokens} tokens ({100 * self.reused_ratio:.0f}%), "
+                f"{self.prompt_tokens - self.reused_tokens} to prefill")
+
+
+class PrefixTracker(Generic[M]):
+    """
+    Measures the common prefix of consecutive prompts.
+
+    This is the client side estimate of what the server can take from its KV cache, the prompt_eval_count
+    Ollama reports in the response metadata is the server side count of the tokens that were prefilled.
+    """
+
+    def __init__(self, token_counter: Callable[[str], int], message_text: Callable[[M], tuple[str, str]],
+                 message_overhead: int = 4):
+        """
+        Args:
+            token_counter: Function returning the token count of a text.
+            message_text: Returns (role, content) of a message.
+            message_overhead: Tokens added per message for the chat template.
+        """
+        self._count = token_counter
+        self._message_text = message_text
+        self._overhead = message_overhead
+        self._previous: list[tuple[str, str]] = []
+        self.calls = 0
+        self.reused_tokens = 0
+        self.prompt_tokens = 0
+
+    def _tokens(self, role: str, content: str) -> int:
+        return self._overhead + self._count(role) + self._count(content)
+
+    def track(self, messages: Sequence[M]) -> PrefixStats:
+        """Compare the prompt with the previous one and remember it for the next call."""
+        current = [self._message_text(message) for message in messages]
+        prompt_tokens = sum(self._tokens(role, content) for role, content in current)
+
+        reused = 0
+        for (role, content), (previous_role, previous_content) in zip(current, self._previous):
+            if role != previous_role:
+                break
+            if content == previous_content:
+                reused += self._tokens(role, content)
+                continue
+            # Only a part of this message is shared, the rest of the prompt has to be prefilled
+            common = 0
+            for a, b in zip(content, previous_content):
+                if a != b:
+                    break
+                common += 1
+            reused += self._overhead + self._count(role) + self._count(content[:common])
+            break
+
+        self._previous = current
+        self.calls += 1
+        self.reused_tokens += reused
+        self.prompt_tokens += prompt_tokens
+        return PrefixStats(reused_tokens=min(reused, prompt_tokens), prompt_tokens=prompt_tokens)
@@ -0,0 +1,108 @@
+"""
+Incremental sentence splitting of a streamed LLM answer for the speaker.
+
+The LLM streams its answer in small chunks (a few characters each). SentenceStream collects them, drops
+<HIDDEN>...</HIDDEN> planning blocks as they arrive (also when a tag is split over several chunks) and
+returns every finished sentence, so the speaker can start with the first sentence while the LLM still
+writes the rest:
+
+    sentences = SentenceStream()
+    for chunk in llm.stream(...):
+        for sentence in sentences.feed(chunk.content):
+            speaker.add_text(sentence)
+    for sentence in sentences.flush():
+        speaker.add_text(sentence)
+"""
+
+import re
+
+HIDDEN_OPEN = "<hidden>"
+HIDDEN_CLOSE = "</hidden>"
+
+# End of a sentence: . ! ? … (maybe followed by closing quotes/brackets) and whitespace, or a line break.
+# The whitespace is required, so "3.5" or "..." in the middle of a chunk don't end a sentence.
+_SENTENCE_END = re.compile(r"(?:[.!?…]+[”’\"')\]]*\s+|\n+)")
+# Abbreviations that don't end a sentence when followed by a period ("Dr. Brakka", "e.g. a troll")
+_ABBREVIATION = re.compile(r"\b(?:mrs?|ms|dr|prof|sr|jr|st|mt|vs|cf|e\.g|i\.e)$", re.IGNORECASE)
+# Where a long sentence without end may be cut, after a clause
+_CLAUSE_END = re.compile(r"[,;:–—]\s+")
+
+
+def _partial_tag_length(text: str, tag: str) -> int:
+    """Length of the longest end of text that is the start of tag (case-insensitive)."""
+    lower = text[-len(tag):].lower()
+    for length in range(min(len(tag) - 1, len(lower)), 0, -1):
+        if tag.startswith(lower[-length:]):
+            return length
+    return 0
+
+
+class SentenceStream:
+    """Turn streamed text chunks into finished, visible sentences."""
+
+    def __init__(self, min_chars: int = 20, max_chars: int = 250):
+        """
+        Args:
+            min_chars: Shorter sentences are joined with the next one, tiny snippets sound choppy.
+            max_chars: A sentence without end is cut after a clause (or a word) once it gets this long.
+        """
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._pending = ""  # raw text that may still be the start of a tag
+        self._visible = ""  # visible text of the unfinished sentence
+        self._in_hidden = False
+
+    def feed(self, chunk: str) -> list[str]:
+        """Add a chunk of the answer, returns the sentences it finished."""
+        self._pending += chunk
+        while self._pending:
+            if self._in_hidden:
+                end = self._pending.lower().find(HIDDEN_CLOSE)
+                if end < 0:
+                    # Drop the hidden text, keep only what could be the start of the closing tag
+                    keep = _partial_tag_length(self._pending, HIDDEN_CLOSE)
+                    self._pending = self._pending[len(self._pending) - keep:]
+                    break
+                self._pending = self._pending[end + len(HIDDEN_CLOSE):]
+                self._in_hidden = False
+            else:
+                start = self._pending.lower().find(HIDDEN_OPEN)
+                if start < 0:
+                    keep = _partial_tag_length(self._pending, HIDDEN_OPEN)
+                    self._visible += self._pending[:len(self._pending) - keep]
+                    self._pending = self._pending[len(self._pending) - keep:]
+                    break
+                self._visible += self._pending[:start]
+                self._pending = self._pending[start + len(HIDDEN_OPEN):]
+                self._in_hidden = True
+        return self._split()
+
+    def flush(self) -> list[str]:
+        """End of the answer, returns the rest. An unclosed hidden block is dropped."""
+        if not self._in_hidden:
+            self._visible += self._pending
+        self._pending = ""
+        self._in_hidden = False
+        rest, self._visible = self._visible.strip(), ""
+        return [rest] if rest else []
+
+    def _split(self) -> list[str]:
+        sentences = []
+        position = 0
+        for match in _SENTENCE_END.finditer(self._visible):
+            if len(self._visible[position:match.start()].strip()) < self.min_chars:
+                continue
+            if match.group().startswith(". ") and _ABBREVIATION.search(self._visible, position, match.start()):
+                continue
+            sentences.append(self._visible[position:match.end()].strip())
+            position = match.end()
+        self._visible = self._visible[position:]
+
+        while len(self._visible) > self.max_chars:
+            cuts = list(_CLAUSE_END.finditer(self._visible, 0, self.max_chars)) or \
+                list(re.finditer(r"\s+", self._visible[:self.max_chars]))
+            if not cuts:
+                break
+            sentences.append(self._visible[:cuts[-1].end()].strip())
+            self._visible = self._visible[cuts[-1].end():]
+        return [sentence for sentence in sentences if sentence]
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import time
+import unittest
+
+from pathlib import Path
+
+import numpy as np
+
+from audio_cache import AudioCache, normalize_text
+
+REVISION = "hexgrad/Kokoro-82M@1.0"
+
+
+def file_size(samples: int) -> int:
+    """Size of the .npy file of samples int16 values (128 byte header)."""
+    return 128 + 2 * samples
+
+
+class TestAudioCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.cache_dir = Path(self.tmp_dir.name)
+
+    def key(self, text: str) -> str:
+        return AudioCache.key(text, "bf_emma", "b", REVISION)
+
+    def test_int16_round_trip(self):
+        cache = AudioCache(self.cache_dir)
+        audio = np.array([0.0, 0.5, -0.5, 1.0, -1.0, 0.123456, 2.0, -3.0], dtype=np.float32)
+        cache.put(self.key("Hello."), audio)
+
+        self.assertEqual(np.load(self.cache_dir / f"{self.key('Hello.')}.npy").dtype, np.int16)
+        loaded = cache.get(self.key("Hello."))
+        self.assertEqual(loaded.dtype, np.float32)
+        np.testing.assert_allclose(loaded, np.clip(audio, -1.0, 1.0), atol=1 / 32767)
+        self.assertEqual(cache.stats()["cache_bytes"], file_size(len(audio)))
+
+    def test_float32_storage_is_lossless(self):
+        cache = AudioCache(self.cache_dir, dtype="float32")
+        audio = np.linspace(-1.0, 1.0, 101, dtype=np.float32)
+        cache.put(self.key("Hello."), audio)
+        np.testing.assert_array_equal(cache.get(self.key("Hello.")), audio)
+
+    def test_unsupported_dtype(self):
+        with self.assertRaises(ValueError):
+            AudioCache(self.cache_dir, dtype="float64")
+
+    def test_key_normalization(self):
+        self.assertEqual(normalize_text("  Once upon\n a\ttime. "), "Once upon a time.")
+        self.assertEqual(normalize_text("Café"), "Café")  # NFC
+        key = AudioCache.key("Once upon a time.", "bf_emma", "b", REVISION)
+        self.assertEqual(AudioCache.key(" Once  upon\na time.\n", "bf_emma", "b", REVISION), key)
+        # The case changes the pronunciation, so does every other part of the key
+        self.assertNotEqual(AudioCache.key("ONCE upon a time.", "bf_emma", "b", REVISION), key)
+        self.assertNotEqual(AudioCache.key("Once upon a time.", "af_heart", "b", REVISION), key)
+        self.assertNotEqual(AudioCache.key("Once upon a time.", None, "b", REVISION), key)
+        self.assertNotEqual(AudioCache.key("Once upon a time.", "bf_emma", "a", REVISION), key)
+        self.assertNotEqual(AudioCache.key("Once upon a time.", "bf_emma", "b", "hexgrad/Kokoro-82M@1.1"), key)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = AudioCache(self.cache_dir, max_bytes=3 * file_size(100))
+        for text in ("a", "b", "c"):
+            cache.put(self.key(text), np.zeros(100))
+        cache.get(self.key("a"))
+        cache.put(self.key("d"), np.zeros(100))
+
+        self.assertIsNone(cache.get(self.key("b")))
+        for text in ("a", "c", "d"):
+            self.assertIsNotNone(cache.get(self.key(text)))
+        self.assertFalse((self.cache_dir / f"{self.key('b')}.npy").exists())
+        self.assertEqual(cache.stats()["cache_entries"], 3)
+        self.assertEqual(cache.stats()["cache_bytes"], 3 * file_size(100))
+
+    def test_eviction_order_survives_a_restart(self):
+        cache = AudioCache(self.cache_dir, max_bytes=3 * file_size(100))
+        for text in ("a", "b", "c"):
+            cache.put(self.key(text), np.zeros(100))
+        # The file mtime is the last use: "a" was used long ago, then "c", then "b"
+        now = time.time()
+        for text, age in (("a", 300), ("c", 200), ("b", 100)):
+            os.utime(self.cache_dir / f"{self.key(text)}.npy", (now - age, now - age))
+
+        cache = AudioCache(self.cache_dir, max_bytes=3 * file_size(100))
+        self.assertEqual(cache.stats()["cache_entries"], 3)
+        cache.put(self.key("d"), np.zeros(100))
+        cache.put(self.key("e"), np.zeros(100))
+        remaining = {path.stem for path in self.cache_dir.glob("*.npy")}
+        self.assertEqual(remaining, {self.key(text) for text in ("b", "d", "e")})
+
+    def test_entry_larger_than_the_cap_is_kept_alone(self):
+        cache = AudioCache(self.cache_dir, max_bytes=file_size(100))
+        cache.put(self.key("a"), np.zeros(100))
+        cache.put(self.key("b"), np.zeros(1000))
+        self.assertIsNone(cache.get(self.key("a")))
+        self.assertIsNotNone(cache.get(self.key("b")))
+
+    def test_corrupt_or_truncated_file_is_a_miss(self):
+        cache = AudioCache(self.cache_dir)
+        for text in ("garbage", "truncated", "empty", "deleted"):
+            cache.put(self.key(text), np.zeros(100))
+        path = self.cache_dir / f"{self.key('truncated')}.npy"
+        path.write_bytes(path.read_bytes()[:150])
+        (self.cache_dir / f"{self.key('garbage')}.npy").write_bytes(b"not a numpy file")
+        (self.cache_dir / f"{self.key('empty')}.npy").write_bytes(b"")
+        (self.cache_dir / f"{self.key('deleted')}.npy").unlink()
+
+        for text in ("garbage", "truncated", "empty", "deleted"):
+            with self.subTest(text=text):
+                self.assertIsNone(cache.get(self.key(text)))
+        stats = cache.stats()
+        self.assertEqual(stats["cache_misses"], 4)
+        self.assertEqual(stats["cache_hits"], 0)
+        self.assertEqual(stats["cache_entries"], 0)
+        self.assertEqual(stats["cache_bytes"], 0)
+
+        # The fresh audio replaces the broken entry
+        cache.put(self.key("truncated"), np.full(100, 0.5))
+        np.testing.assert_allclose(cache.get(self.key("truncated")), 0.5, atol=1 / 32767)
+        self.assertEqual(cache.stats()["cache_hits"], 1)
+
+    def test_stats_count_hits_and_misses(self):
+        cache = AudioCache(self.cache_dir)
+        self.assertIsNone(cache.get(self.key("Hello.")))
+        cache.put(self.key("Hello."), np.zeros(10))
+        cache.get(self.key("Hello."))
+        self.assertEqual(cache.stats(), {"cache_entries": 1, "cache_bytes": file_size(10),
+                                         "cache_hits": 1, "cache_misses": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import tempfile
+import threading
+import time
+import unittest
+import wave
+
+from pathlib import Path
+
+import numpy as np
+
+from audio_output import AudioOutput, RingBuffer, WaveOutput
+
+
+class ManualOutput(AudioOutput):
+    """Output without a device, the test calls _render() itself."""
+
+    def _open(self) -> None:
+        pass
+
+    def _close(self) -> None:
+        pass
+
+
+class TestRingBuffer(unittest.TestCase):
+    def test_wrap_around(self):
+        buffer = RingBuffer(8)
+        self.assertEqual(buffer.write(np.arange(6)), 6)
+        out = np.zeros(4, dtype=np.float32)
+        self.assertEqual(buffer.read_into(out), 4)
+        np.testing.assert_array_equal(out, [0, 1, 2, 3])
+
+        # 2 samples fit at the end, the other 3 go to the start of the array
+        self.assertEqual(buffer.write(np.arange(6, 11)), 5)
+        self.assertEqual(len(buffer), 7)
+        out = np.zeros(7, dtype=np.float32)
+        self.assertEqual(buffer.read_into(out), 7)
+        np.testing.assert_array_equal(out, np.arange(4, 11))
+        self.assertEqual(len(buffer), 0)
+
+    def test_partial_read(self):
+        buffer = RingBuffer(8)
+        buffer.write(np.array([0.5, -0.5, 0.25]))
+        out = np.full(5, 9.0, dtype=np.float32)
+        self.assertEqual(buffer.read_into(out), 3)
+        np.testing.assert_array_equal(out, [0.5, -0.5, 0.25, 9.0, 9.0])
+        self.assertEqual(buffer.read_into(out), 0)
+
+    def test_overflow_blocks_the_writer_until_there_is_room(self):
+        buffer = RingBuffer(8)
+        written = []
+        writer = threading.Thread(target=lambda: written.append(buffer.write(np.arange(12))))
+        writer.start()
+        time.sleep(0.05)
+        self.assertTrue(writer.is_alive())
+        self.assertEqual(len(buffer), 8)
+
+        out = np.zeros(8, dtype=np.float32)
+        self.assertEqual(buffer.read_into(out), 8)
+        writer.join(1.0)
+        self.assertEqual(written, [12])
+        np.testing.assert_array_equal(out, np.arange(8))
+        self.assertEqual(buffer.read_into(out), 4)
+        np.testing.assert_array_equal(out[:4], np.arange(8, 12))
+
+    def test_cancelled_overflow_returns_what_was_written(self):
+        buffer = RingBuffer(8)
+        cancelled = threading.Event()
+        threading.Timer(0.05, cancelled.set).start()
+        self.assertEqual(buffer.write(np.arange(12), cancelled=cancelled), 8)
+
+    def test_clear_and_wait_empty(self):
+        buffer = RingBuffer(8)
+        buffer.write(np.arange(5))
+        self.assertFalse(buffer.wait_empty(timeout=0.01))
+        buffer.clear()
+        self.assertTrue(buffer.wait_empty(timeout=0.01))
+        self.assertEqual(len(buffer), 0)
+
+
+class TestAudioOutput(unittest.TestCase):
+    def test_open_and_close_are_abstract(self):
+        class Incomplete(AudioOutput):
+            def _open(self) -> None:
+                pass
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def test_underruns_are_counted_while_audio_is_expected(self):
+        output = ManualOutput(sample_rate=1000, blocksize=64, buffer_seconds=1.0)
+        block = np.zeros(64, dtype=np.float32)
+        output.write(np.ones(100))
+        self.assertEqual(output._render(block), 64)
+        self.assertEqual(output._render(block), 36)  # 28 frames of silence
+        np.testing.assert_array_equal(block[36:], 0.0)
+        self.assertEqual(output._render(block), 0)  # still the same underrun, 92 frames
+        self.assertEqual(output.stats()["underruns"], 1)
+
+        output.write(np.ones(64))
+        self.assertEqual(output._render(block), 64)
+        output.finish()
+        self.assertEqual(output._render(block), 0)  # nothing more is coming, no underrun
+
+        stats = output.stats()
+        self.assertEqual(stats["underruns"], 1)
+        self.assertEqual(stats["underrun_mean_ms"], 92.0)
+        self.assertEqual(stats["underrun_max_ms"], 92.0)
+        self.assertEqual(stats["frames_written"], 164)
+        self.assertEqual(stats["frames_played"], 164)
+        self.assertEqual(stats["buffered_ms"], 0.0)
+
+    def test_stats_report_the_buffered_audio(self):
+        output = ManualOutput(sample_rate=1000, blocksize=64, buffer_seconds=1.0)
+        output.write(np.ones(250))
+        stats = output.stats()
+        self.assertEqual(stats["buffered_ms"], 250.0)
+        self.assertEqual(stats["underruns"], 0)
+        self.assertIsNone(stats["underrun_mean_ms"])
+        output.clear()
+        self.assertEqual(output.stats()["buffered_ms"], 0.0)
+
+
+class TestWaveOutput(unittest.TestCase):
+    def test_chunks_are_written_back_to_back(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "speech.wav"
+            output = WaveOutput(path, sample_rate=8000, blocksize=256, buffer_seconds=1.0, realtime=False)
+            # Chunk sizes that don't line up with the blocks
+            chunks = [np.linspace(-0.5, 0.5, size, dtype=np.float32) for size in (300, 1000, 17, 700)]
+            for chunk in chunks:
+                output.write(chunk)
+            output.finish()
+            output.start()
+            self.assertTrue(output.wait_done(timeout=2.0))
+            output.stop()
+
+            with wave.open(str(path), "rb") as wav:
+                self.assertEqual(wav.getframerate(), 8000)
+                self.assertEqual(wav.getsampwidth(), 2)
+                frames = np.frombuffer(wav.readframes(wav.getnframes()), dtype="<i2") / 32767
+
+        audio = np.concatenate(chunks)
+        # Only the last block is filled up with silence
+        self.assertEqual(len(frames), -(-len(audio) // 256) * 256)
+        np.testing.assert_allclose(frames[:len(audio)], audio, atol=1 / 32767)
+        np.testing.assert_array_equal(frames[len(audio):], 0.0)
+        self.assertEqual(output.stats()["underruns"], 0)
+        self.assertEqual(output.stats()["frames_played"], len(audio))
+
+
+if __name__ == "__main__":
+    unittest.main()
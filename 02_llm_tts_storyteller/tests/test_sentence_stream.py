@@ -0,0 +1,68 @@
+import unittest
+
+from sentence_stream import SentenceStream
+
+
+def stream(text: str, chunk_size: int, **kwargs) -> list[str]:
+    """Feed text in chunks of chunk_size characters, return all sentences including the flushed rest."""
+    sentences = SentenceStream(**kwargs)
+    result = []
+    for i in range(0, len(text), chunk_size):
+        result += sentences.feed(text[i:i + chunk_size])
+    return result + sentences.flush()
+
+
+class TestSentenceStream(unittest.TestCase):
+    def test_sentences_are_returned_once_finished(self):
+        sentences = SentenceStream(min_chars=5)
+        self.assertEqual(sentences.feed("The troll sleeps. The gob"), ["The troll sleeps."])
+        self.assertEqual(sentences.feed("lin creeps closer! "), ["The goblin creeps closer!"])
+        self.assertEqual(sentences.flush(), [])
+
+    def test_hidden_tags_split_across_chunks_are_dropped(self):
+        text = "The door opens. <HIDDEN>The player must find the key.</HIDDEN>A cold wind blows in."
+        for chunk_size in (1, 2, 3, 7):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(stream(text, chunk_size, min_chars=5),
+                                 ["The door opens.", "A cold wind blows in."])
+
+    def test_unclosed_hidden_block_is_dropped_on_flush(self):
+        self.assertEqual(stream("Night falls. <hidden>secret plan", 4, min_chars=5), ["Night falls."])
+
+    def test_short_sentences_are_merged(self):
+        self.assertEqual(stream("Yes. No. The troll is awake now. ", 3, min_chars=20),
+                         ["Yes. No. The troll is awake now."])
+
+    def test_long_sentence_is_cut_after_a_clause(self):
+        text = "The caravan moves on, the guards watch the trees, the wagons creak and nobody speaks a word"
+        sentences = stream(text, 5, max_chars=40)
+        self.assertEqual(sentences[:2], ["The caravan moves on,", "the guards watch the trees,"])
+        self.assertTrue(all(len(sentence) <= 40 for sentence in sentences))
+        self.assertEqual(" ".join(sentences), text)
+
+    def test_long_sentence_without_clause_is_cut_after_a_word(self):
+        sentences = stream("word " * 30, 4, max_chars=50)
+        self.assertTrue(all(len(sentence) <= 50 for sentence in sentences))
+        self.assertEqual(" ".join(sentences).split(), ["word"] * 30)
+
+    def test_flush_returns_the_trailing_fragment(self):
+        sentences = SentenceStream(min_chars=5)
+        self.assertEqual(sentences.feed("The tale ends here. And then"), ["The tale ends here."])
+        self.assertEqual(sentences.flush(), ["And then"])
+        self.assertEqual(sentences.flush(), [])
+
+    def test_abbreviations_do_not_end_a_sentence(self):
+        text = "The smith Mr. Brakka met Dr. Jorun near the old mill. Many beasts, e.g. trolls, live there. "
+        for chunk_size in (1, 4, 100):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(stream(text, chunk_size, min_chars=5),
+                                 ["The smith Mr. Brakka met Dr. Jorun near the old mill.",
+                                  "Many beasts, e.g. trolls, live there."])
+
+    def test_decimal_numbers_do_not_end_a_sentence(self):
+        self.assertEqual(stream("The bridge is 3.5 meters long. It sways. ", 1, min_chars=5),
+                         ["The bridge is 3.5 meters long.", "It sways."])
+
+
+if __name__ == "__main__":
+    unittest.main()
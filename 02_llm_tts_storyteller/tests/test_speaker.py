@@ -0,0 +1,169 @@
+import threading
+import time
+import unittest
+
+from unittest import mock
+
+import numpy as np
+
+import speaker
+from audio_output import NullOutput
+
+SAMPLE_RATE = 8000
+
+
+class StubScheduler:
+    """Stands in for SynthesisScheduler: texts stay in flight until finish() is called."""
+
+    def __init__(self, on_audio, on_end, workers=2, sample_rate=SAMPLE_RATE, **kwargs):
+        self._on_audio = on_audio
+        self._on_end = on_end
+        self.workers = workers
+        self.sample_rate = sample_rate
+        self._changed = threading.Condition()
+        self._in_flight = []  # (generation, text)
+        self._generation = 0
+        self.submitted = []
+        self.shut_down = False
+
+    def warm_up(self):
+        pass
+
+    def submit(self, text, voice=None, cancelled=None, on_complete=None):
+        with self._changed:
+            self._changed.wait_for(lambda: len(self._in_flight) < self.workers
+                                   or (cancelled is not None and cancelled.is_set()))
+            if cancelled is not None and cancelled.is_set():
+                return False
+            self._in_flight.append((self._generation, text))
+            self.submitted.append(text)
+            self._changed.notify_all()
+        return True
+
+    def submit_audio(self, audio):
+        self._on_audio(audio)
+        self._on_end()
+
+    def finish(self, seconds: float) -> None:
+        """Complete the oldest text in flight with seconds of silence."""
+        with self._changed:
+            generation, _ = self._in_flight.pop(0)
+            if generation == self._generation:
+                self._on_audio(np.zeros(int(seconds * self.sample_rate), dtype=np.float32))
+                self._on_end()
+            self._changed.notify_all()
+
+    def wait_in_flight(self, count: int, timeout: float = 2.0) -> bool:
+        with self._changed:
+            return self._changed.wait_for(lambda: len(self._in_flight) == count, timeout)
+
+    def pending(self):
+        return len(self._in_flight)
+
+    def clear(self):
+        with self._changed:
+            self._generation += 1
+            self._changed.notify_all()
+
+    def shutdown(self):
+        self.clear()
+        self.shut_down = True
+
+    def stats(self):
+        return {"texts_in_flight": len(self._in_flight)}
+
+
+def wait_until(condition, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestSpeaker(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(speaker, "SynthesisScheduler", StubScheduler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.output = NullOutput(sample_rate=SAMPLE_RATE, blocksize=256, buffer_seconds=10.0)
+        self.speaker = speaker.Speaker(sample_rate=SAMPLE_RATE, output=self.output, synthesis_workers=1)
+        self.scheduler = self.speaker._scheduler
+        self.addCleanup(self.speaker.stop_wait)
+
+    def assert_stops_promptly(self):
+        started = time.monotonic()
+        self.speaker.stop_wait()
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertFalse(self.speaker.is_running())
+
+    def test_stop_wait_with_empty_queues(self):
+        self.speaker.start()
+        self.assertTrue(self.speaker.is_running())
+        self.assert_stops_promptly()
+
+    def test_stop_wait_with_queued_text_and_audio(self):
+        self.speaker.start()
+        for i in range(5):
+            self.speaker.add_text(f"Sentence {i}.")
+        self.assertTrue(self.scheduler.wait_in_flight(1))
+        self.scheduler.finish(seconds=5.0)  # played in real time, still buffered when stopping
+        self.assertTrue(self.scheduler.wait_in_flight(1))
+        self.assert_stops_promptly()
+
+    def test_stop_wait_while_the_output_buffer_is_full(self):
+        self.output = NullOutput(sample_rate=SAMPLE_RATE, blocksize=256, buffer_seconds=0.5)
+        self.speaker._output = self.output
+        self.speaker.start()
+        self.speaker.add_text("A long sentence.")
+        self.assertTrue(self.scheduler.wait_in_flight(1))
+        self.scheduler.finish(seconds=5.0)  # the playback thread blocks in write()
+        self.assertTrue(wait_until(lambda: len(self.output._buffer) == self.output._buffer.capacity))
+        self.assert_stops_promptly()
+
+    def test_stop_wait_shuts_the_scheduler_down_and_start_creates_a_new_one(self):
+        self.speaker.start()
+        self.speaker.stop_wait()
+        self.assertTrue(self.scheduler.shut_down)
+
+        self.speaker.start()
+        self.assertIsNot(self.speaker._scheduler, self.scheduler)
+        self.speaker.add_text("Once more.")
+        self.assertTrue(self.speaker._scheduler.wait_in_flight(1))
+        self.assertEqual(self.scheduler.submitted, [])
+
+    def test_clear_mid_stream_resets_the_pending_counts(self):
+        self.speaker.start()
+        for i in range(5):
+            self.speaker.add_text(f"Sentence {i}.")
+        self.assertTrue(self.scheduler.wait_in_flight(1))
+        self.scheduler.finish(seconds=5.0)
+        self.assertTrue(self.scheduler.wait_in_flight(1))
+        # The processing thread waits with the third text for a free worker
+        self.assertTrue(wait_until(lambda: self.speaker.stats()["text_queue"] == 2))
+        self.assertTrue(wait_until(lambda: self.speaker.stats()["buffered_ms"] > 0))
+        self.assertEqual(self.speaker.stats()["texts_in_flight"], 1)
+
+        self.speaker.clear()
+        stats = self.speaker.stats()
+        self.assertEqual(stats["text_queue"], 0)
+        self.assertEqual(stats["audio_queue"], 0)
+        self.assertEqual(stats["buffered_ms"], 0.0)
+
+        # The dropped text in flight finishes without audio and frees the worker, the waiting text is dropped
+        self.scheduler.finish(seconds=1.0)
+        self.assertTrue(self.scheduler.wait_in_flight(0))
+        time.sleep(0.05)
+        self.assertEqual(self.scheduler.pending(), 0)
+        self.assertEqual(self.speaker.stats()["buffered_ms"], 0.0)
+        self.assertEqual(self.scheduler.submitted, ["Sentence 0.", "Sentence 1."])
+
+        # The speaker keeps working after clear()
+        self.speaker.add_text("After the clear.")
+        self.assertTrue(self.scheduler.wait_in_flight(1))
+        self.assertEqual(self.scheduler.submitted[-1], "After the clear.")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,199 @@
+import threading
+import time
+import unittest
+
+from unittest import mock
+
+import numpy as np
+
+import synthesis_scheduler
+from synthesis_scheduler import SynthesisScheduler, _Reorderer
+
+END = "END"
+SAMPLE_RATE = 4
+
+
+class GatedPipeline:
+    """Stub KPipeline: the text is a number, it yields [n, n] right away and [n + 0.5, n + 0.5] once the
+    gate of the text is opened, so the test decides in which order the texts finish."""
+
+    def __init__(self, gates: dict[str, threading.Event]):
+        self._gates = gates
+
+    def __call__(self, text, voice=None):
+        if text == "fail":
+            raise RuntimeError("synthesis failed")
+        yield None, None, np.full(2, float(text))
+        yield None, None, None  # chunks without audio are skipped
+        self._gates[text].wait(2.0)
+        yield None, None, np.full(2, float(text) + 0.5)
+
+
+def wait_until(condition, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestSynthesisScheduler(unittest.TestCase):
+    def setUp(self):
+        self.gates = {str(n): threading.Event() for n in range(1, 6)}
+        self.played = []
+        self.errors = []
+        self.scheduler = SynthesisScheduler(
+            on_audio=lambda audio: self.played.append(float(audio[0])), on_end=lambda: self.played.append(END),
+            workers=3, sample_rate=SAMPLE_RATE, pipeline_factory=lambda: GatedPipeline(self.gates),
+            error_handler=self.errors.append,
+        )
+        self.scheduler.warm_up()
+        self.addCleanup(self.scheduler.shutdown)
+        self.addCleanup(self.open_gates)
+
+    def open_gates(self, *texts):
+        for text in texts or self.gates:
+            self.gates[text].set()
+
+    def wait_idle(self):
+        self.assertTrue(wait_until(lambda: self.scheduler.pending() == 0))
+
+    def test_audio_comes_out_in_submission_order(self):
+        for text in ("1", "2", "3"):
+            self.assertTrue(self.scheduler.submit(text))
+        # The first text is passed on while it is synthesized, the others are held back
+        self.assertTrue(wait_until(lambda: self.played == [1.0]))
+        self.open_gates("3")
+        self.open_gates("2")
+        self.assertTrue(wait_until(lambda: self.scheduler.pending() == 1))
+        self.assertEqual(self.played, [1.0])
+        self.open_gates("1")
+        self.wait_idle()
+        self.assertEqual(self.played, [1.0, 1.5, END, 2.0, 2.5, END, 3.0, 3.5, END])
+
+    def test_clear_drops_the_audio_of_the_older_generation(self):
+        self.scheduler.submit("1")
+        self.scheduler.submit("2")
+        self.assertTrue(wait_until(lambda: self.played == [1.0]))
+        self.scheduler.clear()
+        self.scheduler.submit("3")
+        self.open_gates()
+        self.wait_idle()
+        self.assertEqual(self.played, [1.0, 3.0, 3.5, END])
+
+    def test_submit_audio_keeps_its_place(self):
+        self.scheduler.submit("1")
+        self.scheduler.submit_audio(np.full(2, 9.0))
+        self.scheduler.submit("2")
+        self.open_gates("2")
+        self.assertTrue(wait_until(lambda: self.scheduler.pending() == 1))
+        self.assertEqual(self.played, [1.0])
+        self.open_gates("1")
+        self.wait_idle()
+        self.assertEqual(self.played, [1.0, 1.5, END, 9.0, END, 2.0, 2.5, END])
+
+    def test_failed_text_is_skipped(self):
+        self.scheduler.submit("fail")
+        self.scheduler.submit("1")
+        self.open_gates()
+        self.wait_idle()
+        self.assertEqual(self.played, [END, 1.0, 1.5, END])
+        self.assertEqual([str(e) for e in self.errors], ["synthesis failed"])
+
+    def test_on_complete_gets_all_chunks(self):
+        completed = []
+        self.scheduler.submit("1", on_complete=completed.append)
+        self.open_gates()
+        self.wait_idle()
+        self.assertEqual([[float(chunk[0]) for chunk in chunks] for chunks in completed], [[1.0, 1.5]])
+
+    def test_submit_gives_up_when_cancelled_while_all_workers_are_busy(self):
+        for text in ("1", "2", "3"):
+            self.scheduler.submit(text)
+        cancelled = threading.Event()
+
+        def cancel():
+            cancelled.set()
+            self.scheduler.cancel_waiting()
+
+        threading.Timer(0.05, cancel).start()
+        started = time.perf_counter()
+        self.assertFalse(self.scheduler.submit("4", cancelled=cancelled))
+        self.assertLess(time.perf_counter() - started, 0.09)  # woken right away, no polling
+        self.assertEqual(self.scheduler.pending(), 3)
+
+    def test_waiting_submit_gets_the_freed_worker(self):
+        for text in ("1", "2", "3"):
+            self.scheduler.submit(text)
+        threading.Timer(0.05, self.open_gates, args=("2",)).start()
+        self.assertTrue(self.scheduler.submit("4"))
+        self.assertEqual(self.scheduler.pending(), 3)
+
+    def test_stats(self):
+        stats = self.scheduler.stats()
+        self.assertEqual(stats["workers"], 3)
+        self.assertEqual(stats["texts"], 0)
+        self.assertIsNone(stats["real_time_factor"])
+
+        self.scheduler.submit("1")
+        self.scheduler.submit("2")
+        self.assertEqual(self.scheduler.stats()["texts_in_flight"], 2)
+        self.scheduler.submit_audio(np.full(2, 9.0))  # no synthesis, not counted
+        time.sleep(0.05)
+        self.open_gates()
+        self.wait_idle()
+
+        stats = self.scheduler.stats()
+        self.assertEqual(stats["texts"], 2)
+        self.assertEqual(stats["texts_in_flight"], 0)
+        self.assertEqual(stats["audio_seconds"], 2.0)  # 2 texts with 4 samples at 4 Hz
+        self.assertGreaterEqual(stats["synthesis_seconds"], 0.1)  # both texts took at least 0.05 s
+        self.assertGreaterEqual(stats["real_time_factor"], 0.025)  # at least 0.05 s busy for 2 s audio
+        self.assertGreaterEqual(stats["worker_real_time_factor"], stats["real_time_factor"])
+
+
+class TestTorchThreads(unittest.TestCase):
+    def test_thread_workers_share_one_process_wide_setting(self):
+        with mock.patch.object(synthesis_scheduler, "_set_torch_threads") as set_torch_threads:
+            scheduler = SynthesisScheduler(on_audio=lambda audio: None, workers=3, torch_threads=2,
+                                           pipeline_factory=lambda: None)
+            scheduler.warm_up()
+            scheduler.shutdown()
+        # Set once for the process, the workers don't change it
+        calls = set_torch_threads.call_args_list
+        self.assertEqual(calls[0], mock.call(2))
+        self.assertGreaterEqual(len(calls), 2)
+        self.assertEqual(calls[1:], [mock.call(None)] * (len(calls) - 1))
+
+
+class TestReorderer(unittest.TestCase):
+    def setUp(self):
+        self.played = []
+        self.reorderer = _Reorderer(on_audio=self.played.append, on_end=lambda: self.played.append(END))
+
+    def test_later_texts_are_held_until_the_earlier_ones_end(self):
+        self.reorderer.audio(0, 2, "c")
+        self.reorderer.end(0, 2)
+        self.reorderer.audio(0, 1, "b1")
+        self.reorderer.audio(0, 0, "a")
+        self.reorderer.audio(0, 1, "b2")
+        self.assertEqual(self.played, ["a"])
+        self.reorderer.end(0, 0)
+        self.assertEqual(self.played, ["a", END, "b1", "b2"])
+        self.reorderer.end(0, 1)
+        self.assertEqual(self.played, ["a", END, "b1", "b2", END, "c", END])
+
+    def test_clear_ignores_the_older_generation(self):
+        self.reorderer.audio(0, 1, "old")
+        generation = self.reorderer.clear()
+        self.reorderer.restart_at(2)
+        self.reorderer.audio(0, 0, "old")
+        self.reorderer.end(0, 0)
+        self.reorderer.audio(generation, 2, "new")
+        self.reorderer.end(generation, 2)
+        self.assertEqual(self.played, ["new", END])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,282 @@
+"""
+Gapless audio output for the speaker.
+
+sd.play()/sd.wait() opens and closes an output stream for every snippet, which leaves a short silence between
+the snippets. AudioOutput keeps one output running instead: the speaker writes its snippets into a
+preallocated ring buffer of float32 samples and the output callback takes fixed blocks from it, so one
+snippet follows the next without a gap.
+
+If the buffer runs dry while more audio is on its way (synthesis is slower than playback) the callback
+plays silence, this is counted as an underrun. finish() tells the output that nothing more is coming, then
+an empty buffer is just the end of the speech.
+
+Outputs:
+- DeviceOutput: a long-lived sounddevice.OutputStream.
+- NullOutput: plays to nowhere in real time, for tests and machines without an audio device.
+- WaveOutput: like NullOutput, but writes everything played (including underrun silence) to a wav file.
+"""
+
+import threading
+import time
+import wave
+
+from abc import ABC, abstractmethod
+from collections import deque
+
+import numpy as np
+
+# Number of recent underruns kept for stats()
+UNDERRUN_HISTORY = 200
+
+
+class RingBuffer:
+    """Fixed size FIFO of float32 samples, one writer and one reader thread."""
+
+    def __init__(self, capacity: int):
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self._start = 0
+        self._size = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    @property
+    def capacity(self) -> int:
+        return len(self._data)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def write(self, samples: np.ndarray, cancelled: threading.Event = None) -> int:
+        """Append samples, blocks while the buffer is full. Returns the number of samples written,
+        less than all of them if cancelled was set meanwhile."""
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+        written = 0
+        with self._changed:
+            while written < len(samples):
+                while self._size == self.capacity:
+                    if cancelled is not None and cancelled.is_set():
+                        return written
+                    self._changed.wait(0.1)
+                if cancelled is not None and cancelled.is_set():
+                    return written
+                end = (self._start + self._size) % self.capacity
+                count = min(len(samples) - written, self.capacity - self._size, self.capacity - end)
+                self._data[end:end + count] = samples[written:written + count]
+                self._size += count
+                written += count
+        return written
+
+    def read_into(self, out: np.ndarray) -> int:
+        """Move up to len(out) samples into out, returns how many. Never blocks (audio callback)."""
+        with self._lock:
+            count = min(len(out), self._size)
+            first = min(count, self.capacity - self._start)
+            out[:first] = self._data[self._start:self._start + first]
+            out[first:count] = self._data[:count - first]
+            self._start = (self._start + count) % self.capacity
+            self._size -= count
+            self._changed.notify_all()
+            return count
+
+    def clear(self) -> None:
+        with self._changed:
+            self._start = 0
+            self._size = 0
+            self._changed.notify_all()
+
+    def wait_empty(self, timeout: float = None) -> bool:
+        with self._changed:
+            return self._changed.wait_for(lambda: self._size == 0, timeout)
+
+
+class AudioOutput(ABC):
+    """Plays written audio without gaps. Subclasses drive _render() with fixed blocks of frames."""
+
+    def __init__(self, sample_rate: int = 24000, blocksize: int = 1024, buffer_seconds: float = 10.0):
+        """
+        Args:
+            sample_rate: Sampling rate of the written audio in Hz.
+            blocksize: Frames played per callback, 1024 frames are ~43 ms at 24 kHz.
+            buffer_seconds: Audio the ring buffer holds, write() blocks when it is full.
+        """
+        self.sample_rate = sample_rate
+        self.blocksize = blocksize
+        self._buffer = RingBuffer(int(sample_rate * buffer_seconds))
+        self._cancel = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._expecting = False  # more audio is on its way, running dry is an underrun
+        self._underrun_frames = 0  # silence of the current underrun
+        self._underruns = deque(maxlen=UNDERRUN_HISTORY)
+        self._underrun_count = 0
+        self._frames_written = 0
+        self._frames_played = 0
+        self._device_underflows = 0
+
+    def write(self, audio: np.ndarray) -> None:
+        """Queue audio for playback, blocks while the buffer is full."""
+        self._expecting = True
+        written = self._buffer.write(audio, cancelled=self._cancel)
+        with self._stats_lock:
+            self._frames_written += written
+
+    def finish(self) -> None:
+        """Nothing more is coming for now, an empty buffer is no underrun."""
+        self._expecting = False
+
+    def clear(self) -> None:
+        """Drop the audio that is not played yet."""
+        self._expecting = False
+        self._buffer.clear()
+
+    def wait_done(self, timeout: float = None) -> bool:
+        """Block until everything written has been played."""
+        return self._buffer.wait_empty(timeout)
+
+    def start(self) -> None:
+        self._cancel.clear()
+        self._open()
+
+    def stop(self) -> None:
+        """Drop the pending audio, release a blocked write() and close the output."""
+        self._cancel.set()
+        self.clear()
+        self._close()
+
+    @abstractmethod
+    def _open(self) -> None:
+        """Start calling _render(), from start()."""
+
+    @abstractmethod
+    def _close(self) -> None:
+        """Stop calling _render() and release the output, from stop()."""
+
+    def _render(self, out: np.ndarray) -> int:
+        """Fill the 1-D block out (from the audio callback), returns the number of frames with audio."""
+        count = self._buffer.read_into(out)
+        out[count:] = 0.0
+        with self._stats_lock:
+            self._frames_played += count
+            if count < len(out) and self._expecting:
+                if self._underrun_frames == 0:
+                    self._underrun_count += 1
+                self._underrun_frames += len(out) - count
+            elif self._underrun_frames:
+                self._underruns.append(self._underrun_frames)
+                self._underrun_frames = 0
+        return count
+
+    def stats(self) -> dict:
+        """Buffered audio, frames written/played and the underruns (silence while audio was expected)."""
+        with self._stats_lock:
+            underruns = list(self._underruns) + ([self._underrun_frames] if self._underrun_frames else [])
+            return {
+                "buffered_ms": round(1000 * len(self._buffer) / self.sample_rate, 1),
+                "frames_written": self._frames_written,
+                "frames_played": self._frames_played,
+                "underruns": self._underrun_count,
+                "underrun_mean_ms": round(1000 * sum(underruns) / len(underruns) / self.sample_rate, 1)
+                if underruns else None,
+                "underrun_max_ms": round(1000 * max(underruns) / self.sample_rate, 1) if underruns else None,
+                "device_underflows": self._device_underflows,
+            }
+
+
+class DeviceOutput(AudioOutput):
+    """Plays through one long-lived sounddevice output stream."""
+
+    def __init__(self, sample_rate: int = 24000, blocksize: int = 1024, buffer_seconds: float = 10.0,
+                 device=None, latency="low"):
+        super().__init__(sample_rate, blocksize, buffer_seconds)
+        self.device = device
+        self.latency = latency
+        self._stream = None
+
+    def _callback(self, outdata, frames, time_info, status):
+        if status.output_underflow:
+            self._device_underflows += 1
+        self._render(outdata[:, 0])
+
+    def _open(self) -> None:
+        if self._stream is not None:
+            return
+        import sounddevice as sd
+
+        self._stream = sd.OutputStream(samplerate=self.sample_rate, blocksize=self.blocksize, channels=1,
+                                       dtype="float32", device=self.device, latency=self.latency,
+                                       callback=self._callback)
+        self._stream.start()
+
+    def _close(self) -> None:
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+
+class NullOutput(AudioOutput):
+    """Consumes the audio in real time (or as fast as possible) without an audio device."""
+
+    def __init__(self, sample_rate: int = 24000, blocksize: int = 1024, buffer_seconds: float = 10.0,
+                 realtime: bool = True):
+        super().__init__(sample_rate, blocksize, buffer_seconds)
+        self.realtime = realtime
+        self._thread = None
+        self._running = threading.Event()
+
+    def _run(self) -> None:
+        block = np.zeros(self.blocksize, dtype=np.float32)
+        block_seconds = self.blocksize / self.sample_rate
+        next_block = time.perf_counter()
+        while self._running.is_set():
+            expecting = self._expecting or len(self._buffer) > 0
+            count = self._render(block)
+            if count or expecting:
+                self._sink(block)
+            if self.realtime:
+                next_block += block_seconds
+                time.sleep(max(0.0, next_block - time.perf_counter()))
+                next_block = max(next_block, time.perf_counter() - block_seconds)  # don't catch up after a stall
+            elif not count:
+                time.sleep(0.001)
+
+    def _sink(self, block: np.ndarray) -> None:
+        pass
+
+    def _open(self) -> None:
+        if self._thread is not None:
+            return
+        self._running.set()
+        self._thread = threading.Thread(target=self._run, name="audio-output", daemon=True)
+        self._thread.start()
+
+    def _close(self) -> None:
+        if self._thread is not None:
+            self._running.clear()
+            self._thread.join()
+            self._thread = None
+
+
+class WaveOutput(NullOutput):
+    """Writes the played audio as 16 bit mono wav file, with the silence of the underruns."""
+
+    def __init__(self, path: str, sample_rate: int = 24000, blocksize: int = 1024, buffer_seconds: float = 10.0,
+                 realtime: bool = True):
+        super().__init__(sample_rate, blocksize, buffer_seconds, realtime)
+        self.path = path
+        self._wave = None
+
+    def _sink(self, block: np.ndarray) -> None:
+        self._wave.writeframes((np.clip(block, -1.0, 1.0) * 32767).astype("<i2").tobytes())
+
+    def _open(self) -> None:
+        if self._wave is None:
+            self._wave = wave.open(str(self.path), "wb")
+            self._wave.setnchannels(1)
+            self._wave.setsampwidth(2)
+            self._wave.setframerate(self.sample_rate)
+        super()._open()
+
+    def _close(self) -> None:
+        super()._close()
+        if self._wave is not None:
+            self._wave.close()
+            self._wave = None
@@ -1,18 +1,25 @@
 """Text-to-speech speaker utilities using Kokoro TTS and sounddevice playback.
 
 Provides an interactive voice selector and a Speaker class that synthesizes text
-to audio in a background thread and plays it through the system audio device.
+to audio in a background thread and plays it gapless through one long-lived
+audio output (see audio_output.py).
 """
 
-import time
-import sounddevice as sd
+from functools import partial
+from queue import Empty, Queue
+from threading import Event, Lock, Thread
 
-from queue import Queue
-from threading import Thread
+import numpy as np
 
+from audio_cache import AudioCache, kokoro_revision
+from audio_output import AudioOutput, DeviceOutput
 from helpers import CONSOLE
+from synthesis_scheduler import SynthesisScheduler, create_kokoro_pipeline
 
-from kokoro import KPipeline
+# Put on the text queue to end the workers, the processing thread hands it on to the playback thread
+_STOP = object()
+# Put on the audio queue after the audio of every text
+_END_OF_TEXT = object()
 
 # Voice selection mapping: human-friendly labels -> technical voice IDs
 VOICE_LABEL_TO_ID = {
@@ -49,109 +56,199 @@ def select_speaker_voice():
 class MultiSpeaker:
     """Background text-to-speech synthesizer and audio player.
 
-    Uses Kokoro's KPipeline to synthesize audio from text on a worker thread and
-    plays buffered audio with sounddevice. Text items are enqueued and rendered
-    in order, allowing non-blocking generation and playback.
+    Uses Kokoro's KPipeline to synthesize audio from text on parallel workers
+    (see synthesis_scheduler.py) and writes the audio to an AudioOutput that
+    plays it without gaps. Text items are enqueued and played in order, allowing
+    non-blocking generation and playback. The threads block on their queues, so
+    a hand-off costs no polling delay and an idle speaker uses no CPU.
     """
 
     # Best Voices:
     # af_heart, af_bella, af_nicole, bf_emma
     # am_fenrir, am_michael, am_puck
     # jf_alpha, hf_alpha
-    def __init__(self, lang_code="b", sample_rate=24000):
+    def __init__(self, lang_code="b", sample_rate=24000, output:AudioOutput=None,
+                 synthesis_workers=2, torch_threads=None, use_processes=False, cache:AudioCache=None):
         """Initialize the speaker with the chosen voice, language, and sample rate.
 
         Args:
             lang_code: Language code passed to KPipeline (e.g., 'b').
             sample_rate: Output sampling rate in Hz for playback.
+            output: Where the audio is played, default is the system audio device.
+            synthesis_workers: Number of KPipelines synthesizing the next texts in parallel.
+            torch_threads: PyTorch threads, shared by all workers (per worker with use_processes). None keeps
+                the PyTorch default.
+            use_processes: Synthesize in worker processes instead of threads.
+            cache: Audio cache, repeated texts are played from it without synthesis.
         """
         self._sample_rate = sample_rate
+        self._lang_code = lang_code
+        self._cache = cache
+        self._model_revision = kokoro_revision()
+        self._output = output if output is not None else DeviceOutput(sample_rate=sample_rate)
 
         # Queues
         self._text_queue = Queue()      # (message, speaker_id)
         self._audio_queue = Queue()
 
-        # TTS pipeline
-        self._pipeline = KPipeline(lang_code=lang_code, repo_id='hexgrad/Kokoro-82M')
+        # TTS pipelines, the audio comes out in the order of the texts. stop_wait() shuts the workers down,
+        # start() creates new ones then.
+        self._create_scheduler = partial(
+            SynthesisScheduler,
+            on_audio=self._audio_queue.put,
+            on_end=lambda: self._audio_queue.put(_END_OF_TEXT),
+            workers=synthesis_workers,
+            torch_threads=torch_threads,
+            use_processes=use_processes,
+            sample_rate=sample_rate,
+            pipeline_factory=partial(create_kokoro_pipeline, lang_code),
+            error_handler=lambda e: CONSOLE.print(f"[red]Error on audio synthesis {e}[/red]"),
+        )
+        self._scheduler = self._create_scheduler()
+        self._scheduler.warm_up()
+        self._scheduler_shut_down = False
 
         # Threading
-        self._stop_processing_thread = False
-        self._stop_play_thread = False
+        self._stop_event = Event()
+        # Set and replaced by clear(), drops a text that is still waiting for a synthesis worker
+        self._cleared = Event()
 
         self._play_thread = None
         self._processing_thread = None
 
-    def _get_pipeline(self, message:str, speaker_id:str) -> KPipeline:
-        return self._pipeline(message, voice=speaker_id)
+        # Instrumentation, see stats()
+        self._stats_lock = Lock()
+        self._snippets_played = 0
 
     def _process(self):
-        """Worker loop: consume text queue, synthesize audio, and enqueue audio chunks."""
-        while not self._stop_processing_thread:
-            if self._text_queue.empty():
-                time.sleep(0.05)
+        """Worker loop: hand the texts of the text queue to the synthesis workers."""
+        while True:
+            item = self._text_queue.get()
+            if item is _STOP:
+                self._audio_queue.put(_STOP)
+                return
+            cleared = self._cleared
+            if self._stop_event.is_set():
                 continue
-            (message, speaker_id) = self._text_queue.get()
+            (message, speaker_id) = item
+            self._synthesize(message, speaker_id, cleared)
 
-            try:
-                generator = self._get_pipeline(message, speaker_id)
-                for i, (gs, ps, audio) in enumerate(generator):
-                    self._audio_queue.put(audio)
-            except Exception as e:
-                CONSOLE.print(f"[red]Error on audio synthesis {e}[/red]")
+    def _synthesize(self, text:str, voice:str, cancelled:Event):
+        """Play text from the cache, or hand it to the synthesis workers (and cache the result)."""
+        if self._cache is None:
+            self._scheduler.submit(text, voice=voice, cancelled=cancelled)
+            return
+
+        key = AudioCache.key(text, voice, self._lang_code, self._model_revision)
+        audio = self._cache.get(key)
+        if audio is not None:
+            self._scheduler.submit_audio(audio)
+            return
+
+        def store(chunks):
+            if chunks:
+                self._cache.put(key, np.concatenate(chunks))
+        self._scheduler.submit(text, voice=voice, cancelled=cancelled, on_complete=store)
 
     def _play(self):
-        """Worker loop: consume audio queue and play audio snippets sequentially."""
-        while not self._stop_play_thread:
-            if self._audio_queue.empty():
-                time.sleep(0.05)
-                continue
+        """Worker loop: consume audio queue and write the audio snippets to the output."""
+        while True:
             audio_snippet = self._audio_queue.get()
+            if audio_snippet is _STOP:
+                return
+            if self._stop_event.is_set():
+                continue
 
+            if audio_snippet is _END_OF_TEXT:
+                # An empty output buffer is only an underrun if there is something left to say
+                if not self._scheduler.pending() and self._text_queue.empty() and self._audio_queue.empty():
+                    self._output.finish()
+                continue
             try:
-                sd.play(audio_snippet, self._sample_rate)
-                sd.wait()
+                self._output.write(audio_snippet)
             except Exception as e:
                 CONSOLE.print(f"[red]Error on audio playing {e}[/red]")
+            with self._stats_lock:
+                self._snippets_played += 1
 
     def add_text(self, message:str, speaker_id:str=None):
         """Enqueue a text message for synthesis and playback."""
         self._text_queue.put((message, speaker_id))
 
+    def clear(self):
+        """Drop all text and audio that is queued or buffered but not played yet."""
+        self._cleared.set()
+        self._cleared = Event()
+        self._scheduler.clear()
+        for queue in (self._text_queue, self._audio_queue):
+            while True:
+                try:
+                    item = queue.get_nowait()
+                except Empty:
+                    break
+                if item is _STOP:  # a stop is in progress, keep it
+                    queue.put(_STOP)
+                    break
+        self._output.clear()
+
     def start(self):
         """Start the processing and playback worker threads if not already running."""
-        self._stop_processing_thread = False
-        self._stop_play_thread = False
-
         if self.is_running():
             return
 
+        if self._scheduler_shut_down:
+            self._scheduler = self._create_scheduler()
+            self._scheduler.warm_up()
+            self._scheduler_shut_down = False
+        self._stop_event.clear()
+        self._output.start()
         self._processing_thread = Thread(target=self._process, daemon=True)
         self._play_thread = Thread(target=self._play, daemon=True)
-
-        if not self._processing_thread.is_alive():
-            self._processing_thread.start()
-
-        if not self._play_thread.is_alive():
-            self._play_thread.start()
+        self._processing_thread.start()
+        self._play_thread.start()
 
     def stop(self):
-        """Signal both worker threads to stop on their next loop iteration."""
-        self._stop_processing_thread = True
-        self._stop_play_thread = True
-
-    def stop_wait(self):
-        """Stop the worker threads and block until they have fully terminated."""
+        """Drop the queued text and audio, close the output and let both worker threads end."""
         if not self.is_running():
             return
 
+        self._stop_event.set()
+        self.clear()
+        # The sentinel passes through the processing thread to the playback thread
+        self._text_queue.put(_STOP)
+        try:
+            self._output.stop()
+        except Exception as e:
+            CONSOLE.print(f"[red]Error on audio stop {e}[/red]")
+
+    def stop_wait(self):
+        """Stop the worker threads, block until they have terminated and shut the synthesis workers down."""
         self.stop()
         if self._processing_thread is not None:
             self._processing_thread.join()
         if self._play_thread is not None:
             self._play_thread.join()
+        self._scheduler.shutdown()
+        self._scheduler_shut_down = True
 
     def is_running(self):
         """Return True if either the processing or playback worker thread is active."""
         processing_is_running = None is not self._processing_thread and self._processing_thread.is_alive()
         play_is_running = None is not self._play_thread and self._play_thread.is_alive()
         return processing_is_running or play_is_running
+
+    def stats(self) -> dict:
+        """Queue depths, synthesis real-time factor and the underruns of the output.
+
+        A real-time factor below 1 means synthesis is faster than playback, see SynthesisScheduler.stats().
+        An underrun is silence while more audio was still on its way, see AudioOutput.stats().
+        """
+        with self._stats_lock:
+            stats = {
+                "text_queue": self._text_queue.qsize(),
+                "audio_queue": self._audio_queue.qsize(),
+                "snippets_played": self._snippets_played,
+            }
+        if self._cache is not None:
+            stats |= self._cache.stats()
+        return stats | self._scheduler.stats() | self._output.stats()
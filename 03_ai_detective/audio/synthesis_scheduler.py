@@ -0,0 +1,273 @@
+"""
+Parallel TTS synthesis with ordered results.
+
+A single KPipeline synthesizes one text after the other. If a sentence takes longer to synthesize than the
+previous one takes to play, playback stalls. SynthesisScheduler runs several KPipeline workers in parallel
+and hands their audio on in the order the texts were submitted:
+
+- every text gets a sequence number, the workers synthesize the next texts while the current one plays,
+- audio of the text that is played next is passed on right away chunk by chunk, audio of later texts is
+  held back until all texts before it are done,
+- workers are threads (default, PyTorch releases the GIL while it computes) or processes. Each worker
+  has its own pipeline. The PyTorch thread count is process-wide: thread workers share torch_threads
+  threads, every process worker gets its own torch_threads (workers * torch_threads should match the cores).
+
+Process workers only return the audio of a text once it is complete. They are started with the default
+multiprocessing start method, with "spawn" the main module must be importable without side effects.
+
+    scheduler = SynthesisScheduler(on_audio=audio_queue.put, on_end=lambda: audio_queue.put(END), workers=3)
+    scheduler.submit("Once upon a time.", voice="bf_emma")
+"""
+
+import threading
+import time
+
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable
+
+import numpy as np
+
+# Pipeline of the current worker thread/process
+_worker = threading.local()
+
+
+def create_kokoro_pipeline(lang_code: str = "b", repo_id: str = "hexgrad/Kokoro-82M"):
+    from kokoro import KPipeline
+
+    return KPipeline(lang_code=lang_code, repo_id=repo_id)
+
+
+def _set_torch_threads(torch_threads: int | None) -> None:
+    """Set the PyTorch threads of this process (torch.set_num_threads is process-wide)."""
+    if torch_threads:
+        import torch
+
+        torch.set_num_threads(torch_threads)
+
+
+def _init_worker(pipeline_factory: Callable, torch_threads: int | None) -> None:
+    _set_torch_threads(torch_threads)
+    _worker.pipeline = pipeline_factory()
+
+
+def _ready() -> bool:
+    return _worker.pipeline is not None
+
+
+def _synthesize(text: str, voice: str | None, on_audio: Callable[[np.ndarray], None] = None) -> list[np.ndarray]:
+    """Synthesize text with the pipeline of this worker. Hands every chunk to on_audio, or returns them."""
+    chunks = []
+    for gs, ps, audio in _worker.pipeline(text, voice=voice):
+        if audio is None:
+            continue
+        audio = np.asarray(audio, dtype=np.float32)
+        if on_audio is not None:
+            on_audio(audio)
+        else:
+            chunks.append(audio)
+    return chunks
+
+
+class _Reorderer:
+    """Passes the audio of numbered texts on in order of their numbers."""
+
+    def __init__(self, on_audio: Callable[[np.ndarray], None], on_end: Callable[[], None]):
+        self._on_audio = on_audio
+        self._on_end = on_end
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._next = 0
+        self._held: dict[int, list[np.ndarray]] = {}
+        self._done: set[int] = set()
+
+    def audio(self, generation: int, sequence: int, audio: np.ndarray) -> None:
+        with self._lock:
+            if generation != self._generation:
+                return  # cleared meanwhile
+            if sequence == self._next:
+                self._on_audio(audio)
+            else:
+                self._held.setdefault(sequence, []).append(audio)
+
+    def end(self, generation: int, sequence: int) -> None:
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._done.add(sequence)
+            while self._next in self._done:
+                self._done.remove(self._next)
+                self._on_end()
+                self._next += 1
+                # The next text is played now, pass on what it has so far
+                for audio in self._held.pop(self._next, []):
+                    self._on_audio(audio)
+
+    def clear(self) -> int:
+        """Forget all texts, audio of running syntheses is dropped. Returns the new generation."""
+        with self._lock:
+            self._generation += 1
+            self._held.clear()
+            self._done.clear()
+            return self._generation
+
+    def restart_at(self, sequence: int) -> None:
+        with self._lock:
+            self._next = sequence
+
+
+class SynthesisScheduler:
+    """Synthesize texts on several workers, audio comes out in submission order."""
+
+    def __init__(self, on_audio: Callable[[np.ndarray], None], on_end: Callable[[], None] = lambda: None,
+                 workers: int = 2, torch_threads: int | None = None, use_processes: bool = False,
+                 sample_rate: int = 24000, pipeline_factory: Callable = None, error_handler: Callable = None):
+        """
+        Args:
+            on_audio: Called with every audio chunk, in order.
+            on_end: Called after the last chunk of every text, in order.
+            workers: Number of pipelines synthesizing in parallel.
+            torch_threads: PyTorch threads per worker process, with thread workers all workers share this
+                many threads (the setting is process-wide). None keeps the PyTorch default.
+            use_processes: Run the workers in processes instead of threads.
+            sample_rate: Sampling rate of the audio, for the real-time factor.
+            pipeline_factory: Creates the pipeline of a worker, must be picklable with use_processes.
+            error_handler: Called with the exception of a failed synthesis, the text is skipped.
+        """
+        self.workers = workers
+        self.sample_rate = sample_rate
+        self._error_handler = error_handler or (lambda e: None)
+        self._reorderer = _Reorderer(on_audio, on_end)
+        self._use_processes = use_processes
+        pipeline_factory = pipeline_factory or create_kokoro_pipeline
+        if use_processes:
+            self._executor: Executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                           initargs=(pipeline_factory, torch_threads))
+        else:
+            _set_torch_threads(torch_threads)
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts",
+                                                initializer=_init_worker, initargs=(pipeline_factory, None))
+        self._lock = threading.Lock()
+        # Not more texts in flight than workers, the rest waits in the queue of the caller (and can be cleared).
+        # Notified when a worker gets free and by cancel_waiting().
+        self._slot_freed = threading.Condition(self._lock)
+        self._free_slots = workers
+        self._generation = 0
+        self._sequence = 0
+        self._in_flight = 0
+        self._busy_since = None
+        # Stats
+        self._texts = 0
+        self._synthesis_seconds = 0.0
+        self._busy_seconds = 0.0
+        self._audio_seconds = 0.0
+
+    def warm_up(self) -> None:
+        """Start all workers and load their pipelines, so the first texts don't wait for it."""
+        futures = [self._executor.submit(_ready) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def submit(self, text: str, voice: str | None = None, cancelled: threading.Event = None,
+               on_complete: Callable[[list[np.ndarray]], None] = None) -> bool:
+        """Start the synthesis of text, blocks while all workers are busy.
+
+        on_complete is called with all audio chunks of text once it was synthesized without error (e.g. to
+        cache them). Returns False (and drops text) if cancelled is set while waiting for a worker, call
+        cancel_waiting() (or clear()) after setting it to wake the waiting call.
+        """
+        is_cancelled = (lambda: False) if cancelled is None else cancelled.is_set
+        with self._slot_freed:
+            self._slot_freed.wait_for(lambda: self._free_slots or is_cancelled())
+            if is_cancelled():
+                return False
+            self._free_slots -= 1
+            generation, sequence = self._generation, self._sequence
+            self._sequence += 1
+            self._in_flight += 1
+            if self._busy_since is None:
+                self._busy_since = time.perf_counter()
+        started = time.perf_counter()
+        audio_seconds = [0.0]
+        chunks = []
+
+        def on_audio(audio):
+            audio_seconds[0] += len(audio) / self.sample_rate
+            if on_complete is not None:
+                chunks.append(audio)
+            self._reorderer.audio(generation, sequence, audio)
+
+        def on_done(future: Future):
+            try:
+                for audio in future.result():  # only process workers return the audio
+                    on_audio(audio)
+                if on_complete is not None:
+                    on_complete(chunks)
+            except Exception as e:
+                self._error_handler(e)
+            self._reorderer.end(generation, sequence)
+            with self._lock:
+                self._texts += 1
+                self._synthesis_seconds += time.perf_counter() - started
+                self._audio_seconds += audio_seconds[0]
+                self._in_flight -= 1
+                if self._in_flight == 0:
+                    self._busy_seconds += time.perf_counter() - self._busy_since
+                    self._busy_since = None
+                self._free_slots += 1
+                self._slot_freed.notify_all()  # all, a woken submit() may give up if it was cancelled
+
+        if self._use_processes:
+            future = self._executor.submit(_synthesize, text, voice)
+        else:
+            future = self._executor.submit(_synthesize, text, voice, on_audio)
+        future.add_done_callback(on_done)
+        return True
+
+    def submit_audio(self, audio: np.ndarray) -> None:
+        """Queue audio that needs no synthesis (e.g. from a cache), it is played in turn with the texts."""
+        with self._lock:
+            generation, sequence = self._generation, self._sequence
+            self._sequence += 1
+        self._reorderer.audio(generation, sequence, audio)
+        self._reorderer.end(generation, sequence)
+
+    def pending(self) -> int:
+        """Number of texts being synthesized."""
+        return self._in_flight
+
+    def cancel_waiting(self) -> None:
+        """Wake the submit() calls waiting for a worker, those whose cancelled event is set return False."""
+        with self._slot_freed:
+            self._slot_freed.notify_all()
+
+    def clear(self) -> None:
+        """Drop the audio of all running syntheses, the next submitted text is the next one played."""
+        with self._lock:
+            self._generation = self._reorderer.clear()
+            self._reorderer.restart_at(self._sequence)
+            self._slot_freed.notify_all()
+
+    def shutdown(self) -> None:
+        self.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        """Synthesis time, audio time and the real-time factor.
+
+        real_time_factor is the wall time with at least one synthesis running per second of audio, below 1
+        the workers together are faster than playback. worker_real_time_factor is the same for one worker.
+        """
+        with self._lock:
+            busy_seconds = self._busy_seconds
+            if self._busy_since is not None:
+                busy_seconds += time.perf_counter() - self._busy_since
+            return {
+                "workers": self.workers,
+                "texts": self._texts,
+                "texts_in_flight": self._in_flight,
+                "synthesis_seconds": round(self._synthesis_seconds, 3),
+                "audio_seconds": round(self._audio_seconds, 3),
+                "real_time_factor": round(busy_seconds / self._audio_seconds, 3) if self._audio_seconds else None,
+                "worker_real_time_factor": round(self._synthesis_seconds / self._audio_seconds, 3)
+                if self._audio_seconds else None,
+            }
@@ -1,5 +1,3 @@
-import os
-
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain_ollama import ChatOllama
 from langgraph.constants import END
@@ -7,17 +5,22 @@ from langgraph.graph import MessagesState, StateGraph
 from langgraph.prebuilt import ToolNode
 
 from agents.agents import Agent, AgentManager
+from ollama_backend import OllamaBackend
 
 MODEL = "gpt-oss:20b"
 
 # We cut the max token count of the chat history to keep it smooth (~150 Book pages)
 CHAT_HISTORY_MAX_TOKEN_COUNT = 8000
 
-# if you want to use Ollama
-base_url = os.getenv('OLLAMA_SERVER_URL', "http://localhost:11434")
-llm = ChatOllama(model=MODEL, base_url=base_url,
+# if you want to use Ollama, OLLAMA_SERVER_URLS="http://gpu1:11434,http://gpu2:11434" spreads the requests over
+# several servers (pooled keep-alive connections, failing servers are skipped for a while)
+ollama_backend = OllamaBackend.from_env()
+if len(ollama_backend.nodes) > 1:
+    ollama_backend.start_health_checks(interval_seconds=10)
+llm = ChatOllama(model=MODEL, base_url=ollama_backend.base_url,
                  num_ctx=round(CHAT_HISTORY_MAX_TOKEN_COUNT * 1.33), num_gpu=999,
                  reasoning="high",
+                 **ollama_backend.client_kwargs(),
                  )
 
 # If you want to use OpenAI compatible apis